@@ -0,0 +1,91 @@
+"""
+アンチアフィニティの係数を、P×Pの密行列で持つ以前の実装とサービスごとの所属Podで持つ
+現在の実装で比較し、tracemallocで計測した最大メモリを表示します。
+
+    python -m benchmarks.anti_affinity
+"""
+
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+import numpy as np
+
+from src.arrays import ClusterArrays
+from src.engines import _greedy
+from src.models import AnealingSettings
+from src.solver import _build_instance_data, _service_members
+
+from .common import generate_cluster
+
+# (pods, nodes, services)
+SIZES = [(1000, 20, 50), (5000, 50, 100), (10000, 100, 200)]
+
+
+def dense_anti_affinity(arrays: ClusterArrays) -> np.ndarray:
+    """
+    以前の antiAffinity (比較用)。同じサービスのPodの組を1とする (P, P) の行列。
+    """
+    service = arrays.pod_service
+    affinity = (
+        (service[:, None] == service[None, :]) & (service[:, None] >= 0)
+    ).astype(float)
+    np.fill_diagonal(affinity, 0.0)
+    return affinity
+
+
+@contextmanager
+def peak(peaks: Dict[str, float], name: str) -> Iterator[None]:
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    yield
+    peaks[name] = (tracemalloc.get_traced_memory()[1] - before) / 2**20
+
+
+def _check_energy(arrays: ClusterArrays, dense: np.ndarray) -> None:
+    # 同じ配置に対して、密行列と所属Podから計算した値が一致すること
+    rng = np.random.default_rng(0)
+    node = rng.integers(arrays.num_nodes, size=arrays.num_pods)
+    x = np.zeros((arrays.num_pods, arrays.num_nodes))
+    x[np.arange(arrays.num_pods), node] = 1.0
+    expected = float(np.einsum("pn,pq,qn->", x, dense, x))
+    count = np.zeros((len(arrays.service_ids), arrays.num_nodes))
+    for s, members in enumerate(_service_members(arrays)):
+        np.add.at(count[s], node[members], 1.0)
+    assert np.isclose((count * (count - 1)).sum(), expected)
+
+
+def main() -> None:
+    settings = AnealingSettings()
+    print(
+        f"{'pods':>6} {'nodes':>5} {'svcs':>5} {'dense MB':>9} {'members MB':>11}"
+        f" {'data MB':>8} {'greedy MB':>10}"
+    )
+    for num_pods, num_nodes, num_services in SIZES:
+        state = generate_cluster(num_pods, num_nodes, num_services)
+        arrays = ClusterArrays.from_state(state)
+        peaks: Dict[str, float] = {}
+
+        tracemalloc.start()
+        try:
+            with peak(peaks, "dense"):
+                dense = dense_anti_affinity(arrays)
+            _check_energy(arrays, dense)
+            del dense
+            with peak(peaks, "members"):
+                _service_members(arrays)
+            with peak(peaks, "data"):
+                data = _build_instance_data(arrays, settings)
+            with peak(peaks, "greedy"):
+                _greedy(data, np.ones((num_pods, arrays.num_nodes), dtype=bool))
+        finally:
+            tracemalloc.stop()
+
+        print(
+            f"{num_pods:>6} {num_nodes:>5} {num_services:>5} {peaks['dense']:>9.1f}"
+            f" {peaks['members']:>11.2f} {peaks['data']:>8.1f} {peaks['greedy']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
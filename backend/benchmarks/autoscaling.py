@@ -0,0 +1,191 @@
+"""
+オートスケーリングの計画 (auto_scale_desired_exsistence) を、サービスごとにPodのリストを
+たどる以前の実装と比較します。以前の実装は O(P^2) のため、小さい規模でのみ計測します。
+
+    python -m benchmarks.autoscaling
+"""
+
+import math
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.models import ClusterState, Node, Pod, ServiceProfile
+from src.scaling import auto_scale_desired_exsistence
+
+from .common import timer
+
+# (services, pods, nodes)
+SIZES = [(100, 400, 20), (1000, 4000, 50), (5000, 20000, 100)]
+# 以前の実装を計測するPod数の上限
+LOOP_MAX_PODS = 4000
+
+
+def make_autoscaling_cluster(
+    num_services: int, num_pods: int, num_nodes: int, seed: int = 0
+) -> ClusterState:
+    """
+    オートスケーリングを有効にしたサービスを持つ合成クラスタを生成します。
+    リクエストレートは、現在のレプリカ数に対して 0.2 から 2.5 倍の範囲でばらつきます。
+    """
+    rng = np.random.default_rng(seed)
+    nodes = [
+        Node(id=f"node{i}", cpu_capacity=64000, mem_capacity=256000)
+        for i in range(num_nodes)
+    ]
+    service = rng.integers(num_services, size=num_pods)
+    current = rng.integers(num_nodes, size=num_pods)
+    pods = [
+        Pod(
+            id=f"pod{i}",
+            cpu_usage=float(rng.integers(100, 1000)),
+            mem_usage=float(rng.integers(128, 4096)),
+            current_node=f"node{current[i]}",
+            service=f"svc{service[i]}",
+        )
+        for i in range(num_pods)
+    ]
+    count = np.bincount(service, minlength=num_services)
+    load = rng.uniform(0.2, 2.5, size=num_services)
+    services = [
+        ServiceProfile(
+            id=f"svc{s}",
+            load_balancer_pod=f"svc{s}-lb",
+            auto_scaling_enabled=True,
+            max_replicas=None if s % 3 else int(count[s]) + 1,
+            current_request_rate=float(load[s] * max(count[s], 1) * 100),
+        )
+        for s in range(num_services)
+    ]
+    return ClusterState(nodes=nodes, pods=pods, services=services)
+
+
+def auto_scale_loop(
+    state: ClusterState,
+) -> tuple[List[Pod], List[float], Dict[str, int]]:
+    """
+    以前の auto_scale_desired_exsistence (比較用)。
+    auto_scaling_enabled のサービスだけを対象にし、スケールインで desire だけが追加されて
+    Podとの並びがずれていた不具合を直したもの。
+    """
+    # Calculate margins
+    total_cpu_capacity = sum(n.cpu_capacity for n in state.nodes)
+    total_mem_capacity = sum(n.mem_capacity for n in state.nodes)
+    current_cpu_usage = sum(p.cpu_usage for p in state.pods)
+    current_mem_usage = sum(p.mem_usage for p in state.pods)
+
+    cpu_margin = 1.0 - (current_cpu_usage / total_cpu_capacity)
+    mem_margin = 1.0 - (current_mem_usage / total_mem_capacity)
+    cluster_margin = (cpu_margin + mem_margin) / 2.0
+
+    # Group pods by service
+    pods_by_service: Dict[str, List[Pod]] = {}
+    for p in state.pods:
+        if p.service:
+            pods_by_service.setdefault(p.service, []).append(p)
+
+    pods: List[Pod] = []
+    desires: List[float] = []
+    replicas: Dict[str, int] = {}
+
+    for service in state.services:
+        if not service.auto_scaling_enabled:
+            continue
+        current_pods: List[Pod] = pods_by_service.get(service.id, [])
+        current_count = len(current_pods)
+
+        cpu_usage_avg = (
+            sum(p.cpu_usage for p in current_pods) / current_count
+            if current_count > 0
+            else 0
+        )
+        mem_usage_avg = (
+            sum(p.mem_usage for p in current_pods) / current_count
+            if current_count > 0
+            else 0
+        )
+
+        needed = math.ceil(
+            service.current_request_rate / service.target_request_rate_per_pod
+        )
+        desired_count = max(needed, service.min_replicas)
+        desired_count = max(desired_count, current_count - 2)
+        desired_count = min(desired_count, current_count + 2)
+        if service.max_replicas is not None:
+            desired_count = min(desired_count, service.max_replicas)
+        replicas[service.id] = desired_count
+
+        if current_count > 0:
+            urgency = min(1.0, max(0.0, (needed - current_count) / current_count))
+        else:
+            urgency = 1.0 if desired_count > 0 else 0.0
+        new_pod_desire = urgency - (1.0 - cluster_margin)
+        new_pod_desire = max(-1.0, min(1.0, new_pod_desire))
+
+        for i, p in enumerate(current_pods):
+            pods.append(p)
+            desires.append(1.0 if i < desired_count else -1.0)
+        for i in range(desired_count - current_count):
+            pods.append(
+                Pod(
+                    id=f"{service.id}-{uuid.uuid4().hex[:6]}",
+                    cpu_usage=cpu_usage_avg,
+                    mem_usage=mem_usage_avg,
+                    service=service.id,
+                    priority=service.priority,
+                )
+            )
+            desires.append(new_pod_desire)
+    for p in state.pods:
+        if p not in pods:
+            pods.append(p)
+            desires.append(0.0)
+
+    return pods, desires, replicas
+
+
+def check_plan(state: ClusterState, loop_result: Optional[tuple] = None) -> None:
+    """
+    auto_scale_desired_exsistence の結果が、以前の実装と一致することを確認します。
+    新規Podのidは乱数のため、サービスごとの desire の並びで比較します。
+    """
+    plan = auto_scale_desired_exsistence(state)
+    pods, desires, replicas = loop_result or auto_scale_loop(state)
+    assert plan.replicas == replicas
+    assert len(plan.pods) == len(plan.desire) == len(plan.optional) == len(pods)
+    assert [p.id for p in plan.pods[: len(state.pods)]] == [p.id for p in state.pods]
+
+    def by_service(pod_list: List[Pod], values: List[float]) -> Dict:
+        grouped: Dict[Optional[str], List[tuple]] = {}
+        for pod, value in zip(pod_list, values):
+            grouped.setdefault(pod.service, []).append(
+                (pod.current_node is None, round(value, 9), round(pod.cpu_usage, 6))
+            )
+        return grouped
+
+    assert by_service(plan.pods, plan.desire.tolist()) == by_service(pods, desires)
+
+
+def main() -> None:
+    print(f"{'svcs':>5} {'pods':>6} {'nodes':>5} {'new':>5} {'loop':>9} {'array':>9}")
+    for num_services, num_pods, num_nodes in SIZES:
+        state = make_autoscaling_cluster(num_services, num_pods, num_nodes)
+        timings: Dict[str, float] = {}
+        loop_result = None
+        if num_pods <= LOOP_MAX_PODS:
+            with timer(timings, "loop"):
+                loop_result = auto_scale_loop(state)
+        with timer(timings, "array"):
+            plan = auto_scale_desired_exsistence(state)
+        if loop_result is not None:
+            check_plan(state, loop_result)
+        loop = f"{timings['loop']:>9.3f}" if "loop" in timings else f"{'-':>9}"
+        print(
+            f"{num_services:>5} {num_pods:>6} {num_nodes:>5}"
+            f" {len(plan.pods) - num_pods:>5} {loop} {timings['array']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+import numpy as np
+
+from src.models import ClusterState, Node, Pod
+
+
+def generate_cluster(
+    num_pods: int,
+    num_nodes: int,
+    num_services: int = 5,
+    seed: int = 0,
+    skew: float = 1.5,
+    failed_node_ratio: float = 0.1,
+    new_pod_ratio: float = 0.1,
+    unaffiliated_ratio: float = 0.1,
+) -> ClusterState:
+    """
+    偏りのある合成クラスタを生成します。
+
+    - Podのサイズは対数正規分布 (skew が大きいほど一部のPodが大きくなる)
+    - サービスへの所属はZipf分布 (少数のサービスに多くのPodが集まる)
+    - failed_node_ratio の割合のノードは、Podだけが残った障害ノード
+    - new_pod_ratio の割合のPodは current_node が未設定の新規Pod
+    """
+    rng = np.random.default_rng(seed)
+    num_failed = int(num_nodes * failed_node_ratio)
+    num_alive = max(1, num_nodes - num_failed)
+
+    nodes = [
+        Node(
+            id=f"node{i}",
+            cpu_capacity=float(rng.choice([4000, 8000, 16000])),
+            mem_capacity=float(rng.choice([16000, 32000, 64000])),
+        )
+        for i in range(num_alive)
+    ]
+    node_ids = [f"node{i}" for i in range(num_alive + num_failed)]
+
+    cpu = np.clip(rng.lognormal(np.log(300), skew / 2, num_pods), 10, 4000)
+    mem = np.clip(rng.lognormal(np.log(1024), skew / 2, num_pods), 32, 16000)
+    current = rng.integers(len(node_ids), size=num_pods)
+    is_new = rng.random(num_pods) < new_pod_ratio
+    if num_services:
+        weights = 1.0 / np.arange(1, num_services + 1)
+        service = rng.choice(num_services, size=num_pods, p=weights / weights.sum())
+    no_service = rng.random(num_pods) < unaffiliated_ratio
+    priority = rng.choice([1, 1, 1, 2, 5], size=num_pods)
+
+    pods = [
+        Pod(
+            id=f"pod{i}",
+            cpu_usage=round(float(cpu[i])),
+            mem_usage=round(float(mem[i])),
+            current_node=None if is_new[i] else node_ids[current[i]],
+            service=(None if not num_services or no_service[i] else f"svc{service[i]}"),
+            priority=float(priority[i]),
+        )
+        for i in range(num_pods)
+    ]
+    return ClusterState(nodes=nodes, pods=pods, services=[])
+
+
+@contextmanager
+def timer(timings: Dict[str, float], name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
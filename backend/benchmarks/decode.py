@@ -0,0 +1,91 @@
+"""
+_decode_result を、(pod, node) の全組を辞書で引く以前の実装と比較します。
+
+    python -m benchmarks.decode
+"""
+
+from typing import List
+
+import numpy as np
+
+from src.models import Action, ActionType, ClusterState, Pod
+from src.solver import _decode_result
+
+from .common import generate_cluster, timer
+
+SIZES = [(1000, 20), (5000, 50), (10000, 100)]
+
+
+def decode_result_loop(
+    response: dict[tuple[int, ...], float],
+    state: ClusterState,
+) -> tuple[List[Pod], List[Action]]:
+    """
+    以前の _decode_result (比較用)。
+    """
+    actions: List[Action] = []
+    new_pods_list: List[Pod] = []
+
+    for p in range(len(state.pods)):
+        pod = state.pods[p]
+        fond_node = False
+
+        for n in range(len(state.nodes)):
+            if response.get((p, n), 0) == 1:
+                target_node = state.nodes[n]
+                if pod.id in [p.id for p in new_pods_list]:
+                    break
+
+                new_pods_list.append(
+                    Pod(
+                        id=pod.id,
+                        cpu_usage=pod.cpu_usage,
+                        mem_usage=pod.mem_usage,
+                        current_node=target_node.id,
+                        service=pod.service,
+                        priority=pod.priority,
+                    )
+                )
+                fond_node = True
+
+                if pod.current_node is None:
+                    action = ActionType.CREATE
+                elif pod.current_node != target_node.id:
+                    action = ActionType.MOVE
+                else:
+                    action = ActionType.KEEP
+                actions.append(
+                    Action(pod_id=pod.id, target_node_id=target_node.id, action=action)
+                )
+
+        if not fond_node:
+            actions.append(Action(pod_id=pod.id, action=ActionType.REMOVE))
+
+    return new_pods_list, actions
+
+
+def main() -> None:
+    print(f"{'pods':>6} {'nodes':>5} {'loop':>9} {'dict':>9} {'array':>9}")
+    for num_pods, num_nodes in SIZES:
+        state = generate_cluster(num_pods, num_nodes, failed_node_ratio=0.0)
+        rng = np.random.default_rng(0)
+        assignment = np.zeros((num_pods, num_nodes), dtype=np.int8)
+        assignment[np.arange(num_pods), rng.integers(num_nodes, size=num_pods)] = 1
+        response = {(int(p), int(n)): 1.0 for p, n in zip(*np.nonzero(assignment))}
+
+        timings: dict[str, float] = {}
+        with timer(timings, "loop"):
+            expected = decode_result_loop(response, state)
+        with timer(timings, "dict"):
+            result = _decode_result(response, state)
+        with timer(timings, "array"):
+            _decode_result(assignment, state)
+        assert result == expected
+        print(
+            f"{num_pods:>6} {num_nodes:>5} {timings['loop']:>9.3f} "
+            f"{timings['dict']:>9.3f} {timings['array']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
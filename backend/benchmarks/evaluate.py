@@ -0,0 +1,46 @@
+"""
+/evaluate (evaluate_placement) で、最適化せずに割り当てを評価する所要時間を計測します。
+request はJSONの検証を含むHTTPリクエスト全体の所要時間です。
+
+    python -m benchmarks.evaluate
+"""
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from main import app
+from src.evaluation import evaluate_placement
+
+from .common import generate_cluster, timer
+
+SIZES = [(1000, 20), (10000, 100), (50000, 500)]
+# 提案された割り当てで現在のノードから移動させるPodの割合
+MOVE_RATIO = 0.05
+
+
+def main() -> None:
+    client = TestClient(app)
+    print(f"{'pods':>6} {'nodes':>5} {'evaluate':>9} {'request':>9}")
+    for num_pods, num_nodes in SIZES:
+        state = generate_cluster(num_pods, num_nodes, failed_node_ratio=0.0)
+        rng = np.random.default_rng(0)
+        moved = rng.choice(num_pods, size=int(num_pods * MOVE_RATIO), replace=False)
+        assignment = {
+            state.pods[p].id: f"node{rng.integers(num_nodes)}" for p in moved.tolist()
+        }
+        body = {"state": state.model_dump(), "assignment": assignment}
+
+        timings: dict[str, float] = {}
+        with timer(timings, "evaluate"):
+            result = evaluate_placement(state, assignment)
+        with timer(timings, "request"):
+            response = client.post("/evaluate", json=body)
+        assert response.json()["energy"] == result.energy
+        print(
+            f"{num_pods:>6} {num_nodes:>5} {timings['evaluate']:>9.4f}"
+            f" {timings['request']:>9.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
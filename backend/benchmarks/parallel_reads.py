@@ -0,0 +1,67 @@
+"""
+num_reads をワーカープロセスに分割したときの、ワーカー数ごとの実行時間を計測します。
+
+    python -m benchmarks.parallel_reads
+"""
+
+import os
+
+from fastapi import HTTPException
+
+from src import parallel
+from src.models import AnealingSettings
+from src.solver import solve_placement
+
+from .common import generate_cluster, timer
+
+NUM_PODS, NUM_NODES = 60, 8
+NUM_READS = 64
+ONE_HOT_WEIGHT = 2000.0
+WORKERS = [1, 2, 4, 8, 16, 32]
+
+
+def main() -> None:
+    state = generate_cluster(NUM_PODS, NUM_NODES)
+    max_workers = os.cpu_count() or 1
+    print(
+        f"cpu_count={max_workers} pods={NUM_PODS} nodes={NUM_NODES} reads={NUM_READS}"
+    )
+    print(f"{'engine':>12} {'workers':>7} {'seconds':>9} {'energy':>10}")
+
+    for engine in ("qubo", "jijmodeling"):
+        # プロセスの起動とインポートは計測に含めない (解の有無は問わない)
+        try:
+            solve_placement(
+                state.model_copy(deep=True),
+                AnealingSettings(
+                    num_reads=max_workers,
+                    num_workers=max_workers,
+                    one_hot_relaxed_weight=ONE_HOT_WEIGHT,
+                    engine=engine,
+                ),
+            )
+        except HTTPException:
+            pass
+
+        for num_workers in WORKERS:
+            if num_workers > max_workers:
+                break
+            settings = AnealingSettings(
+                num_reads=NUM_READS,
+                num_workers=num_workers,
+                seed=0,
+                one_hot_relaxed_weight=ONE_HOT_WEIGHT,
+                engine=engine,
+            )
+            timings: dict[str, float] = {}
+            with timer(timings, "solve"):
+                response = solve_placement(state.model_copy(deep=True), settings)
+            print(
+                f"{engine:>12} {num_workers:>7} "
+                f"{timings['solve']:>9.3f} {response.energy:>10.2f}"
+            )
+    parallel.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+jijmodeling経由と直接QUBO展開の2つのエンジンを比較します。
+
+    python -m benchmarks.qubo_engine
+"""
+
+from src.models import AnealingSettings
+from src.solver import model_cache, solve_placement
+
+from .common import generate_cluster, timer
+
+SIZES = [(10, 3), (30, 5), (60, 8), (100, 10)]
+NUM_READS = 20
+# 合成クラスタでは負荷分散項の係数が大きいため、one-hot制約の重みを上げて実行可能解を得る
+ONE_HOT_WEIGHT = 2000.0
+
+
+def main() -> None:
+    print(f"{'pods':>5} {'nodes':>5} {'engine':>12} {'seconds':>9} {'energy':>12}")
+    for num_pods, num_nodes in SIZES:
+        for engine in ("jijmodeling", "qubo"):
+            model_cache.clear()
+            state = generate_cluster(num_pods, num_nodes)
+            settings = AnealingSettings(
+                num_reads=NUM_READS,
+                one_hot_relaxed_weight=ONE_HOT_WEIGHT,
+                engine=engine,
+            )
+            timings: dict[str, float] = {}
+            with timer(timings, "solve"):
+                response = solve_placement(state, settings)
+            print(
+                f"{num_pods:>5} {num_nodes:>5} {engine:>12} "
+                f"{timings['solve']:>9.3f} {response.energy:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+KYTOS_RECORD_PATH で記録した /optimize のリクエストを、現在の solve_placement で再実行し、
+所要時間とエネルギーの分布を記録時の結果と比較します。
+
+    python -m benchmarks.replay /var/log/kytos/optimize.jsonl.gz --workers 8
+
+ローテーションされたファイル (path.1, path.2, ...) も古い順に読みます。
+結果キャッシュから返した記録は、最適化していないため除きます。
+リクエストはプロセスごとに並列に再実行します。所要時間を正確に比べる場合は --workers 1 にします。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+
+from src.recorder import log_files, read_records
+
+PERCENTILES = (50, 90, 99)
+# これ以下のエネルギーの差 (相対値) は同じとみなす
+ENERGY_TOLERANCE = 1e-9
+
+
+def load_records(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    records: List[Dict[str, Any]] = []
+    for file in log_files(path):
+        for record in read_records(file):
+            if record["response"].get("cached"):
+                continue
+            records.append(record)
+            if limit is not None and len(records) >= limit:
+                return records
+    return records
+
+
+def _replay_one(request: Dict[str, Any]) -> Dict[str, Any]:
+    from src.models import OptimizationRequest
+    from src.solver import solve_placement
+
+    parsed = OptimizationRequest.model_validate(request)
+    start = time.perf_counter()
+    try:
+        response = solve_placement(
+            parsed.state, parsed.settings, parsed.initial_placement
+        )
+    except HTTPException as e:
+        return {"seconds": time.perf_counter() - start, "error": str(e.detail)}
+    return {
+        "seconds": time.perf_counter() - start,
+        "energy": response.energy,
+        "engine": response.engine,
+    }
+
+
+def _warm_up() -> None:
+    # 最初の再実行に読み込みと初期化の時間が含まれないようにする
+    from src.warmup import warm_up
+
+    warm_up()
+
+
+def replay(records: List[Dict[str, Any]], workers: int) -> List[Dict[str, Any]]:
+    """
+    記録したリクエストを並列に再実行し、記録と同じ順序で結果を返します。
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_warm_up,
+    ) as executor:
+        return list(executor.map(_replay_one, [r["request"] for r in records]))
+
+
+def _distribution(values: np.ndarray) -> Dict[str, float]:
+    if len(values) == 0:
+        return {}
+    result = {f"p{q}": float(np.percentile(values, q)) for q in PERCENTILES}
+    result["mean"] = float(values.mean())
+    return result
+
+
+def summarize(
+    records: List[Dict[str, Any]], results: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    所要時間 (秒) の分布と、エネルギーの差 (再実行 - 記録、記録の絶対値に対する割合) の
+    分布、エネルギーが下がった・上がった・変わらなかったリクエストの数を返します。
+    """
+    solved = [
+        (record, result)
+        for record, result in zip(records, results)
+        if "error" not in result
+    ]
+    recorded = np.array([record["response"]["energy"] for record, _ in solved])
+    replayed = np.array([result["energy"] for _, result in solved])
+    relative = (replayed - recorded) / np.maximum(np.abs(recorded), 1e-9)
+    return {
+        "requests": len(records),
+        "errors": len(records) - len(solved),
+        "latency": {
+            "recorded": _distribution(np.array([r["seconds"] for r in records])),
+            "replayed": _distribution(np.array([r["seconds"] for r in results])),
+        },
+        "energy": {
+            "relative_delta": _distribution(relative),
+            "better": int((relative < -ENERGY_TOLERANCE).sum()),
+            "worse": int((relative > ENERGY_TOLERANCE).sum()),
+            "same": int((np.abs(relative) <= ENERGY_TOLERANCE).sum()),
+        },
+    }
+
+
+def _format(summary: Dict[str, Any]) -> str:
+    lines = [f"requests={summary['requests']} errors={summary['errors']}"]
+    columns = [f"p{q}" for q in PERCENTILES] + ["mean"]
+    lines.append(f"{'':>22}" + "".join(f"{c:>12}" for c in columns))
+    rows = {
+        "latency recorded (s)": summary["latency"]["recorded"],
+        "latency replayed (s)": summary["latency"]["replayed"],
+        "energy delta (rel)": summary["energy"]["relative_delta"],
+    }
+    for name, values in rows.items():
+        lines.append(
+            f"{name:>22}"
+            + "".join(f"{values.get(c, float('nan')):>12.4g}" for c in columns)
+        )
+    energy = summary["energy"]
+    lines.append(
+        f"energy: better={energy['better']} worse={energy['worse']}"
+        f" same={energy['same']}"
+    )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="記録のファイル (KYTOS_RECORD_PATH)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="並列に実行するプロセス数",
+    )
+    parser.add_argument("--limit", type=int, help="再実行する記録の数の上限")
+    parser.add_argument("--output", help="比較の結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    records = load_records(args.path, args.limit)
+    if not records:
+        parser.error(f"記録がありません: {args.path}")
+    summary = summarize(records, replay(records, args.workers))
+    print(_format(summary))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
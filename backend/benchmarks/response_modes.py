@@ -0,0 +1,53 @@
+"""
+/optimize のレスポンスを、すべてのPodを返す full と、変更のあるPodだけを返す diff で、
+デコードとJSONへのシリアライズの所要時間、レスポンスの大きさを比較します。
+
+    python -m benchmarks.response_modes
+"""
+
+import numpy as np
+
+from src.models import AnealingSettings, OptimizationResponse
+from src.solver import _decode_placement, _prepare_data
+
+from .common import generate_cluster, timer
+
+SIZES = [(1000, 20), (10000, 100)]
+# 最良解で現在のノードから移動させるPodの数
+NUM_MOVES = 12
+
+
+def main() -> None:
+    print(
+        f"{'pods':>6} {'nodes':>5} {'mode':>4} {'decode':>9} {'json':>9} {'bytes':>10}"
+    )
+    for num_pods, num_nodes in SIZES:
+        state = generate_cluster(num_pods, num_nodes)
+        instance_data, state.pods, arrays = _prepare_data(state, AnealingSettings())
+        rng = np.random.default_rng(0)
+        target = arrays.pod_node.copy()
+        moved = rng.choice(num_pods, size=NUM_MOVES, replace=False)
+        target[moved] = (target[moved] + 1) % num_nodes
+        assignment = np.zeros((num_pods, num_nodes), dtype=np.int8)
+        assignment[np.arange(num_pods), target] = 1
+
+        for mode in ("full", "diff"):
+            timings: dict[str, float] = {}
+            with timer(timings, "decode"):
+                pods, actions, summary = _decode_placement(
+                    assignment, state, arrays, instance_data, diff=mode == "diff"
+                )
+                response = OptimizationResponse(
+                    pods=pods, placements=actions, summary=summary, energy=0.0
+                )
+            with timer(timings, "json"):
+                body = response.model_dump_json()
+            assert summary["move"] == NUM_MOVES
+            print(
+                f"{num_pods:>6} {num_nodes:>5} {mode:>4} {timings['decode']:>9.4f}"
+                f" {timings['json']:>9.4f} {len(body):>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
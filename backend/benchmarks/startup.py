@@ -0,0 +1,71 @@
+"""
+別のプロセスでサーバーを読み込み、起動時間 (main の読み込み、ウォームアップ) と
+最初の最適化の所要時間を、ウォームアップの有無で比較します。
+
+    python -m benchmarks.startup
+"""
+
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+# 最初の最適化に使うクラスタ (pods, nodes, services)
+FIRST_SOLVE_SIZE = (50, 5, 5)
+
+
+def _child(warm: bool) -> None:
+    # 計測対象の読み込みより前に、src 以下を読み込まないこと
+    start = time.perf_counter()
+    import main
+
+    result = {"import_seconds": time.perf_counter() - start}
+    if warm:
+        start = time.perf_counter()
+        main.readiness.run()
+        result["warmup_seconds"] = time.perf_counter() - start
+
+    from src.models import AnealingSettings
+    from src.solver import solve_placement
+
+    from .common import generate_cluster
+
+    state = generate_cluster(*FIRST_SOLVE_SIZE)
+    settings = AnealingSettings(num_reads=10, seed=0, one_hot_relaxed_weight=2000.0)
+    start = time.perf_counter()
+    solve_placement(state, settings)
+    result["first_solve_seconds"] = time.perf_counter() - start
+    print(json.dumps(result))
+
+
+def measure_startup() -> Dict[str, float]:
+    """
+    ウォームアップなし (cold) とあり (warm) のそれぞれで、新しいプロセスの所要時間を返します。
+    """
+    result: Dict[str, float] = {}
+    for mode in ("cold", "warm"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", mode],
+            cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        # 最後の行が計測結果 (それより前はソルバーの出力)
+        for key, seconds in json.loads(output.strip().splitlines()[-1]).items():
+            result[f"{mode}_{key}"] = seconds
+    return result
+
+
+def main() -> None:
+    for key, seconds in measure_startup().items():
+        print(f"{key:>26} {seconds:>8.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        _child(sys.argv[2] == "warm")
+    else:
+        main()
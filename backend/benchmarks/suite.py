@@ -0,0 +1,224 @@
+"""
+合成クラスタの規模を変えながら solve_placement の各段階 (metrics.stage で記録される時間) を
+計測し、結果をJSONに保存します。
+別のプロセスでの起動時間 (benchmarks.startup) も計測します。
+--compare に以前の結果を渡すと、遅くなった段階や悪化したエネルギーを報告します。
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output new.json --compare bench.json
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import jijmodeling as jm
+import numpy as np
+from fastapi import HTTPException
+
+from src import metrics
+from src.models import AnealingSettings, ClusterState
+from src.qubo import build_qubo
+from src.solver import _prepare_data, model_cache, solve_placement
+
+from .common import generate_cluster
+from .startup import measure_startup
+
+GRIDS = {
+    "quick": {"pods": [20, 50], "nodes": [4, 8], "services": [3, 20]},
+    "default": {"pods": [50, 200, 500], "nodes": [5, 20], "services": [5, 50]},
+}
+# solve_placement が metrics.stage で記録する段階
+STAGES = ["prepare", "prune", "interpret", "sample", "repair", "decode"]
+ONE_HOT_WEIGHT = 2000.0
+# 以前の結果よりこの倍率以上遅くなった段階を回帰として報告する
+# (MIN_SECONDS 未満の段階は揺らぎが大きいため対象外)
+TIME_THRESHOLD = 1.5
+MIN_SECONDS = 0.01
+ENERGY_TOLERANCE = 0.05
+
+
+def _solve(
+    state: ClusterState, settings: AnealingSettings
+) -> Tuple[Dict[str, float], Optional[float]]:
+    """
+    モデルキャッシュを空にして solve_placement を実行し、段階ごとの時間と
+    目的関数値 (実行可能解がなければ None) を返します。
+    """
+    model_cache.clear()
+    with metrics.collect_timings() as timings:
+        try:
+            energy = solve_placement(state, settings).energy
+        except HTTPException:
+            energy = None
+    return timings, energy
+
+
+def run_case(
+    num_pods: int,
+    num_nodes: int,
+    num_services: int,
+    settings: AnealingSettings,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    1つの規模について、時間と最大メモリを (計測の影響を避けるため別の実行で) 計測します。
+    """
+    state = generate_cluster(num_pods, num_nodes, num_services, seed=seed)
+    timings, energy = _solve(state.model_copy(deep=True), settings)
+
+    # tracemallocはNumPyとPythonの確保のみを追跡する (jijmodeling/OMMX内部の確保は含まない)
+    tracemalloc.start()
+    try:
+        _solve(state.model_copy(deep=True), settings)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+    # QUBOの規模 (one-hot制約のペナルティ項を含む)
+    data, _, _ = _prepare_data(state.model_copy(deep=True), settings)
+    num_pods, num_nodes = data["moveCost"].shape
+    qubo = build_qubo(data, settings.one_hot_relaxed_weight)
+    return {
+        "pods": num_pods,
+        "nodes": num_nodes,
+        "services": num_services,
+        "engine": settings.engine,
+        "timings": timings,
+        "total_seconds": sum(timings.values()),
+        "peak_memory_mb": peak,
+        "qubo_variables": qubo.num_variables,
+        "qubo_quadratic_terms": len(qubo.rows)
+        + num_pods * num_nodes * (num_nodes - 1) // 2,
+        "energy": energy,
+    }
+
+
+def _case_key(result: Dict[str, Any]) -> tuple:
+    return (result["engine"], result["pods"], result["nodes"], result["services"])
+
+
+def compare(results: List[Dict[str, Any]], previous: List[Dict[str, Any]]) -> List[str]:
+    """
+    同じ規模の以前の結果と比べ、回帰の説明を返します。
+    """
+    previous_by_key = {_case_key(r): r for r in previous}
+    regressions = []
+    for result in results:
+        before = previous_by_key.get(_case_key(result))
+        if before is None:
+            continue
+        case = "pods={} nodes={} services={} engine={}".format(
+            result["pods"], result["nodes"], result["services"], result["engine"]
+        )
+        for stage, seconds in result["timings"].items():
+            old = before["timings"].get(stage)
+            if (
+                old is not None
+                and old >= MIN_SECONDS
+                and seconds > old * TIME_THRESHOLD
+            ):
+                regressions.append(f"{case}: {stage} {old:.3f}s -> {seconds:.3f}s")
+        old_energy, energy = before["energy"], result["energy"]
+        if old_energy is not None and energy is None:
+            regressions.append(f"{case}: 実行可能解が見つからなくなった")
+        elif old_energy is not None and energy > old_energy + ENERGY_TOLERANCE * abs(
+            old_energy
+        ):
+            regressions.append(f"{case}: energy {old_energy:.2f} -> {energy:.2f}")
+    return regressions
+
+
+def compare_startup(startup: Dict[str, float], previous: Dict[str, float]) -> List[str]:
+    """
+    起動時間を以前の結果と比べ、回帰の説明を返します。
+    """
+    return [
+        f"startup: {key} {previous[key]:.3f}s -> {seconds:.3f}s"
+        for key, seconds in startup.items()
+        if previous.get(key, 0.0) >= MIN_SECONDS
+        and seconds > previous[key] * TIME_THRESHOLD
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--grid", choices=GRIDS, default="default")
+    parser.add_argument("--engine", choices=["jijmodeling", "qubo"], default="qubo")
+    parser.add_argument("--num-reads", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--compare", help="比較対象の以前の結果 (JSON)")
+    parser.add_argument(
+        "--skip-startup", action="store_true", help="起動時間を計測しない"
+    )
+    args = parser.parse_args(argv)
+
+    settings = AnealingSettings(
+        engine=args.engine,
+        num_reads=args.num_reads,
+        seed=args.seed,
+        one_hot_relaxed_weight=ONE_HOT_WEIGHT,
+    )
+    grid = GRIDS[args.grid]
+
+    print(
+        f"{'pods':>5} {'nodes':>5} {'svcs':>5} "
+        + " ".join(f"{s[:9]:>9}" for s in STAGES)
+        + f" {'peak MB':>8} {'vars':>6} {'energy':>12}"
+    )
+    results = []
+    for num_pods, num_nodes, num_services in itertools.product(
+        grid["pods"], grid["nodes"], grid["services"]
+    ):
+        result = run_case(num_pods, num_nodes, num_services, settings, args.seed)
+        results.append(result)
+        energy = "infeasible" if result["energy"] is None else f"{result['energy']:.2f}"
+        print(
+            f"{num_pods:>5} {num_nodes:>5} {num_services:>5} "
+            + " ".join(f"{result['timings'].get(s, 0.0):>9.3f}" for s in STAGES)
+            + f" {result['peak_memory_mb']:>8.1f}"
+            + f" {result['qubo_variables']:>6} {energy:>12}"
+        )
+
+    startup: Dict[str, float] = {}
+    if not args.skip_startup:
+        startup = measure_startup()
+        print(" ".join(f"{key}={seconds:.3f}s" for key, seconds in startup.items()))
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "jijmodeling": jm.__version__,
+                "settings": settings.model_dump(),
+                "grid": grid,
+                "results": results,
+                "startup": startup,
+            },
+            f,
+            indent=2,
+        )
+    print(f"saved: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare(results, previous["results"])
+        regressions += compare_startup(startup, previous.get("startup", {}))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
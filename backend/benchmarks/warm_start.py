@@ -0,0 +1,69 @@
+"""
+インクリメンタルなリバランスで、コールドスタートとウォームスタートが
+同じエネルギーに到達するまでの時間を比較します。
+
+    python -m benchmarks.warm_start
+"""
+
+from src.models import AnealingSettings, Pod
+from src.solver import solve_placement
+
+from .common import generate_cluster, timer
+
+NUM_PODS, NUM_NODES = 60, 8
+ONE_HOT_WEIGHT = 2000.0
+COLD_READS = 100
+# (num_reads, warm_start_num_sweeps) を小さい順に試す
+WARM_SCHEDULES = [(1, 10), (2, 20), (5, 50), (10, 100), (20, 100), (50, 200)]
+
+
+def _incremental_state():
+    # 一度最適化した配置に、新規Podを数個追加した状態
+    state = generate_cluster(NUM_PODS, NUM_NODES)
+    settings = AnealingSettings(one_hot_relaxed_weight=ONE_HOT_WEIGHT, engine="qubo")
+    state.pods = solve_placement(state, settings).pods
+    state.pods += [
+        Pod(id=f"new{i}", cpu_usage=300, mem_usage=1024, service="svc0")
+        for i in range(3)
+    ]
+    return state
+
+
+def main() -> None:
+    base = _incremental_state()
+
+    timings: dict[str, float] = {}
+    cold_settings = AnealingSettings(
+        num_reads=COLD_READS, one_hot_relaxed_weight=ONE_HOT_WEIGHT, engine="qubo"
+    )
+    with timer(timings, "cold"):
+        target = solve_placement(base.model_copy(deep=True), cold_settings).energy
+    print(
+        f"cold: reads={COLD_READS} sweeps=1000 {timings['cold']:.3f}s energy={target:.2f}"
+    )
+
+    for num_reads, num_sweeps in WARM_SCHEDULES:
+        settings = AnealingSettings(
+            num_reads=num_reads,
+            one_hot_relaxed_weight=ONE_HOT_WEIGHT,
+            engine="qubo",
+            warm_start=True,
+            warm_start_num_sweeps=num_sweeps,
+        )
+        with timer(timings, "warm"):
+            energy = solve_placement(base.model_copy(deep=True), settings).energy
+        print(
+            f"warm: reads={num_reads} sweeps={num_sweeps} "
+            f"{timings['warm']:.3f}s energy={energy:.2f}"
+        )
+        if energy <= target:
+            print(
+                f"warm start reached the cold energy {timings['cold'] / timings['warm']:.1f}x faster"
+            )
+            break
+    else:
+        print("warm start did not reach the cold energy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+最適化の結果の移動計画を、ウェーブ (schedule_waves) に分けて実行する場合と、
+以前のように1つずつ実行する場合の段階数を比較します。
+
+    python -m benchmarks.waves
+"""
+
+from typing import Dict, List, Set
+
+import numpy as np
+
+from src.arrays import ClusterArrays
+from src.models import (
+    Action,
+    ActionType,
+    AnealingSettings,
+    ClusterState,
+    MigrationPlan,
+    Node,
+    Pod,
+)
+from src.solver import _prepare_data, solve_prepared
+from src.waves import schedule_waves
+
+from .common import timer
+
+# (pods, nodes, services)
+SIZES = [(500, 20, 50), (2000, 80, 200), (10000, 400, 1000)]
+NODE_CPU = 16000
+NODE_MEM = 65536
+
+
+def make_rebalance_cluster(
+    num_pods: int, num_nodes: int, num_services: int, seed: int = 0
+) -> ClusterState:
+    """
+    容量を超えないまま、一部のノードにPodが偏った合成クラスタを生成します。
+    """
+    rng = np.random.default_rng(seed)
+    cpu = rng.integers(100, 1000, size=num_pods).astype(float)
+    mem = rng.integers(128, 4096, size=num_pods).astype(float)
+    weights = np.exp(-np.arange(num_nodes) / (num_nodes / 3))
+    preferred = rng.choice(num_nodes, size=num_pods, p=weights / weights.sum())
+    cpu_load = np.zeros(num_nodes)
+    mem_load = np.zeros(num_nodes)
+    current = np.empty(num_pods, dtype=np.int64)
+    for p in range(num_pods):
+        n = preferred[p]
+        if cpu_load[n] + cpu[p] > NODE_CPU or mem_load[n] + mem[p] > NODE_MEM:
+            # 偏らせたいノードが埋まっていれば、最も空いているノードに置く
+            n = int(np.argmin(np.maximum(cpu_load / NODE_CPU, mem_load / NODE_MEM)))
+        current[p] = n
+        cpu_load[n] += cpu[p]
+        mem_load[n] += mem[p]
+
+    nodes = [
+        Node(id=f"node{i}", cpu_capacity=NODE_CPU, mem_capacity=NODE_MEM)
+        for i in range(num_nodes)
+    ]
+    service = rng.integers(num_services, size=num_pods)
+    pods = [
+        Pod(
+            id=f"pod{i}",
+            cpu_usage=cpu[i],
+            mem_usage=mem[i],
+            current_node=f"node{current[i]}",
+            service=f"svc{service[i]}",
+        )
+        for i in range(num_pods)
+    ]
+    return ClusterState(nodes=nodes, pods=pods, services=[])
+
+
+def check_waves(
+    arrays: ClusterArrays, actions: List[Action], plan: MigrationPlan
+) -> None:
+    """
+    ウェーブを順に実行し、容量とサービスの可用性が守られ (overcommitted_nodes と
+    unavailable_services を除く)、最後に actions の配置になることを確認します。
+    """
+    node_index = {node_id: n for n, node_id in enumerate(arrays.node_ids)}
+    pod_index = {pod_id: p for p, pod_id in enumerate(arrays.pod_ids)}
+    exempt_nodes = np.isin(arrays.node_ids, plan.overcommitted_nodes)
+    exempt_services: Set[int] = {
+        s
+        for s, service_id in enumerate(arrays.service_ids)
+        if service_id in plan.unavailable_services
+    }
+    node = arrays.pod_node.copy()
+    cpu, mem = arrays.pod_cpu, arrays.pod_mem
+
+    def load(values: np.ndarray) -> np.ndarray:
+        placed = node >= 0
+        return np.bincount(node[placed], values[placed], minlength=arrays.num_nodes)
+
+    for wave in plan.waves:
+        moves = [
+            (
+                pod_index[a.pod_id],
+                -1 if a.target_node_id is None else node_index[a.target_node_id],
+            )
+            for a in wave
+        ]
+        assert len({p for p, _ in moves}) == len(moves)
+        # 実行中は移動元も容量を使う
+        cpu_peak, mem_peak = load(cpu), load(mem)
+        for p, n in moves:
+            if n >= 0:
+                cpu_peak[n] += cpu[p]
+                mem_peak[n] += mem[p]
+        ok = (cpu_peak <= arrays.node_cpu * (1 + 1e-9)) & (
+            mem_peak <= arrays.node_mem * (1 + 1e-9)
+        )
+        assert (ok | exempt_nodes).all()
+
+        running = node >= 0
+        stopped = np.zeros(len(arrays.pod_ids), dtype=bool)
+        stopped[[p for p, _ in moves]] = True
+        for s in set(arrays.pod_service[running & stopped].tolist()) - exempt_services:
+            if s >= 0:
+                members = running & (arrays.pod_service == s)
+                assert (members & ~stopped).any()
+        for p, n in moves:
+            node[p] = n
+
+    expected = arrays.pod_node.copy()
+    for action in actions:
+        if action.action != ActionType.KEEP:
+            expected[pod_index[action.pod_id]] = (
+                -1
+                if action.target_node_id is None
+                else node_index[action.target_node_id]
+            )
+    assert (node == expected).all()
+
+
+def main() -> None:
+    print(
+        f"{'pods':>6} {'nodes':>5} {'actions':>7} {'waves':>5}"
+        f" {'staged':>6} {'schedule':>9}"
+    )
+    settings = AnealingSettings(engine="greedy", one_hot_relaxed_weight=2000.0)
+    for num_pods, num_nodes, num_services in SIZES:
+        state = make_rebalance_cluster(num_pods, num_nodes, num_services)
+        instance_data, state.pods, arrays = _prepare_data(state, settings)
+        response = solve_prepared(state, arrays, instance_data, settings)
+        actions = response.placements
+
+        timings: Dict[str, float] = {}
+        with timer(timings, "schedule"):
+            plan = schedule_waves(arrays, actions)
+        check_waves(arrays, actions, plan)
+        # 以前は keep 以外のアクションを1つずつ実行していた
+        num_actions = sum(a.action != ActionType.KEEP for a in actions)
+        print(
+            f"{num_pods:>6} {num_nodes:>5} {num_actions:>7} {len(plan.waves):>5}"
+            f" {len(plan.staged_pods):>6} {timings['schedule']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,75 @@
-from fastapi import FastAPI
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from fastapi import Depends, FastAPI, Header, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from src.models import OptimizationRequest, OptimizationResponse
-from src.solver import solve_placement
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import ValidationError
+
+from src import metrics, parallel
+from src.batch import solve_batch
+from src.columnar import NPZ_MEDIA_TYPE, ColumnarResult, read_columnar_request
+from src.evaluation import evaluate_placement
+from src.jobs import JobManager
+from src.models import (
+    BatchOptimizationRequest,
+    BatchOptimizationResponse,
+    EvaluationRequest,
+    EvaluationResponse,
+    JobInfo,
+    JobRequest,
+    OptimizationRequest,
+    OptimizationResponse,
+    ReadinessInfo,
+    SessionCreateRequest,
+    SessionInfo,
+    SessionOptimizeRequest,
+    SessionUpdate,
+)
+from src.recorder import Recorder
+from src.result_cache import ResultCache, digest_request
+from src.sessions import SessionStore
+from src.solver import model_cache, solve_columnar, solve_placement
+from src.streaming import SSE_MEDIA_TYPE, stream_placement
+from src.warmup import Readiness
+
+job_manager = JobManager(
+    max_workers=int(os.environ.get("KYTOS_JOB_WORKERS", 2)),
+    max_pending=int(os.environ.get("KYTOS_JOB_MAX_PENDING", 16)),
+)
+result_cache = ResultCache(
+    ttl=float(os.environ.get("KYTOS_RESULT_CACHE_TTL", 30)),
+    max_bytes=int(os.environ.get("KYTOS_RESULT_CACHE_BYTES", 64 * 2**20)),
+)
+session_store = SessionStore(
+    max_sessions=int(os.environ.get("KYTOS_MAX_SESSIONS", 64)),
+    ttl=float(os.environ.get("KYTOS_SESSION_TTL", 3600)),
+)
+readiness = Readiness(enabled=os.environ.get("KYTOS_WARMUP", "1") != "0")
+recorder = Recorder(
+    path=os.environ.get("KYTOS_RECORD_PATH"),
+    max_bytes=int(os.environ.get("KYTOS_RECORD_MAX_BYTES", 64 * 2**20)),
+    keep=int(os.environ.get("KYTOS_RECORD_KEEP", 5)),
+)
+
 
-app = FastAPI(title="Kytos Orchestration API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    readiness.start()
+    yield
+    job_manager.shutdown()
+    parallel.shutdown()
+    recorder.flush()
+
+
+app = FastAPI(title="Kytos Orchestration API", lifespan=lifespan)
 
 # CORS
 origins = [
@@ -24,8 +87,18 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_start(request: Request, call_next):
+    # ハンドラ側で、ボディの解析と検証にかかった時間を計測するため
+    metrics.request_started.set(time.perf_counter())
+    return await call_next(request)
+
+
 @app.get("/health")
 def health():
+    """
+    プロセスが動いていれば返す (liveness)。最適化できるかは /ready で確認する。
+    """
     return {
         "status": "ok",
         "timestamp": datetime.now(ZoneInfo("Asia/Tokyo")),
@@ -34,8 +107,71 @@ def health():
     }
 
 
-@app.post("/optimize", response_model=OptimizationResponse)
-def optimize(request: OptimizationRequest):
+@app.get(
+    "/ready",
+    response_model=ReadinessInfo,
+    responses={503: {"model": ReadinessInfo}},
+)
+def ready(response: Response):
+    """
+    起動時のウォームアップ (小さな合成インスタンスの求解) が終わっていれば 200、
+    終わっていないか失敗した場合は 503 を返す (readiness)。
+    KYTOS_WARMUP=0 ならウォームアップせず、最初から 200 を返す。
+    """
+    info = readiness.info()
+    if info.status != "ready":
+        response.status_code = 503
+    return info
+
+
+async def _read_optimize_body(
+    request: Request, content_type: str | None = Header(None)
+) -> OptimizationRequest | tuple:
+    # Content-Type が .npz なら列形式として読み、それ以外はJSONとして検証する
+    body = await request.body()
+    if content_type and content_type.startswith(NPZ_MEDIA_TYPE):
+        return read_columnar_request(body)
+    try:
+        return OptimizationRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors()]
+        )
+
+
+def _request_schema(model: type) -> dict:
+    # 入れ子のモデルは他のエンドポイントで components に登録されている
+    schema = model.model_json_schema(ref_template="#/components/schemas/{model}")
+    schema.pop("$defs", None)
+    return schema
+
+
+@app.post(
+    "/optimize",
+    response_model=OptimizationResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": _request_schema(OptimizationRequest)},
+                NPZ_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            },
+        },
+        "responses": {
+            "200": {
+                "content": {
+                    NPZ_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}}
+                }
+            }
+        },
+    },
+)
+def optimize(
+    body: OptimizationRequest | tuple = Depends(_read_optimize_body),
+    accept: str | None = Header(None),
+    timings: bool = False,
+    view: Literal["full", "diff"] = "full",
+):
     """
     クラスタの状態を受け取り、ポッドの最適配置を計算して返す。
     新規配置したいポッドは、current_nodeをNoneにする。
@@ -78,8 +214,207 @@ def optimize(request: OptimizationRequest):
             mem_limit_weight?: float = 1.0,
             one_hot_relaxed_weight?: float = 20.0,
             num_reads?: int = 100,
-        }
+            warm_start?: bool = false,
+            engine?: "jijmodeling" | "qubo" | "greedy" | "local_search" = "jijmodeling",
+            deadline_ms?: int | null,
+        },
+        initial_placement?: { [pod_id: str]: str } | null,
+        bypass_cache?: bool = false,
     }
     ```
+
+    `?timings=true` を付けると、段階ごとの所要時間 (秒) を timings に含めて返す。
+
+    `?view=diff` を付けると、pods を空にし、placements には変更のあるPod (move / create /
+    remove) のアクションだけを返す。アクションごとのPod数は、どちらでも summary に含まれる。
+    結果を列形式で返す場合は、常にすべてのPodを返す。
+
+    `Content-Type: application/x-npz` なら、列形式 (.npz) のクラスタを受け取る。
+    (配列の名前は src/columnar.py の read_columnar_request を参照)
+    `Accept: application/x-npz` なら、結果を列形式で返す。
+    列形式のリクエストは結果キャッシュを使わず、`Accept: application/json` でない限り列形式で返す。
+
+    KYTOS_RECORD_PATH を設定すると、JSONのリクエストと結果、所要時間を記録する
+    (benchmarks.replay で再実行できる)。
+
+    同じ状態 (nodes, pods, services の順序は問わない) と設定の結果は一定時間キャッシュされ、
+    cached=true で返される。bypass_cache=true なら最適化し直し、キャッシュを更新する。
+    """
+    npz_accepted = accept is not None and NPZ_MEDIA_TYPE in accept
+    if isinstance(body, tuple):
+        # 列形式: Podのモデルを作らずに配列のまま最適化する
+        metrics.observe_validation()
+        result = solve_columnar(*body)
+        if npz_accepted or accept is None or "application/json" not in accept:
+            return Response(result.to_npz(), media_type=NPZ_MEDIA_TYPE)
+        return JSONResponse(result.to_dict())
+
+    request = body
+    diff = view == "diff" and not npz_accepted
+    # 最適化はリクエストの state を書き換えるため、記録するリクエストは先にJSONにする
+    recorded = request.model_dump_json() if recorder.enabled else None
+    start = time.perf_counter()
+    with metrics.collect_timings() as collected:
+        metrics.observe_validation()
+        with metrics.stage("cache_key"):
+            key = digest_request(
+                request.state, request.settings, request.initial_placement
+            )
+        if diff:
+            key += ":diff"
+        response = result_cache.get_or_solve(
+            key,
+            lambda: solve_placement(
+                request.state, request.settings, request.initial_placement, diff=diff
+            ),
+            bypass=request.bypass_cache,
+        )
+    if recorded is not None:
+        recorder.record(recorded, response, time.perf_counter() - start, collected)
+    response.timings = collected if timings else None
+    if npz_accepted:
+        result = ColumnarResult.from_response(
+            response, [node.id for node in request.state.nodes]
+        )
+        return Response(result.to_npz(), media_type=NPZ_MEDIA_TYPE)
+    return response
+
+
+@app.post(
+    "/optimize/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {SSE_MEDIA_TYPE: {}}}},
+)
+def optimize_stream(request: OptimizationRequest):
+    """
+    /optimize と同じリクエストを受け取り、途中経過を Server-Sent Events で返す。
+
+    - `event: progress`: SAのバッチ (settings.sampling_batch_reads 回の読み出し) ごとの
+      最良の実行可能解 (deadline_ms 指定時は、貪欲法と局所探索の解も)
+    - `event: result`: 容量超過の修復後の最終結果 (final=true、engine や repair を含む)
+    - `event: error`: 最適化に失敗した場合 (status_code, detail)
+
+    data は PlacementUpdate (JSON) で、placements には前回の更新から変わったPodのアクションだけが入る。
+    接続を切ると、次のバッチの前で最適化を打ち切る。結果キャッシュは使わない。
+    """
+    return StreamingResponse(
+        stream_placement(request.state, request.settings, request.initial_placement),
+        media_type=SSE_MEDIA_TYPE,
+    )
+
+
+@app.post("/optimize/batch", response_model=BatchOptimizationResponse)
+def optimize_batch(request: BatchOptimizationRequest):
+    """
+    同じクラスタ状態に対する複数のシナリオ (ノードの停止、Podの追加、重みの変更など) を
+    まとめて最適化し、シナリオごとの配置、エネルギー、移動数を返す。
+    解けなかったシナリオは error に理由が入る。
+    """
+    return solve_batch(request)
+
+
+@app.post("/evaluate", response_model=EvaluationResponse)
+def evaluate(request: EvaluationRequest):
+    """
+    最適化せずに、割り当て (assignment: Pod ID -> Node ID、null は配置しない) の
+    目的関数値と、その内訳 (各項、ノードごとの負荷の偏りと容量超過、アンチアフィニティの組の数)
+    を返す。assignment に含まれないPodは current_node のまま評価する。
+    """
+    return evaluate_placement(request.state, request.assignment, request.settings)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus形式のメトリクス (段階ごとの所要時間、変数・二次項の数、実行可能解の割合など)。
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/cache/model")
+def model_cache_stats():
+    """
+    モデルキャッシュのステージごとのヒット/ミス数と節約時間(秒)を返す。
+    """
+    return model_cache.stats()
+
+
+@app.get("/cache/result")
+def result_cache_stats():
+    """
+    結果キャッシュのヒット/ミス数、件数、合計バイト数 (JSON換算) を返す。
+    """
+    return result_cache.stats()
+
+
+@app.post("/jobs", response_model=JobInfo, status_code=202)
+def create_job(request: JobRequest):
+    """
+    最適化ジョブを登録し、ジョブIDを返す。
+    リクエストは /optimize と同じ形式で、deadline_ms を指定できる。
+    待機中のジョブが多すぎる場合は 429 を返す。
+    """
+    return job_manager.submit(request)
+
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+def get_job(job_id: str):
+    """
+    ジョブの状態と、完了していれば結果を返す。
+    """
+    return job_manager.get(job_id)
+
+
+@app.delete("/jobs/{job_id}", response_model=JobInfo)
+def cancel_job(job_id: str):
+    """
+    ジョブをキャンセルする。
+    """
+    return job_manager.cancel(job_id)
+
+
+@app.post("/sessions", response_model=SessionInfo, status_code=201)
+def create_session(request: SessionCreateRequest):
+    """
+    クラスタの状態を保持するセッションを作成する。
+    以降は差分だけを送れば、係数の再計算を影響のある行・列に限定できる。
+    """
+    return session_store.create(request.state, request.settings).info()
+
+
+@app.patch("/sessions/{session_id}", response_model=SessionInfo)
+def update_session(session_id: str, request: SessionUpdate):
+    """
+    セッションに差分を順に適用する。
+    op は add_pod / remove_pod / resize_pod / move_pod / add_node / drain_node のいずれか。
+    途中の差分が失敗した場合、それより前の差分は適用されたまま残る。
+    """
+    session = session_store.get(session_id)
+    with session.lock:
+        session.apply(request.deltas)
+        return session.info()
+
+
+@app.post("/sessions/{session_id}/optimize", response_model=OptimizationResponse)
+def optimize_session(
+    session_id: str,
+    request: SessionOptimizeRequest,
+    view: Literal["full", "diff"] = "full",
+):
+    """
+    セッションが保持している状態で最適化を実行する。
+    `?view=diff` は /optimize と同じ。
+    """
+    session = session_store.get(session_id)
+    with session.lock:
+        return session.optimize(
+            request.settings, request.initial_placement, diff=view == "diff"
+        )
+
+
+@app.delete("/sessions/{session_id}", status_code=204)
+def delete_session(session_id: str):
+    """
+    セッションを破棄する。
     """
-    return solve_placement(request.state, request.settings)
+    session_store.delete(session_id)
@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from .models import ClusterState, Node, Pod
+
+
+@dataclass
+class ClusterArrays:
+    """
+    ClusterStateを、ノード/ポッド/サービスを整数インデックスで表した配列形式に変換したもの。
+    """
+
+    node_ids: List[str]
+    pod_ids: List[str]
+    service_ids: List[str]
+    node_cpu: np.ndarray  # (N,) in milliCPU
+    node_mem: np.ndarray  # (N,) in MiB
+    pod_cpu: np.ndarray  # (P,) in milliCPU
+    pod_mem: np.ndarray  # (P,) in MiB
+    pod_priority: np.ndarray  # (P,)
+    pod_placed: np.ndarray  # (P,) bool, current_node が設定されているか
+    pod_node: np.ndarray  # (P,) 現在のノードのインデックス (存在しない場合は -1)
+    pod_service: np.ndarray  # (P,) サービスのインデックス (未所属は -1)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def num_pods(self) -> int:
+        return len(self.pod_ids)
+
+    @classmethod
+    def from_state(cls, state: ClusterState) -> "ClusterArrays":
+        pods = state.pods
+        num_pods = len(pods)
+
+        # ノードIDを一度だけ整数インデックスに変換する
+        node_index = {node.id: i for i, node in enumerate(state.nodes)}
+        service_index: dict[str, int] = {}
+        for pod in pods:
+            if pod.service and pod.service not in service_index:
+                service_index[pod.service] = len(service_index)
+
+        return cls(
+            node_ids=[node.id for node in state.nodes],
+            pod_ids=[pod.id for pod in pods],
+            service_ids=list(service_index),
+            node_cpu=np.fromiter(
+                (n.cpu_capacity for n in state.nodes), float, len(state.nodes)
+            ),
+            node_mem=np.fromiter(
+                (n.mem_capacity for n in state.nodes), float, len(state.nodes)
+            ),
+            pod_cpu=np.fromiter((p.cpu_usage for p in pods), float, num_pods),
+            pod_mem=np.fromiter((p.mem_usage for p in pods), float, num_pods),
+            pod_priority=np.fromiter((p.priority for p in pods), float, num_pods),
+            pod_placed=np.fromiter(
+                (p.current_node is not None for p in pods), bool, num_pods
+            ),
+            pod_node=np.fromiter(
+                (node_index.get(p.current_node, -1) for p in pods), np.int64, num_pods
+            ),
+            pod_service=np.fromiter(
+                (service_index[p.service] if p.service else -1 for p in pods),
+                np.int64,
+                num_pods,
+            ),
+        )
+
+    def _service_index(self, service: Optional[str]) -> int:
+        if not service:
+            return -1
+        if service not in self.service_ids:
+            self.service_ids.append(service)
+        return self.service_ids.index(service)
+
+    def _node_index(self, node_id: Optional[str]) -> int:
+        return self.node_ids.index(node_id) if node_id in self.node_ids else -1
+
+    def append_pod(self, pod: Pod) -> None:
+        self.pod_ids.append(pod.id)
+        self.pod_cpu = np.append(self.pod_cpu, pod.cpu_usage)
+        self.pod_mem = np.append(self.pod_mem, pod.mem_usage)
+        self.pod_priority = np.append(self.pod_priority, pod.priority)
+        self.pod_placed = np.append(self.pod_placed, pod.current_node is not None)
+        self.pod_node = np.append(self.pod_node, self._node_index(pod.current_node))
+        self.pod_service = np.append(
+            self.pod_service, self._service_index(pod.service)
+        )
+
+    def update_pod(self, i: int, pod: Pod) -> None:
+        self.pod_ids[i] = pod.id
+        self.pod_cpu[i] = pod.cpu_usage
+        self.pod_mem[i] = pod.mem_usage
+        self.pod_priority[i] = pod.priority
+        self.pod_placed[i] = pod.current_node is not None
+        self.pod_node[i] = self._node_index(pod.current_node)
+        self.pod_service[i] = self._service_index(pod.service)
+
+    def delete_pod(self, i: int) -> None:
+        del self.pod_ids[i]
+        self.pod_cpu = np.delete(self.pod_cpu, i)
+        self.pod_mem = np.delete(self.pod_mem, i)
+        self.pod_priority = np.delete(self.pod_priority, i)
+        self.pod_placed = np.delete(self.pod_placed, i)
+        self.pod_node = np.delete(self.pod_node, i)
+        self.pod_service = np.delete(self.pod_service, i)
+
+    def append_node(self, node: Node) -> None:
+        self.node_ids.append(node.id)
+        self.node_cpu = np.append(self.node_cpu, node.cpu_capacity)
+        self.node_mem = np.append(self.node_mem, node.mem_capacity)
+
+    def delete_node(self, j: int) -> None:
+        # このノード上のPodは、存在しないノードに配置されている扱いになる
+        del self.node_ids[j]
+        self.node_cpu = np.delete(self.node_cpu, j)
+        self.node_mem = np.delete(self.node_mem, j)
+        self.pod_node = np.where(
+            self.pod_node == j, -1, self.pod_node - (self.pod_node > j)
+        )
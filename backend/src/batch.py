@@ -0,0 +1,144 @@
+import json
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Union
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from . import metrics, parallel
+from .arrays import ClusterArrays
+from .models import (
+    ActionType,
+    AnealingSettings,
+    BatchOptimizationRequest,
+    BatchOptimizationResponse,
+    BatchScenario,
+    ClusterState,
+    OptimizationResponse,
+    ScenarioResult,
+)
+from .sessions import ClusterSession
+from .solver import solve_prepared
+
+
+def _scenario_settings(
+    base: AnealingSettings, overrides: Dict, index: int
+) -> AnealingSettings:
+    unknown = sorted(set(overrides) - set(AnealingSettings.model_fields))
+    if unknown:
+        # 綴りを誤った上書きを黙って無視しない
+        raise HTTPException(
+            status_code=422,
+            detail=f"scenarios[{index}].settings: 不明な設定です: {', '.join(unknown)}",
+        )
+    try:
+        return AnealingSettings.model_validate({**base.model_dump(), **overrides})
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"scenarios[{index}].settings: {e}")
+
+
+def _structure_key(scenario: BatchScenario, settings: AnealingSettings) -> str:
+    """
+    シナリオのインスタンスの構造 (候補ノードと配置しなくてもよいPod) を決める
+    差分と設定を表すキーを返します。重みだけが違うシナリオは同じキーになります。
+    """
+    return json.dumps(
+        {
+            "deltas": [delta.model_dump(mode="json") for delta in scenario.deltas],
+            "max_candidates": settings.max_candidates,
+        },
+        sort_keys=True,
+    )
+
+
+def _solve_scenario(
+    state: ClusterState,
+    arrays: ClusterArrays,
+    data: dict,
+    settings: AnealingSettings,
+    initial_placement: Optional[Dict[str, str]] = None,
+) -> Union[OptimizationResponse, str]:
+    """
+    1つのシナリオを解きます。解けなければ理由を返します。
+    """
+    try:
+        return solve_prepared(state, arrays, data, settings, initial_placement)
+    except HTTPException as e:
+        # HTTPExceptionはプロセス間で復元できない
+        return str(e.detail)
+
+
+def _solve_group(
+    tasks: List[tuple], in_worker: bool = False
+) -> List[Union[OptimizationResponse, str]]:
+    """
+    構造が同じシナリオを同じプロセスで順に解き、評価済みのインスタンスを使い回します。
+    ワーカーでは入れ子のプールを作らず、期限付きのSAもワーカーの中で実行します。
+    """
+    with parallel.in_process() if in_worker else nullcontext():
+        return [_solve_scenario(*task) for task in tasks]
+
+
+def solve_batch(request: BatchOptimizationRequest) -> BatchOptimizationResponse:
+    """
+    基準の状態を一度だけ解析して係数を計算し、シナリオごとに差分だけを適用して解きます。
+    重みだけが違うシナリオは同じプロセスで順に解いてインスタンスを共有し、
+    構造の違うシナリオのグループを並列に解きます。
+    差分や設定が不正なシナリオがあれば、どのシナリオも解かずに失敗します。
+    """
+    with metrics.stage("prepare"):
+        base = ClusterSession("base", request.state, request.settings)
+        scenario_settings = [
+            _scenario_settings(request.settings, scenario.settings, i)
+            for i, scenario in enumerate(request.scenarios)
+        ]
+        groups: Dict[str, List[int]] = {}
+        for i, (scenario, settings) in enumerate(
+            zip(request.scenarios, scenario_settings)
+        ):
+            groups.setdefault(_structure_key(scenario, settings), []).append(i)
+
+        sessions: List[ClusterSession] = []
+        for i, scenario in enumerate(request.scenarios):
+            session = base.fork(f"scenario-{i}")
+            try:
+                session.apply(scenario.deltas)
+            except HTTPException as e:
+                raise HTTPException(
+                    status_code=e.status_code, detail=f"scenarios[{i}].{e.detail}"
+                )
+            settings = scenario_settings[i]
+            if len(groups) > 1:
+                # グループ単位で並列に解くため、各シナリオ内では分割しない
+                settings = settings.model_copy(update={"num_workers": 1})
+            session.update_settings(settings)
+            sessions.append(session)
+
+    tasks = [
+        (s.state, s.arrays, s.data, s.settings, request.initial_placement)
+        for s in sessions
+    ]
+    group_outcomes = parallel.run_parallel(
+        _solve_group,
+        [([tasks[i] for i in members], len(groups) > 1) for members in groups.values()],
+    )
+    outcomes: List[Union[OptimizationResponse, str]] = [""] * len(sessions)
+    for members, solved in zip(groups.values(), group_outcomes):
+        for i, outcome in zip(members, solved):
+            outcomes[i] = outcome
+
+    results = []
+    for scenario, outcome in zip(request.scenarios, outcomes):
+        if isinstance(outcome, str):
+            results.append(ScenarioResult(name=scenario.name, error=outcome))
+            continue
+        results.append(
+            ScenarioResult(
+                name=scenario.name,
+                placements=outcome.placements,
+                energy=outcome.energy,
+                moves=sum(a.action == ActionType.MOVE for a in outcome.placements),
+                engine=outcome.engine,
+            )
+        )
+    return BatchOptimizationResponse(results=results)
@@ -0,0 +1,160 @@
+import io
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+
+from .arrays import ClusterArrays
+from .models import AnealingSettings, OptimizationResponse, ServiceProfile
+
+# 列形式のリクエスト/レスポンス (NumPyの .npz)
+NPZ_MEDIA_TYPE = "application/x-npz"
+_SERVICES = TypeAdapter(List[ServiceProfile])
+
+
+@dataclass
+class ColumnarResult:
+    """
+    列形式の最適化結果。target はノードのインデックス (配置されなかったPodは -1)。
+    """
+
+    pod_ids: List[str]
+    node_ids: List[str]
+    target: np.ndarray  # (P,)
+    actions: np.ndarray  # (P,) ActionType の値 ("move", "keep", ...)
+    energy: float
+    engine: str
+
+    def to_npz(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            pod_ids=np.asarray(self.pod_ids, dtype=str),
+            node_ids=np.asarray(self.node_ids, dtype=str),
+            target=self.target.astype(np.int64),
+            actions=self.actions.astype(str),
+            energy=np.float64(self.energy),
+            engine=np.str_(self.engine),
+        )
+        return buffer.getvalue()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pod_ids": list(self.pod_ids),
+            "node_ids": list(self.node_ids),
+            "target": self.target.tolist(),
+            "actions": self.actions.tolist(),
+            "energy": self.energy,
+            "engine": self.engine,
+        }
+
+    @classmethod
+    def from_response(
+        cls, response: OptimizationResponse, node_ids: List[str]
+    ) -> "ColumnarResult":
+        """
+        JSON形式のレスポンスを列形式に変換します。
+        """
+        node_index = {node_id: n for n, node_id in enumerate(node_ids)}
+        return cls(
+            pod_ids=[action.pod_id for action in response.placements],
+            node_ids=node_ids,
+            target=np.fromiter(
+                (node_index.get(a.target_node_id, -1) for a in response.placements),
+                np.int64,
+                len(response.placements),
+            ),
+            actions=np.asarray(
+                [action.action.value for action in response.placements], dtype=str
+            ),
+            energy=response.energy,
+            engine=response.engine or "",
+        )
+
+
+def _invalid(detail: str) -> HTTPException:
+    return HTTPException(status_code=422, detail=f"列形式のリクエストが不正です: {detail}")
+
+
+def read_columnar_request(
+    body: bytes,
+) -> tuple[
+    ClusterArrays, AnealingSettings, Optional[Dict[str, str]], List[ServiceProfile]
+]:
+    """
+    .npz のリクエストを、Podのモデルを作らずに ClusterArrays に変換します。
+
+    必須: node_ids, node_cpu, node_mem, pod_ids, pod_cpu, pod_mem
+    任意: pod_priority (既定 1), pod_node (ノードのインデックス、未配置は -1),
+          pod_placed (存在しないノードに配置されているPodを True にする),
+          service_ids と pod_service (サービスのインデックス、未所属は -1),
+          settings と initial_placement (JSON文字列),
+          services (ServiceProfile のリストのJSON文字列、オートスケールに使う)
+    """
+    try:
+        npz = np.load(io.BytesIO(body), allow_pickle=False)
+        columns = {key: npz[key] for key in npz.files}
+    except Exception as e:
+        raise _invalid(f".npz として読み込めません ({e})")
+
+    for key in ("node_ids", "node_cpu", "node_mem", "pod_ids", "pod_cpu", "pod_mem"):
+        if key not in columns:
+            raise _invalid(f"{key} がありません")
+
+    num_nodes, num_pods = len(columns["node_ids"]), len(columns["pod_ids"])
+
+    def column(key: str, dtype: Any, length: int, default: Any) -> np.ndarray:
+        value = columns.get(key)
+        if value is None:
+            return np.full(length, default, dtype=dtype)
+        if value.shape != (length,):
+            raise _invalid(f"{key} の形状は ({length},) である必要があります")
+        try:
+            return value.astype(dtype)
+        except (TypeError, ValueError):
+            raise _invalid(f"{key} を {np.dtype(dtype)} に変換できません")
+
+    pod_node = column("pod_node", np.int64, num_pods, -1)
+    if ((pod_node < -1) | (pod_node >= num_nodes)).any():
+        raise _invalid("pod_node に範囲外のインデックスがあります")
+    service_ids = [str(s) for s in columns.get("service_ids", np.zeros(0, str))]
+    pod_service = column("pod_service", np.int64, num_pods, -1)
+    if ((pod_service < -1) | (pod_service >= len(service_ids))).any():
+        raise _invalid("pod_service に範囲外のインデックスがあります")
+
+    arrays = ClusterArrays(
+        node_ids=[str(n) for n in columns["node_ids"]],
+        pod_ids=[str(p) for p in columns["pod_ids"]],
+        service_ids=service_ids,
+        node_cpu=column("node_cpu", float, num_nodes, 0.0),
+        node_mem=column("node_mem", float, num_nodes, 0.0),
+        pod_cpu=column("pod_cpu", float, num_pods, 0.0),
+        pod_mem=column("pod_mem", float, num_pods, 0.0),
+        pod_priority=column("pod_priority", float, num_pods, 1.0),
+        pod_placed=column("pod_placed", bool, num_pods, False) | (pod_node >= 0),
+        pod_node=pod_node,
+        pod_service=pod_service,
+    )
+
+    try:
+        settings = AnealingSettings.model_validate_json(
+            str(columns["settings"]) if "settings" in columns else "{}"
+        )
+    except ValidationError as e:
+        raise _invalid(f"settings: {e}")
+    initial_placement = None
+    if "initial_placement" in columns:
+        try:
+            initial_placement = json.loads(str(columns["initial_placement"]))
+        except json.JSONDecodeError as e:
+            raise _invalid(f"initial_placement: {e}")
+    try:
+        services = _SERVICES.validate_json(
+            str(columns["services"]) if "services" in columns else "[]"
+        )
+    except ValidationError as e:
+        raise _invalid(f"services: {e}")
+    return arrays, settings, initial_placement, services
@@ -0,0 +1,360 @@
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from . import metrics
+from .models import AnealingSettings
+from .qubo import pod_services
+
+# エンジンの共通インターフェース
+# (instance_data, candidates, settings, initial) -> (x[p, n] == 1 の辞書, 目的関数値)
+Engine = Callable[
+    [Dict[str, Any], np.ndarray, AnealingSettings, Optional[np.ndarray]],
+    tuple[dict[tuple[int, ...], float], float],
+]
+
+
+class _Placement:
+    """
+    各Podの割り当て先 (P,) と、目的関数の差分計算に使うノードごとの集計を保持します。
+    """
+
+    def __init__(self, instance_data: Dict[str, Any]) -> None:
+        self.cpu_req = np.asarray(instance_data["cpuReq"], dtype=float)
+        self.mem_req = np.asarray(instance_data["memReq"], dtype=float)
+        self.cpu_cap = np.asarray(instance_data["cpuCap"], dtype=float)
+        self.mem_cap = np.asarray(instance_data["memCap"], dtype=float)
+        self.move_cost = np.asarray(instance_data["moveCost"], dtype=float)
+        self.w_lb = instance_data["loadBalanceWeight"]
+        self.w_mc = instance_data["moveCostWeight"]
+        self.w_aa = instance_data["antiAffinityWeight"]
+        self.w_d = instance_data["desireWeight"]
+        self.desire = np.asarray(instance_data["desire"], dtype=float)
+        self.optional = np.asarray(instance_data["optional"]) > 0
+
+        num_pods, num_nodes = len(self.cpu_req), len(self.cpu_cap)
+        self.ideal_cpu = self.cpu_req.sum() / self.cpu_cap.sum() * self.cpu_cap
+        self.ideal_mem = self.mem_req.sum() / self.mem_cap.sum() * self.mem_cap
+        service_members = instance_data["serviceMembers"]
+        self.service = pod_services(service_members, num_pods)
+
+        self.node = np.full(num_pods, -1, dtype=np.int64)
+        self.cpu_load = np.zeros(num_nodes)
+        self.mem_load = np.zeros(num_nodes)
+        # service_count[s, n]: ノード n 上のサービス s のPod数
+        self.service_count = np.zeros((len(service_members), num_nodes))
+
+    def place(self, p: int, n: int) -> None:
+        """
+        Pod p をノード n に置きます。n が -1 なら未配置にします。
+        """
+        old = self.node[p]
+        if old >= 0:
+            self.cpu_load[old] -= self.cpu_req[p]
+            self.mem_load[old] -= self.mem_req[p]
+            if self.service[p] >= 0:
+                self.service_count[self.service[p], old] -= 1
+        self.node[p] = n
+        if n < 0:
+            return
+        self.cpu_load[n] += self.cpu_req[p]
+        self.mem_load[n] += self.mem_req[p]
+        if self.service[p] >= 0:
+            self.service_count[self.service[p], n] += 1
+
+    def assign(self, target: np.ndarray) -> None:
+        """
+        割り当て先 (P,) の配置に置き換えます。-1 のPodは未配置にします。
+        """
+        num_nodes = len(self.cpu_cap)
+        self.node = target.astype(np.int64)
+        placed = self.node >= 0
+        nodes = self.node[placed]
+        self.cpu_load = np.bincount(
+            nodes, weights=self.cpu_req[placed], minlength=num_nodes
+        )
+        self.mem_load = np.bincount(
+            nodes, weights=self.mem_req[placed], minlength=num_nodes
+        )
+        self.service_count[:] = 0.0
+        grouped = placed & (self.service >= 0)
+        np.add.at(self.service_count, (self.service[grouped], self.node[grouped]), 1.0)
+
+    def overcommitted(self) -> np.ndarray:
+        """
+        CPUまたはメモリの使用量が容量を超えているノードのマスク (N,) を返します。
+        """
+        tolerance = 1e-9
+        return (self.cpu_load > self.cpu_cap * (1 + tolerance)) | (
+            self.mem_load > self.mem_cap * (1 + tolerance)
+        )
+
+    def affinity(self, pods: np.ndarray) -> np.ndarray:
+        """
+        pods を各ノードに置いたときに同居する同じサービスのPodとのアンチアフィニティ
+        (len(pods), N) を返します。組は両方向に数えます。
+        """
+        service = self.service[pods]
+        others = self.service_count[service] * (service >= 0)[:, None]
+        # 自身が配置されているノードでは自身を数えない
+        placed = self.node[pods] >= 0
+        others[np.flatnonzero(placed), self.node[pods][placed]] -= 1
+        return 2 * np.maximum(others, 0.0)
+
+    def insert_cost(self, pods: np.ndarray) -> np.ndarray:
+        """
+        未配置の pods を各ノードに置いたときの目的関数の増分 (len(pods), N) を返します。
+        """
+        c = self.cpu_req[pods, None]
+        m = self.mem_req[pods, None]
+        load_balance = (
+            c**2
+            + 2 * c * (self.cpu_load - self.ideal_cpu)
+            + m**2
+            + 2 * m * (self.mem_load - self.ideal_mem)
+        )
+        return (
+            self.w_lb * load_balance
+            + self.w_mc * self.move_cost[pods]
+            + self.w_aa * self.affinity(pods)
+            - self.w_d * self.desire[pods, None]
+        )
+
+    def removal_delta(self, pods: np.ndarray) -> np.ndarray:
+        """
+        配置済みの pods を現在のノードから取り除いたときの目的関数の増分 (len(pods),) を返します。
+        """
+        rows = np.arange(len(pods))
+        c, m = self.cpu_req[pods], self.mem_req[pods]
+        cur = self.node[pods]
+        removal = self.w_lb * (
+            c**2
+            - 2 * c * (self.cpu_load[cur] - self.ideal_cpu[cur])
+            + m**2
+            - 2 * m * (self.mem_load[cur] - self.ideal_mem[cur])
+        )
+        removal -= self.w_mc * self.move_cost[pods, cur]
+        removal -= self.w_aa * self.affinity(pods)[rows, cur]
+        return removal + self.w_d * self.desire[pods]
+
+    def move_delta(self, pods: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        pods (省略時は全Pod) を各ノードへ移したときの目的関数の増分 (len(pods), N) を返します。
+        未配置のPodは、そのノードに置いたときの増分です。
+        """
+        if pods is None:
+            pods = np.arange(len(self.node))
+        delta = self.insert_cost(pods)
+        placed = np.flatnonzero(self.node[pods] >= 0)
+        if len(placed):
+            delta[placed] += self.removal_delta(pods[placed])[:, None]
+            delta[placed, self.node[pods[placed]]] = 0.0
+        return delta
+
+    def fits(self, pods: np.ndarray) -> np.ndarray:
+        """
+        pods が現在の空き容量に収まるノードのマスク (len(pods), N) を返します。
+        """
+        cpu_free = self.cpu_cap - self.cpu_load
+        mem_free = self.mem_cap - self.mem_load
+        return (self.cpu_req[pods, None] <= cpu_free) & (
+            self.mem_req[pods, None] <= mem_free
+        )
+
+    def terms(self) -> Dict[str, float]:
+        """
+        目的関数の各項 (重みを掛けた値) を返します。合計が energy() です。
+        """
+        pods = np.flatnonzero(self.node >= 0)
+        load_balance = ((self.cpu_load - self.ideal_cpu) ** 2).sum() + (
+            (self.mem_load - self.ideal_mem) ** 2
+        ).sum()
+        move_cost = self.move_cost[pods, self.node[pods]].sum()
+        # 同居する同じサービスのPodの組 (両方向に数える)
+        anti_affinity = (self.service_count * (self.service_count - 1)).sum()
+        desire = self.desire[pods].sum()
+        return {
+            "load_balance": float(self.w_lb * load_balance),
+            "move_cost": float(self.w_mc * move_cost),
+            "anti_affinity": float(self.w_aa * anti_affinity),
+            "desire": float(-self.w_d * desire),
+        }
+
+    def energy(self) -> float:
+        terms = self.terms()
+        return (
+            terms["load_balance"]
+            + terms["move_cost"]
+            + terms["anti_affinity"]
+            + terms["desire"]
+        )
+
+    def to_sample(self) -> dict[tuple[int, ...], float]:
+        return {(p, n): 1.0 for p, n in enumerate(self.node.tolist()) if n >= 0}
+
+
+def _greedy(
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    initial: Optional[np.ndarray] = None,
+) -> _Placement:
+    """
+    大きいPodから順に、容量に収まる候補ノードのうち目的関数の増分が最小のノードに置きます。
+    optional のPodは、収まるノードがないか置くと目的関数が増える場合は置きません。
+    initial (P, N) で割り当て済みのPodは、その配置のまま固定します。
+    """
+    placement = _Placement(instance_data)
+    num_pods = len(placement.node)
+
+    fixed = np.zeros(num_pods, dtype=bool)
+    if initial is not None:
+        fixed = initial.sum(axis=1) == 1
+        for p in np.flatnonzero(fixed):
+            placement.place(p, int(np.argmax(initial[p])))
+
+    # 容量に対する大きさの降順 (Best-Fit Decreasing)
+    size = np.maximum(
+        placement.cpu_req / placement.cpu_cap.max(),
+        placement.mem_req / placement.mem_cap.max(),
+    )
+    for p in np.flatnonzero(~fixed)[np.argsort(-size[~fixed], kind="stable")]:
+        cost = placement.insert_cost(np.array([p]))[0]
+        cost[~candidates[p]] = np.inf
+        # どこにも収まらない場合は、容量を無視して増分が最小のノードに置く
+        fits = placement.fits(np.array([p]))[0] & candidates[p]
+        if fits.any() or placement.optional[p]:
+            cost[~fits] = np.inf
+        if placement.optional[p] and not cost.min() < 0:
+            continue
+        placement.place(p, int(np.argmin(cost)))
+    return placement
+
+
+def _refine(
+    placement: _Placement,
+    candidates: np.ndarray,
+    deadline: Optional[float] = None,
+    max_iterations: Optional[int] = None,
+) -> _Placement:
+    """
+    目的関数が最も下がる1Podの移動 (optional のPodは取り除くことも含む) を、
+    改善がなくなるか期限まで繰り返します。
+    容量に収まらないノードへの移動は行いません。
+    """
+    num_pods = len(placement.node)
+    if max_iterations is None:
+        max_iterations = 10 * num_pods
+    for _ in range(max_iterations):
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        delta = placement.move_delta()
+        delta[~(candidates & placement.fits(np.arange(num_pods)))] = np.inf
+        p, n = np.unravel_index(np.argmin(delta), delta.shape)
+        best = delta[p, n]
+        droppable = np.flatnonzero(placement.optional & (placement.node >= 0))
+        if len(droppable):
+            drop = placement.removal_delta(droppable)
+            if drop.min() < best:
+                p, n, best = droppable[np.argmin(drop)], -1, drop.min()
+        if not best < -1e-9:
+            break
+        placement.place(int(p), int(n))
+    return placement
+
+
+def repair_capacity(
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    target: np.ndarray,
+) -> tuple[np.ndarray, List[int], float, np.ndarray, np.ndarray]:
+    """
+    容量を超えているノード上のPodのうち、空きのある候補ノードへ移したとき
+    (optional のPodは取り除いたとき) の目的関数の増分が最小のものを移す操作を、
+    容量超過がなくなるまで繰り返します。
+    (修復後の割り当て先, 移したPod, 目的関数の増分, 修復前に容量を超えていたノード,
+    修復後も容量を超えているノード) を返します。
+    """
+    placement = _Placement(instance_data)
+    placement.assign(target)
+    overcommitted = np.flatnonzero(placement.overcommitted())
+
+    moved: List[int] = []
+    energy_delta = 0.0
+    # 今の空きではPodを移せないノード
+    # (Podを移すと移し元のノードが空くため、移すたびに確認し直す)
+    stuck = np.zeros(len(placement.cpu_cap), dtype=bool)
+    # 移した先は容量に収まるため、同じPodを2度移すことはなく、移すまでに
+    # 移せないと判定するノードは高々ノード数
+    for _ in range((len(target) + 1) * (len(stuck) + 1)):
+        over = placement.overcommitted() & ~stuck
+        if not over.any():
+            break
+        # 超過の割合が最も大きいノードから、その上のPodだけを対象に移し先を探す
+        excess = np.maximum(
+            placement.cpu_load / placement.cpu_cap,
+            placement.mem_load / placement.mem_cap,
+        )
+        j = int(np.flatnonzero(over)[np.argmax(excess[over])])
+        pods = np.flatnonzero(placement.node == j)
+        delta = placement.move_delta(pods)
+        delta[~(candidates[pods] & placement.fits(pods))] = np.inf
+        delta[:, j] = np.inf
+        # 最後の列: 取り除く
+        drop = np.full(len(pods), np.inf)
+        optional = placement.optional[pods]
+        drop[optional] = placement.removal_delta(pods[optional])
+        delta = np.hstack([delta, drop[:, None]])
+        i, n = np.unravel_index(np.argmin(delta), delta.shape)
+        if not np.isfinite(delta[i, n]):
+            stuck[j] = True
+            continue
+        placement.place(int(pods[i]), int(n) if n < len(stuck) else -1)
+        stuck[:] = False
+        moved.append(int(pods[i]))
+        energy_delta += float(delta[i, n])
+
+    return (
+        placement.node,
+        moved,
+        energy_delta,
+        overcommitted,
+        np.flatnonzero(placement.overcommitted()),
+    )
+
+
+def solve_greedy(
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    settings: AnealingSettings,
+    initial: Optional[np.ndarray] = None,
+) -> tuple[dict[tuple[int, ...], float], float]:
+    """
+    NumPyで増分を計算する貪欲法 (Best-Fit Decreasing) で配置します。
+    """
+    with metrics.stage("search"):
+        placement = _greedy(instance_data, candidates, initial)
+    metrics.observe_problem("greedy", int(candidates.sum()))
+    return placement.to_sample(), placement.energy()
+
+
+def solve_local_search(
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    settings: AnealingSettings,
+    initial: Optional[np.ndarray] = None,
+    deadline: Optional[float] = None,
+) -> tuple[dict[tuple[int, ...], float], float]:
+    """
+    貪欲法の結果から、1Podずつの移動による局所探索で改善します。
+    settings.local_search_budget_ms か deadline (time.monotonic() の値) を過ぎたら、
+    その時点の配置を返します。
+    """
+    budget = time.monotonic() + settings.local_search_budget_ms / 1000
+    deadline = budget if deadline is None else min(deadline, budget)
+    with metrics.stage("search"):
+        placement = _refine(
+            _greedy(instance_data, candidates, initial), candidates, deadline
+        )
+    metrics.observe_problem("local_search", int(candidates.sum()))
+    return placement.to_sample(), placement.energy()
@@ -0,0 +1,108 @@
+from typing import Dict, Optional
+
+import numpy as np
+from fastapi import HTTPException
+
+from .arrays import ClusterArrays
+from .engines import _Placement
+from .models import (
+    ActionType,
+    AnealingSettings,
+    ClusterState,
+    EnergyTerms,
+    EvaluationResponse,
+    NodeEvaluation,
+)
+from .solver import _ACTION_CODES, _action_codes, _current_nodes, _prepare_data
+
+
+def _evaluated_targets(
+    arrays: ClusterArrays, assignment: Optional[Dict[str, Optional[str]]]
+) -> np.ndarray:
+    """
+    Podごとの割り当て先 (P,) を返します。assignment に含まれないPodは現在のノード
+    (存在しないノード上のPodと新規の候補は未配置 -1) のままです。
+    """
+    target = arrays.pod_node.copy()
+    if not assignment:
+        return target
+
+    pod_index = {pod_id: p for p, pod_id in enumerate(arrays.pod_ids)}
+    node_index = {node_id: n for n, node_id in enumerate(arrays.node_ids)}
+    unknown_pods = [pod_id for pod_id in assignment if pod_id not in pod_index]
+    if unknown_pods:
+        raise HTTPException(
+            status_code=422, detail=f"Podが見つかりません: {', '.join(unknown_pods)}"
+        )
+    unknown_nodes = sorted(
+        {n for n in assignment.values() if n is not None and n not in node_index}
+    )
+    if unknown_nodes:
+        raise HTTPException(
+            status_code=422, detail=f"Nodeが見つかりません: {', '.join(unknown_nodes)}"
+        )
+
+    rows = np.fromiter(
+        (pod_index[pod_id] for pod_id in assignment), np.int64, len(assignment)
+    )
+    target[rows] = np.fromiter(
+        (-1 if n is None else node_index[n] for n in assignment.values()),
+        np.int64,
+        len(assignment),
+    )
+    return target
+
+
+def evaluate_placement(
+    state: ClusterState,
+    assignment: Optional[Dict[str, Optional[str]]] = None,
+    settings: AnealingSettings = AnealingSettings(),
+) -> EvaluationResponse:
+    """
+    最適化せずに、割り当ての目的関数値とその内訳を計算します。
+    /optimize と同じ係数 (オートスケーリングの desire を含む) を使うため、
+    ソルバーの結果を評価すると、そのエネルギーと一致します。
+    """
+    if not state.nodes or not state.pods:
+        raise HTTPException(
+            status_code=400, detail="ノードまたはポッドの情報が不足しています。"
+        )
+
+    instance_data, _, arrays = _prepare_data(state, settings)
+    target = _evaluated_targets(arrays, assignment)
+    placement = _Placement(instance_data)
+    placement.assign(target)
+    terms = placement.terms()
+
+    # 係数は桁を調整した値のため、元の単位に戻す
+    cpu_scale = 10**settings.cpu_digit_adjustment
+    mem_scale = 10**settings.mem_digit_adjustment
+    over = placement.overcommitted()
+    cpu_over = np.where(over, np.maximum(placement.cpu_load - placement.cpu_cap, 0), 0)
+    mem_over = np.where(over, np.maximum(placement.mem_load - placement.mem_cap, 0), 0)
+    columns = {
+        "cpu_load": placement.cpu_load / cpu_scale,
+        "mem_load": placement.mem_load / mem_scale,
+        "cpu_deviation": (placement.cpu_load - placement.ideal_cpu) / cpu_scale,
+        "mem_deviation": (placement.mem_load - placement.ideal_mem) / mem_scale,
+        "cpu_overcommit": cpu_over / cpu_scale,
+        "mem_overcommit": mem_over / mem_scale,
+    }
+    rows = np.column_stack(list(columns.values())).tolist()
+    nodes = [
+        NodeEvaluation(node_id=node_id, **dict(zip(columns, row)))
+        for node_id, row in zip(arrays.node_ids, rows)
+    ]
+
+    codes = _action_codes(target, _current_nodes(arrays))
+    count = placement.service_count
+    unplaced = np.flatnonzero(~placement.optional & (target < 0))
+    return EvaluationResponse(
+        energy=sum(terms.values()),
+        terms=EnergyTerms(**terms),
+        nodes=nodes,
+        overcommitted_nodes=[arrays.node_ids[n] for n in np.flatnonzero(over)],
+        anti_affinity_pairs=int((count * (count - 1)).sum()) // 2,
+        moves=int((codes == _ACTION_CODES[ActionType.MOVE]).sum()),
+        unplaced_pods=[arrays.pod_ids[p] for p in unplaced.tolist()],
+    )
@@ -0,0 +1,230 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import SyncManager
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from .models import (
+    JobInfo,
+    JobRequest,
+    JobStatus,
+    OptimizationResponse,
+)
+
+_FINISHED = {
+    JobStatus.SUCCEEDED,
+    JobStatus.FAILED,
+    JobStatus.CANCELLED,
+    JobStatus.EXPIRED,
+}
+
+
+class JobExpired(Exception):
+    """
+    ジョブが実行を開始する前に期限を過ぎました。
+    """
+
+
+def _run_job(
+    request: JobRequest, cancelled: Any, deadline: Optional[float]
+) -> OptimizationResponse:
+    # ワーカープロセス側で実行される
+    # deadline はプロセス間で比較できるよう time.time() の時刻
+    from . import parallel
+    from .solver import SolveCancelled, cancel_event, solve_placement
+
+    if cancelled.is_set():
+        raise SolveCancelled()
+    settings = request.settings
+    if deadline is not None:
+        remaining_ms = int((deadline - time.time()) * 1000)
+        if remaining_ms <= 0:
+            raise JobExpired()
+        # 期限までに結果を返すよう、残り時間を deadline_ms として渡す
+        if settings.deadline_ms is None or settings.deadline_ms > remaining_ms:
+            settings = settings.model_copy(update={"deadline_ms": remaining_ms})
+
+    cancel_event.set(cancelled)
+    try:
+        return solve_placement(request.state, settings, request.initial_placement)
+    except HTTPException as e:
+        # HTTPExceptionはプロセス間で復元できないため、詳細だけを返す
+        raise RuntimeError(e.detail) from None
+    finally:
+        # num_workers > 1 で作られた入れ子のプールは、ワーカーの終了を妨げないよう閉じる
+        parallel.shutdown(wait=True)
+
+
+class _Job:
+    def __init__(
+        self,
+        job_id: str,
+        executor: ProcessPoolExecutor,
+        future: Future,
+        cancelled: Any,
+        deadline: Optional[float],
+    ):
+        self.id = job_id
+        self.executor = executor
+        self.future = future
+        self.cancelled = cancelled
+        self.deadline = deadline
+        self.status = JobStatus.QUEUED
+        self.finished_at: Optional[float] = None
+
+    def finish(self, status: JobStatus) -> None:
+        if status in (JobStatus.CANCELLED, JobStatus.EXPIRED):
+            # 待機中なら取り消し、実行中ならワーカーにバッチの間で打ち切らせる
+            self.future.cancel()
+            self.cancelled.set()
+        self.status = status
+        self.finished_at = time.monotonic()
+
+
+class JobManager:
+    """
+    最適化ジョブをプロセスプールで非同期に実行します。
+    実行中・待機中のジョブ数が max_pending に達したら、新しいジョブを受け付けません。
+
+    ジョブごとに共有のイベントを渡し、キャンセルや期限切れの際に設定します。
+    ワーカーはSAのバッチや段階の間でイベントを確認して打ち切るため、枠はすぐに空きます。
+    期限は残り時間を deadline_ms としてワーカーに渡し、開始前に過ぎていれば実行しません。
+    """
+
+    def __init__(
+        self, max_workers: int = 2, max_pending: int = 16, result_ttl: float = 600.0
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager: Optional[SyncManager] = None
+        self._jobs: Dict[str, _Job] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # サーバーのスレッドを引き継がないよう spawn で起動する
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _drop_executor(self, executor: ProcessPoolExecutor) -> None:
+        # ワーカーが異常終了したプールは使えないため、次の投入で作り直す
+        if self._executor is executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_manager(self) -> SyncManager:
+        if self._manager is None:
+            # ワーカーと共有するイベントを管理するプロセス
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager
+
+    def _submit(
+        self, request: JobRequest, cancelled: Any, deadline: Optional[float]
+    ) -> tuple[ProcessPoolExecutor, Future]:
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(_run_job, request, cancelled, deadline)
+        except BrokenProcessPool:
+            self._drop_executor(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(_run_job, request, cancelled, deadline)
+
+    def submit(self, request: JobRequest) -> JobInfo:
+        with self._lock:
+            self._refresh()
+            pending = sum(
+                1 for job in self._jobs.values() if job.status not in _FINISHED
+            )
+            if pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=429,
+                    detail="ジョブが混み合っています。時間をおいて再度送信してください。",
+                )
+
+            deadline = wall_deadline = None
+            if request.deadline_ms is not None:
+                deadline = time.monotonic() + request.deadline_ms / 1000
+                wall_deadline = time.time() + request.deadline_ms / 1000
+
+            cancelled = self._get_manager().Event()
+            job = _Job(
+                uuid.uuid4().hex,
+                *self._submit(request, cancelled, wall_deadline),
+                cancelled,
+                deadline,
+            )
+            self._jobs[job.id] = job
+            return self._info(job)
+
+    def get(self, job_id: str) -> JobInfo:
+        with self._lock:
+            self._refresh()
+            return self._info(self._find(job_id))
+
+    def cancel(self, job_id: str) -> JobInfo:
+        with self._lock:
+            self._refresh()
+            job = self._find(job_id)
+            if job.status not in _FINISHED:
+                job.finish(JobStatus.CANCELLED)
+            return self._info(job)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status not in _FINISHED:
+                    job.finish(JobStatus.CANCELLED)
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+
+    def _find(self, job_id: str) -> _Job:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="ジョブが見つかりません。")
+        return job
+
+    def _refresh(self) -> None:
+        # ジョブの状態を更新し、期限切れのジョブと古い結果を整理する
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.status in _FINISHED:
+                if job.future.done() and now - job.finished_at > self.result_ttl:
+                    del self._jobs[job_id]
+                continue
+
+            if job.future.done():
+                error = job.future.exception()
+                if error is None:
+                    job.finish(JobStatus.SUCCEEDED)
+                elif isinstance(error, JobExpired):
+                    job.finish(JobStatus.EXPIRED)
+                else:
+                    if isinstance(error, BrokenProcessPool):
+                        self._drop_executor(job.executor)
+                    job.finish(JobStatus.FAILED)
+            elif job.deadline is not None and now > job.deadline:
+                job.finish(JobStatus.EXPIRED)
+            elif job.future.running():
+                job.status = JobStatus.RUNNING
+
+    def _info(self, job: _Job) -> JobInfo:
+        info = JobInfo(id=job.id, status=job.status)
+        if job.status == JobStatus.SUCCEEDED:
+            info.result = job.future.result()
+        elif job.status == JobStatus.FAILED:
+            info.error = str(job.future.exception())
+        return info
@@ -0,0 +1,144 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import Counter, Histogram
+
+# 記録はヒストグラムへの加算だけで、集計はスクレイプ時にのみ行われる
+STAGE_SECONDS = Histogram(
+    "kytos_solver_stage_seconds",
+    "最適化の段階ごとの所要時間",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+OPTIMIZE_SECONDS = Histogram(
+    "kytos_optimize_seconds",
+    "solve_placementの所要時間",
+    ["engine"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+OPTIMIZE_TOTAL = Counter(
+    "kytos_optimize_total", "最適化の実行回数", ["engine", "status"]
+)
+VARIABLES = Histogram(
+    "kytos_solver_variables",
+    "ソルバーに渡した決定変数の数",
+    ["engine"],
+    buckets=(10, 100, 1_000, 3_000, 10_000, 30_000, 100_000, 1_000_000),
+)
+INTERACTIONS = Histogram(
+    "kytos_solver_interactions",
+    "QUBOの二次項の数 (one-hot制約のペナルティ項を含む)",
+    ["engine"],
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000),
+)
+READS = Counter("kytos_solver_reads_total", "SAの読み出し回数", ["engine"])
+FEASIBLE_RATIO = Histogram(
+    "kytos_solver_feasible_ratio",
+    "読み出しのうち実行可能解だった割合",
+    ["engine"],
+    buckets=(0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0),
+)
+
+# 現在の最適化の段階ごとの時間 (レスポンスに含める場合のみ設定する)
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "kytos_timings", default=None
+)
+# リクエストの受信時刻 (検証にかかった時間の計測用)
+request_started: ContextVar[Optional[float]] = ContextVar(
+    "kytos_request_started", default=None
+)
+# Trueの間は記録しない (ウォームアップの求解が実際の負荷の分布に混ざらないように)
+_disabled: ContextVar[bool] = ContextVar("kytos_metrics_disabled", default=False)
+
+
+@contextmanager
+def disabled() -> Iterator[None]:
+    """
+    ブロック内ではメトリクスを記録しません (段階ごとの時間の収集も含む)。
+    """
+    token = _disabled.set(True)
+    try:
+        yield
+    finally:
+        _disabled.reset(token)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    if _disabled.get():
+        return
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    ブロックの所要時間を段階 name として記録します。
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+@contextmanager
+def observe_solve(engine: str) -> Iterator[None]:
+    """
+    最適化全体の所要時間と、成功・失敗の回数を記録します。
+    """
+    if _disabled.get():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        OPTIMIZE_TOTAL.labels(engine, "error").inc()
+        raise
+    OPTIMIZE_SECONDS.labels(engine).observe(time.perf_counter() - start)
+    OPTIMIZE_TOTAL.labels(engine, "ok").inc()
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """
+    ブロック内で記録された段階ごとの時間を辞書に集めます。
+    """
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def observe_validation() -> None:
+    """
+    リクエストの受信からハンドラの開始まで (JSONの解析とPydanticの検証) を記録します。
+    """
+    started = request_started.get()
+    if started is not None:
+        observe_stage("validate", time.perf_counter() - started)
+
+
+def observe_problem(
+    engine: str,
+    variables: int,
+    interactions: Optional[int] = None,
+    num_reads: Optional[int] = None,
+    num_feasible: Optional[int] = None,
+) -> None:
+    if _disabled.get():
+        return
+    VARIABLES.labels(engine).observe(variables)
+    if interactions is not None:
+        INTERACTIONS.labels(engine).observe(interactions)
+    if num_reads:
+        READS.labels(engine).inc(num_reads)
+        if num_feasible is not None:
+            FEASIBLE_RATIO.labels(engine).observe(num_feasible / num_reads)
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+class _StageStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        # ヒット1回あたりの節約時間は、ミス時の平均構築時間で見積もる
+        avg_build = self.build_seconds / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "build_seconds": self.build_seconds,
+            "saved_seconds": avg_build * self.hits,
+        }
+
+
+class ModelCache:
+    """
+    問題形状ごとに、コンパイル済みのモデルと評価済みインスタンスをキャッシュします。
+    ステージ(problem, instance, penalty_weights)ごとにヒット/ミス数と節約時間を記録します。
+    最後に使われてから古い順に、件数・合計バイト数 (sizeof で見積もった値) の上限を
+    超えた分を破棄します。
+    """
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 512 * 2**20) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple[str, Hashable], tuple[Any, int]]" = (
+            OrderedDict()
+        )
+        self._bytes = 0
+        self._stats: Dict[str, _StageStats] = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(
+        self,
+        stage: str,
+        key: Hashable,
+        builder: Callable[[], T],
+        sizeof: Optional[Callable[[T], int]] = None,
+    ) -> T:
+        """
+        sizeof を省略した値は、小さいものとしてバイト数に数えません。
+        """
+        cache_key = (stage, key)
+        with self._lock:
+            stats = self._stats.setdefault(stage, _StageStats())
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                stats.hits += 1
+                return self._entries[cache_key][0]
+
+        start = time.perf_counter()
+        value = builder()
+        elapsed = time.perf_counter() - start
+        size = 0 if sizeof is None else sizeof(value)
+
+        with self._lock:
+            stats.misses += 1
+            stats.build_seconds += elapsed
+            if size > self.max_bytes:
+                return value
+            if cache_key in self._entries:
+                self._bytes -= self._entries.pop(cache_key)[1]
+            self._entries[cache_key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+        return value
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {stage: s.as_dict() for stage, s in self._stats.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._stats.clear()
+
+
+def digest_instance_data(instance_data: Dict[str, Any]) -> str:
+    """
+    インスタンスデータ(係数)のハッシュを計算します。
+    """
+    h = hashlib.sha256()
+    for key in sorted(instance_data):
+        value = instance_data[key]
+        h.update(key.encode())
+        if isinstance(value, np.ndarray):
+            h.update(f"{value.dtype}{value.shape}".encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        else:
+            h.update(json.dumps(value).encode())
+    return h.hexdigest()
@@ -1,7 +1,7 @@
-from typing import List, Optional
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
 
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 from enum import Enum
@@ -52,12 +52,44 @@ class AnealingSettings(BaseModel):
     one_hot_relaxed_weight: float = 50.0
     cpu_digit_adjustment: float = -1.5
     mem_digit_adjustment: float = -3
-    num_reads: int = 100
+    num_reads: int = Field(default=100, ge=1)  # adaptive の場合は上限
+    # fixed: num_reads を一度に読み出す
+    # adaptive: sampling_batch_reads ずつ読み出し、改善が止まるか時間切れで打ち切る
+    sampling: Literal["fixed", "adaptive"] = "fixed"
+    sampling_batch_reads: int = Field(default=10, ge=1)
+    # 最良の実行可能解が改善しないバッチがこの数続いたら打ち切る
+    sampling_patience: int = Field(default=3, ge=1)
+    # これ以下の改善 (相対値) は改善とみなさない
+    sampling_tolerance: float = Field(default=1e-6, ge=0)
+    # 読み出しに使う時間の上限
+    sampling_budget_ms: Optional[int] = Field(default=None, ge=1)
+    # num_readsを分割して並列に実行するプロセス数
+    num_workers: int = Field(default=1, ge=1)
+    seed: Optional[int] = None  # ワーカーごとのシードはここから決定的に導出する
+    # qubo: jijmodelingを経由せず目的関数を直接QUBOに展開する
+    # greedy: 貪欲法, local_search: 貪欲法の結果を局所探索で改善する
+    engine: Literal["jijmodeling", "qubo", "greedy", "local_search"] = "jijmodeling"
+    # 指定した場合、この時間内に見つかった最良の配置を返す (SAが失敗しても貪欲法の解を返す)
+    deadline_ms: Optional[int] = Field(default=None, gt=0)
+    # 局所探索 (local_search, および deadline_ms 指定時の局所探索) に使う時間の上限
+    local_search_budget_ms: int = Field(default=1000, ge=1)
+    # サンプリング後、容量を超えたノードからPodを移して容量を守る
+    repair_capacity: bool = True
+    # 移動計画を、容量とサービスの可用性を守って並列に実行できるウェーブに分けて返す
+    migration_waves: bool = False
+    # Podごとの候補ノード数の上限 (None: 全ノード)
+    max_candidates: Optional[int] = Field(default=None, ge=1)
+    warm_start: bool = False  # 現在の配置から短い低温スケジュールで開始する
+    warm_start_num_sweeps: int = Field(default=100, ge=1)
+    # 開始温度でone-hot違反が受理される確率
+    warm_start_acceptance: float = Field(default=0.1, gt=0, lt=1)
 
 
 class OptimizationRequest(BaseModel):
     state: ClusterState
     settings: AnealingSettings = AnealingSettings()
+    initial_placement: Optional[Dict[str, str]] = None  # Pod ID -> Node ID (前回の結果)
+    bypass_cache: bool = False  # Trueなら結果キャッシュを使わずに最適化し直す
 
 
 class ActionType(Enum):
@@ -73,7 +105,213 @@ class Action(BaseModel):
     action: ActionType
 
 
+class VariableStats(BaseModel):
+    total: int  # 枝刈り前の変数数 (Pod数 × Node数)
+    used: int  # ソルバーに渡した変数数
+    reduction: float  # 削減率 (0 to 1)
+
+
+class CapacityRepair(BaseModel):
+    overcommitted_nodes: List[str]  # ソルバーの解で容量を超えていたノード
+    moved_pods: List[str]  # 修復のために移したPod
+    energy_delta: float  # 修復による目的関数の増分
+    unresolved_nodes: List[str] = []  # 修復後も容量を超えているノード
+
+
+class SamplingPoint(BaseModel):
+    reads: int  # それまでの読み出し数
+    best_energy: Optional[float] = None  # それまでの最良の実行可能解 (なければ None)
+
+
+class SamplingStats(BaseModel):
+    num_reads: int  # 実際に使った読み出し数
+    num_feasible: int
+    # 打ち切った理由 (num_reads: 上限まで読み出した)
+    stopped: Literal["num_reads", "patience", "budget"]
+    curve: List[SamplingPoint]  # バッチごとの読み出し数と最良エネルギー
+
+
+class MigrationPlan(BaseModel):
+    # 順に実行するアクションのリスト。同じウェーブのアクションは並列に実行できる
+    waves: List[List[Action]]
+    staged_pods: List[str] = []  # 空きを作るため、一時的に別のノードへ移したPod
+    overcommitted_nodes: List[str] = []  # 容量の超過を避けられなかったノード
+    unavailable_services: List[str] = []  # 稼働中のレプリカを残せなかったサービス
+
+
 class OptimizationResponse(BaseModel):
     pods: List[Pod]
     placements: List[Action]
     energy: float
+    # アクションごとのPod数 (作成しなかった新規の候補は含まない)
+    summary: Optional[Dict[str, int]] = None
+    variables: Optional[VariableStats] = None
+    engine: Optional[str] = None  # 結果を出したエンジン
+    repair: Optional[CapacityRepair] = None  # 容量超過を修復した場合のみ
+    sampling: Optional[SamplingStats] = None  # SAの読み出しの記録 (SAを実行した場合のみ)
+    # 移動計画のウェーブ (settings.migration_waves の場合のみ)
+    migration: Optional[MigrationPlan] = None
+    timings: Optional[Dict[str, float]] = None  # 段階ごとの所要時間 (秒)
+    cached: bool = False  # 結果キャッシュから返した場合はTrue
+
+
+class PlacementUpdate(BaseModel):
+    energy: float  # それまでの最良の実行可能解の目的関数値
+    # それまでのSAの読み出し数 (貪欲法・局所探索の解は None)
+    num_reads: Optional[int] = None
+    # 前回の更新から変わったPodのアクションのみ (最初の更新は全Pod)
+    placements: List[Action]
+    final: bool = False  # 最後の更新 (容量超過の修復後の最終結果)
+    # 以下は最後の更新のみ
+    engine: Optional[str] = None
+    variables: Optional[VariableStats] = None
+    repair: Optional[CapacityRepair] = None
+    sampling: Optional[SamplingStats] = None
+
+
+class JobRequest(OptimizationRequest):
+    deadline_ms: Optional[int] = None  # 受付からこの時間内に終わらなければ打ち切る
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"
+
+
+class JobInfo(BaseModel):
+    id: str
+    status: JobStatus
+    result: Optional[OptimizationResponse] = None
+    error: Optional[str] = None
+
+
+class SessionCreateRequest(BaseModel):
+    state: ClusterState
+    settings: AnealingSettings = AnealingSettings()
+
+
+class AddPod(BaseModel):
+    op: Literal["add_pod"] = "add_pod"
+    pod: Pod
+
+
+class RemovePod(BaseModel):
+    op: Literal["remove_pod"] = "remove_pod"
+    pod_id: str
+
+
+class ResizePod(BaseModel):
+    op: Literal["resize_pod"] = "resize_pod"
+    pod_id: str
+    cpu_usage: Optional[float] = None  # in milliCPU
+    mem_usage: Optional[float] = None  # in MiB
+
+
+class MovePod(BaseModel):
+    op: Literal["move_pod"] = "move_pod"
+    pod_id: str
+    node_id: Optional[str] = None  # None なら未配置に戻す
+
+
+class AddNode(BaseModel):
+    op: Literal["add_node"] = "add_node"
+    node: Node
+
+
+class DrainNode(BaseModel):
+    op: Literal["drain_node"] = "drain_node"
+    node_id: str  # ノードを取り除き、その上のPodを退避対象にする
+
+
+SessionDelta = Annotated[
+    Union[AddPod, RemovePod, ResizePod, MovePod, AddNode, DrainNode],
+    Field(discriminator="op"),
+]
+
+
+class SessionUpdate(BaseModel):
+    deltas: List[SessionDelta]
+
+
+class SessionOptimizeRequest(BaseModel):
+    settings: Optional[AnealingSettings] = None  # 省略時はセッション作成時の設定
+    initial_placement: Optional[Dict[str, str]] = None
+
+
+class SessionInfo(BaseModel):
+    id: str
+    num_pods: int
+    num_nodes: int
+
+
+class BatchScenario(BaseModel):
+    name: Optional[str] = None
+    # 基準の状態に適用する差分 (drain_node, add_pod など)
+    deltas: List[SessionDelta] = []
+    settings: Dict[str, Any] = {}  # 基準の設定から上書きする項目 (重みなど)
+
+
+class BatchOptimizationRequest(BaseModel):
+    state: ClusterState
+    settings: AnealingSettings = AnealingSettings()
+    scenarios: List[BatchScenario] = Field(min_length=1)
+    initial_placement: Optional[Dict[str, str]] = None
+
+
+class ScenarioResult(BaseModel):
+    name: Optional[str] = None
+    placements: List[Action] = []
+    energy: Optional[float] = None
+    moves: int = 0  # 移動するPodの数
+    engine: Optional[str] = None
+    error: Optional[str] = None  # 解けなかった場合の理由
+
+
+class BatchOptimizationResponse(BaseModel):
+    results: List[ScenarioResult]  # scenarios と同じ順序
+
+
+class EvaluationRequest(BaseModel):
+    state: ClusterState
+    settings: AnealingSettings = AnealingSettings()
+    # Pod ID -> Node ID (null は配置しない)。含まれないPodは current_node のまま
+    assignment: Dict[str, Optional[str]] = {}
+
+
+class EnergyTerms(BaseModel):
+    # 重みを掛けた目的関数の各項 (合計が energy)
+    load_balance: float
+    move_cost: float
+    anti_affinity: float
+    desire: float
+
+
+class NodeEvaluation(BaseModel):
+    node_id: str
+    cpu_load: float  # 割り当てたPodの使用量の合計
+    mem_load: float
+    cpu_deviation: float  # 容量に比例して配分した理想の負荷との差
+    mem_deviation: float
+    cpu_overcommit: float = 0.0  # 容量を超えた量
+    mem_overcommit: float = 0.0
+
+
+class EvaluationResponse(BaseModel):
+    energy: float  # ソルバーと同じ目的関数値 (制約のペナルティは含まない)
+    terms: EnergyTerms
+    nodes: List[NodeEvaluation]
+    overcommitted_nodes: List[str]  # 容量を超えているノード
+    anti_affinity_pairs: int  # 同じノードに同居する同じサービスのPodの組の数
+    moves: int  # 現在のノードから移動するPodの数
+    unplaced_pods: List[str]  # 配置されていない (optional でない) Pod
+
+
+class ReadinessInfo(BaseModel):
+    # starting: ウォームアップ中, failed: ウォームアップが失敗した
+    status: Literal["starting", "ready", "failed"]
+    warmup_seconds: Optional[float] = None  # ウォームアップの所要時間 (終わった場合のみ)
+    error: Optional[str] = None
@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+# 設定されている間は、プールを使わずに現在のプロセスで実行する
+_in_process: ContextVar[bool] = ContextVar("kytos_in_process", default=False)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=int(
+                    os.environ.get("KYTOS_SAMPLING_WORKERS", os.cpu_count() or 1)
+                ),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def split_reads(num_reads: int, num_workers: int) -> List[int]:
+    """
+    num_reads をワーカー数で分割します。読み出しが0になるワーカーは作りません。
+    """
+    num_workers = max(1, min(num_workers, num_reads))
+    base, extra = divmod(num_reads, num_workers)
+    return [base + (1 if i < extra else 0) for i in range(num_workers)]
+
+
+def worker_seeds(seed: Optional[int], num_workers: int) -> List[Optional[int]]:
+    """
+    ワーカーごとに決定的で互いに独立なシードを作ります。
+    """
+    if seed is None:
+        return [None] * num_workers
+    children = np.random.SeedSequence(seed).spawn(num_workers)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+@contextmanager
+def in_process() -> Iterator[None]:
+    """
+    この中では run_parallel も期限付きのSAもプールを使わず、現在のプロセスで実行します。
+    プールのワーカーの中から、入れ子のプールを作らないために使います。
+    """
+    token = _in_process.set(True)
+    try:
+        yield
+    finally:
+        _in_process.reset(token)
+
+
+def run_parallel(fn: Callable[..., Any], args_list: Sequence[tuple]) -> List[Any]:
+    """
+    fn(*args) をサンプリング用のプロセスプールで並列に実行し、結果を順に返します。
+    タスクが1つだけの場合と in_process() の中では、現在のプロセスで順に実行します。
+    """
+    if len(args_list) == 1 or _in_process.get():
+        return [fn(*args) for args in args_list]
+    executor = _get_executor()
+    futures = [executor.submit(fn, *args) for args in args_list]
+    return [future.result() for future in futures]
+
+
+def is_warm() -> bool:
+    """
+    サンプリング用のプロセスプールが作られ、ワーカーが起動済みかを返します。
+    in_process() の中では常に False です。
+    """
+    if _in_process.get():
+        return False
+    with _lock:
+        return _executor is not None and bool(_executor._processes)
+
+
+def submit(fn: Callable[..., Any], *args: Any) -> Future:
+    """
+    fn(*args) をサンプリング用のプロセスプールで実行します。
+    """
+    return _get_executor().submit(fn, *args)
+
+
+def shutdown(wait: bool = False) -> None:
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait, cancel_futures=True)
+            _executor = None
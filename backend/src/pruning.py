@@ -0,0 +1,63 @@
+from typing import Optional
+
+import numpy as np
+
+from .arrays import ClusterArrays
+
+
+def select_candidates(
+    arrays: ClusterArrays, max_candidates: Optional[int]
+) -> np.ndarray:
+    """
+    Podごとに配置候補となるノードを最大 max_candidates 個まで選び、(P, N) のマスクを返します。
+    現在のノードは常に候補に含めます。残りは容量に収まるノードのうち、
+    空き容量が大きく同じサービスのPodが少ないノードを優先します。
+    """
+    num_pods, num_nodes = arrays.num_pods, arrays.num_nodes
+    if max_candidates is None or max_candidates >= num_nodes:
+        return np.ones((num_pods, num_nodes), dtype=bool)
+    k = max(1, max_candidates)
+
+    # そもそも容量に収まらないノードは候補にしない
+    fits = (arrays.pod_cpu[:, None] <= arrays.node_cpu[None, :]) & (
+        arrays.pod_mem[:, None] <= arrays.node_mem[None, :]
+    )
+    is_current = arrays.pod_node[:, None] == np.arange(num_nodes)[None, :]
+
+    # 現在の配置での各ノードの空き容量 (使用率の余裕)
+    placed = arrays.pod_node >= 0
+    cpu_load = np.bincount(
+        arrays.pod_node[placed], weights=arrays.pod_cpu[placed], minlength=num_nodes
+    )
+    mem_load = np.bincount(
+        arrays.pod_node[placed], weights=arrays.pod_mem[placed], minlength=num_nodes
+    )
+    headroom = np.minimum(
+        1.0 - cpu_load / arrays.node_cpu, 1.0 - mem_load / arrays.node_mem
+    )
+    score = np.broadcast_to(headroom, (num_pods, num_nodes)).copy()
+
+    # 同じサービスのPodが既にいるノードは、1つにつき空き容量1つ分不利にする
+    in_service = placed & (arrays.pod_service >= 0)
+    if in_service.any():
+        service_count = np.zeros((len(arrays.service_ids), num_nodes))
+        np.add.at(
+            service_count,
+            (arrays.pod_service[in_service], arrays.pod_node[in_service]),
+            1.0,
+        )
+        has_service = arrays.pod_service >= 0
+        score[has_service] -= service_count[arrays.pod_service[has_service]]
+
+    score[~fits] = -np.inf
+    score[is_current] = np.inf
+
+    top = np.argpartition(-score, k - 1, axis=1)[:, :k]
+    mask = np.zeros((num_pods, num_nodes), dtype=bool)
+    mask[np.arange(num_pods)[:, None], top] = True
+    mask &= fits | is_current
+
+    # どこにも収まらないPodは、最も空いているノードだけを候補に残す
+    empty = ~mask.any(axis=1)
+    mask[np.flatnonzero(empty), np.argmax(headroom)] = True
+    return mask
@@ -0,0 +1,219 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# これを超える変数数では密行列ではなく辞書形式でサンプラーに渡す
+DENSE_MAX_VARIABLES = 3000
+
+
+@dataclass
+class QuboModel:
+    """
+    jijmodelingを経由せずに、目的関数の各項を閉じた形で展開したQUBO。
+    変数 v は (var_pod[v], var_node[v]) の割り当て x[p, n] に対応します。
+    """
+
+    num_pods: int
+    num_nodes: int
+    var_pod: np.ndarray  # (V,)
+    var_node: np.ndarray  # (V,)
+    linear: np.ndarray  # (V,) 目的関数の一次係数
+    rows: np.ndarray  # (K,) 二次項の変数 (rows < cols)
+    cols: np.ndarray  # (K,)
+    values: np.ndarray  # (K,)
+    constant: float  # 目的関数の定数項
+    one_hot_weight: float
+    optional: Optional[np.ndarray] = None  # (P,) bool, 配置しなくてもよいPod
+
+    @property
+    def num_variables(self) -> int:
+        return len(self.var_pod)
+
+    def _one_hot_pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        # 同じPodに属する変数の組 (one-hot制約のペナルティ項)
+        rows, cols = [], []
+        order = np.argsort(self.var_pod, kind="stable")
+        bounds = np.searchsorted(self.var_pod[order], np.arange(self.num_pods + 1))
+        for p in range(self.num_pods):
+            members = order[bounds[p] : bounds[p + 1]]
+            i, j = np.triu_indices(len(members), 1)
+            rows.append(members[i])
+            cols.append(members[j])
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def penalized(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        one-hot制約 weight * (sum_n x[p, n] - 1)^2 を加えたQUBOを返します。
+        optional のPodは、スラック u[p] = 1 - sum_n x[p, n] を消去した
+        weight * sum_{n<m} 2 x[p, n] x[p, m] (2つ以上の割り当てのみを罰する) になります。
+        """
+        w = self.one_hot_weight
+        oh_rows, oh_cols = self._one_hot_pairs()
+        required = np.ones(self.num_variables, dtype=bool)
+        if self.optional is not None:
+            required = ~self.optional[self.var_pod]
+        linear = self.linear - w * required
+        rows = np.concatenate([self.rows, oh_rows])
+        cols = np.concatenate([self.cols, oh_cols])
+        values = np.concatenate([self.values, np.full(len(oh_rows), 2.0 * w)])
+        return linear, rows, cols, values
+
+    def to_sampler_input(self) -> np.ndarray | Dict[tuple[int, int], float]:
+        linear, rows, cols, values = self.penalized()
+        if self.num_variables <= DENSE_MAX_VARIABLES:
+            q = np.diag(linear)
+            np.add.at(q, (rows, cols), values)
+            return q
+
+        q: Dict[tuple[int, int], float] = {}
+        for v, coeff in enumerate(linear.tolist()):
+            q[(v, v)] = coeff
+        for i, j, coeff in zip(rows.tolist(), cols.tolist(), values.tolist()):
+            q[(i, j)] = q.get((i, j), 0.0) + coeff
+        return q
+
+    def objective(self, samples: np.ndarray) -> np.ndarray:
+        """
+        (reads, V) のサンプルに対する目的関数値 (ペナルティ項を除く) を返します。
+        """
+        samples = np.atleast_2d(samples).astype(float)
+        quad = (samples[:, self.rows] * samples[:, self.cols]) @ self.values
+        return samples @ self.linear + quad + self.constant
+
+    def feasible(self, samples: np.ndarray) -> np.ndarray:
+        """
+        (reads, V) のサンプルのうち、各Podの割り当てが1つ (optional のPodは1つ以下) のもの。
+        """
+        counts = self.to_assignment(samples).sum(axis=2)
+        if self.optional is None:
+            return (counts == 1).all(axis=1)
+        return ((counts == 1) | (self.optional & (counts == 0))).all(axis=1)
+
+    def to_assignment(self, samples: np.ndarray) -> np.ndarray:
+        """
+        (reads, V) のサンプルを (reads, P, N) の割り当てに変換します。
+        """
+        samples = np.atleast_2d(samples)
+        x = np.zeros((len(samples), self.num_pods, self.num_nodes), dtype=np.int8)
+        x[:, self.var_pod, self.var_node] = samples
+        return x
+
+
+def pod_services(service_members: List[List[int]], num_pods: int) -> np.ndarray:
+    """
+    serviceMembers (サービスごとの所属Pod) から、各Podのサービスのインデックス (P,) を返します。
+    サービスに属さないPodは -1 です。
+    """
+    service = np.full(num_pods, -1, dtype=np.int64)
+    for s, members in enumerate(service_members):
+        service[np.asarray(members, dtype=np.int64)] = s
+    return service
+
+
+def build_qubo(
+    instance_data: Dict[str, Any],
+    one_hot_weight: float,
+    candidates: Optional[np.ndarray] = None,
+) -> QuboModel:
+    """
+    _prepare_dataの係数から、目的関数をQUBOに直接展開します。
+    _define_problemの目的関数と同じエネルギーになります。
+    candidates (P, N) を指定した場合は、Trueの割り当てのみを変数にします。
+    """
+    cpu_req = np.asarray(instance_data["cpuReq"], dtype=float)
+    mem_req = np.asarray(instance_data["memReq"], dtype=float)
+    cpu_cap = np.asarray(instance_data["cpuCap"], dtype=float)
+    mem_cap = np.asarray(instance_data["memCap"], dtype=float)
+    move_cost = np.asarray(instance_data["moveCost"], dtype=float)
+    w_lb = instance_data["loadBalanceWeight"]
+    w_mc = instance_data["moveCostWeight"]
+    w_aa = instance_data["antiAffinityWeight"]
+    w_d = instance_data["desireWeight"]
+
+    num_pods, num_nodes = len(cpu_req), len(cpu_cap)
+    service = pod_services(instance_data["serviceMembers"], num_pods)
+    if candidates is None:
+        candidates = np.ones((num_pods, num_nodes), dtype=bool)
+    var_pod, var_node = np.nonzero(candidates)
+
+    ideal_cpu = cpu_req.sum() / cpu_cap.sum() * cpu_cap
+    ideal_mem = mem_req.sum() / mem_cap.sum() * mem_cap
+
+    # 負荷分散: (sum_p x c_p - ideal_n)^2 を展開 (x^2 = x)
+    c, m = cpu_req[var_pod], mem_req[var_pod]
+    linear = w_lb * (
+        c**2 + m**2 - 2 * c * ideal_cpu[var_node] - 2 * m * ideal_mem[var_node]
+    )
+    constant = w_lb * float((ideal_cpu**2 + ideal_mem**2).sum())
+
+    # 移動コスト
+    linear += w_mc * move_cost[var_pod, var_node]
+
+    # 配置意欲: 配置すると -desire だけ下がる
+    desire = np.asarray(instance_data["desire"], dtype=float)
+    linear -= w_d * desire[var_pod]
+
+    # 同じノード上のPodの組: 負荷分散の交差項とアンチアフィニティ
+    rows, cols, values = [], [], []
+    order = np.argsort(var_node, kind="stable")
+    bounds = np.searchsorted(var_node[order], np.arange(num_nodes + 1))
+    for n in range(num_nodes):
+        members = order[bounds[n] : bounds[n + 1]]
+        i, j = np.triu_indices(len(members), 1)
+        vi, vj = members[i], members[j]
+        pi, pj = var_pod[vi], var_pod[vj]
+        coeff = 2 * w_lb * (cpu_req[pi] * cpu_req[pj] + mem_req[pi] * mem_req[pj])
+        coeff += 2 * w_aa * ((service[pi] == service[pj]) & (service[pi] >= 0))
+        rows.append(vi)
+        cols.append(vj)
+        values.append(coeff)
+
+    return QuboModel(
+        num_pods=num_pods,
+        num_nodes=num_nodes,
+        var_pod=var_pod,
+        var_node=var_node,
+        linear=linear,
+        rows=np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+        cols=np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64),
+        values=np.concatenate(values) if values else np.zeros(0),
+        constant=constant,
+        one_hot_weight=one_hot_weight,
+        optional=np.asarray(instance_data["optional"]) > 0,
+    )
+
+
+def sample_qubo(
+    model: QuboModel,
+    num_reads: int,
+    seed: Optional[int] = None,
+    initial_state: Optional[np.ndarray] = None,
+    num_sweeps: Optional[int] = None,
+    beta_min: Optional[float] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    openjijのSAでサンプリングし、(reads, V) のサンプルと目的関数値を返します。
+    initial_state (V,) を指定した場合は、全ての読み出しをその状態から開始します。
+    """
+    # 読み込みに時間がかかるため、使うときに読み込む
+    import openjij as oj
+
+    q = model.to_sampler_input()
+    response = oj.SASampler().sample_qubo(
+        q,
+        num_reads=num_reads,
+        seed=seed,
+        initial_state=(
+            dict(enumerate(initial_state.tolist()))
+            if initial_state is not None
+            else None
+        ),
+        num_sweeps=num_sweeps,
+        beta_min=beta_min,
+    )
+
+    # 辞書形式の場合は変数の並びがラベル順とは限らない
+    samples = np.zeros((len(response.record.sample), model.num_variables), np.int8)
+    samples[:, np.asarray(response.variables, dtype=np.int64)] = response.record.sample
+    return samples, model.objective(samples)
@@ -0,0 +1,215 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .models import OptimizationResponse
+
+# レスポンスのうち記録しない項目 (pods は placements から復元できる)
+_EXCLUDED_FIELDS = {"pods", "timings"}
+# gzipのメンバーの先頭 (マジックナンバーと圧縮方式 deflate)
+_GZIP_MAGIC = b"\x1f\x8b\x08"
+
+logger = logging.getLogger(__name__)
+
+
+class Recorder:
+    """
+    /optimize のリクエストとレスポンス、所要時間を、gzipで圧縮したJSON Linesとして追記します。
+    1件ごとに独立したgzipのメンバーとして書くため、途中で止まっても前の記録は読めます。
+    ファイルが max_bytes を超えたら path.1, path.2, ... に移し、keep 個より古いものは削除します。
+    書き込みは別スレッドで行い、リクエストの処理を待たせません。
+    path が None なら何も記録しません。
+    """
+
+    def __init__(
+        self, path: Optional[str] = None, max_bytes: int = 64 * 2**20, keep: int = 5
+    ) -> None:
+        self.path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0  # 書き込めなかった記録の数
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def record(
+        self,
+        request: str,
+        response: OptimizationResponse,
+        seconds: float,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """
+        記録を書き込みキューに加えます。request は最適化の前にJSONにしたリクエストです
+        (最適化はリクエストの state を書き換えるため)。
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="kytos-recorder", daemon=True
+                )
+                self._thread.start()
+        recorded_at = datetime.now(timezone.utc).isoformat()
+        self._queue.put((recorded_at, request, response, seconds, timings))
+
+    def flush(self) -> None:
+        """
+        キューにある記録をすべて書き込むまで待ちます。
+        """
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            try:
+                self._write(self._encode(*item))
+            except Exception:
+                # 記録の失敗で最適化を止めない
+                self.dropped += 1
+
+    def _encode(
+        self,
+        recorded_at: str,
+        request: str,
+        response: OptimizationResponse,
+        seconds: float,
+        timings: Optional[Dict[str, float]],
+    ) -> bytes:
+        record = {
+            "recorded_at": recorded_at,
+            "seconds": seconds,
+            "timings": timings,
+            "request": json.loads(request),
+            "response": response.model_dump(mode="json", exclude=_EXCLUDED_FIELDS),
+        }
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        return gzip.compress(line.encode())
+
+    def _write(self, data: bytes) -> None:
+        path = self.path
+        if path.exists() and path.stat().st_size + len(data) > self.max_bytes:
+            self._rotate()
+        with open(path, "ab") as f:
+            f.write(data)
+
+    def _rotate(self) -> None:
+        path = self.path
+        oldest = path.with_name(f"{path.name}.{self.keep}")
+        if oldest.exists():
+            oldest.unlink()
+        for i in range(self.keep - 1, 0, -1):
+            rotated = path.with_name(f"{path.name}.{i}")
+            if rotated.exists():
+                os.replace(rotated, path.with_name(f"{path.name}.{i + 1}"))
+        if self.keep > 0:
+            os.replace(path, path.with_name(f"{path.name}.1"))
+        else:
+            path.unlink()
+
+
+def log_files(path: str) -> List[Path]:
+    """
+    記録のファイルを古い順に返します (path.N, ..., path.1, path)。
+    """
+    base = Path(path)
+    rotated = sorted(
+        (p for p in base.parent.glob(f"{base.name}.*") if p.suffix[1:].isdigit()),
+        key=lambda p: -int(p.suffix[1:]),
+    )
+    return rotated + ([base] if base.exists() else [])
+
+
+class RecordReader:
+    """
+    記録のファイルを1件ずつ読みます。書きかけで切れた最後の記録は読み飛ばします。
+    途中の記録が壊れている・切れている場合は、次の記録の先頭を探して読み続けます
+    (skipped に数え、警告をログに出します)。
+    """
+
+    def __init__(self, path: str | Path, chunk_size: int = 2**16) -> None:
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.skipped = 0  # 読み飛ばした壊れた記録の数
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with open(self.path, "rb") as f:
+            buffer = bytearray()
+            offset = 0  # buffer の先頭のファイル内の位置
+            start = 0  # 読んでいる記録の buffer 内の位置
+
+            def fill() -> bool:
+                # 読み終えた記録を捨ててから、次の chunk を加える
+                nonlocal offset, start
+                chunk = f.read(self.chunk_size)
+                if chunk:
+                    del buffer[:start]
+                    offset += start
+                    start = 0
+                    buffer.extend(chunk)
+                return bool(chunk)
+
+            while start < len(buffer) or fill():
+                decompressor = zlib.decompressobj(wbits=31)
+                parts: List[bytes] = []
+                fed = 0  # 展開器に渡した start 以降のバイト数
+                try:
+                    while not decompressor.eof:
+                        if start + fed == len(buffer) and not fill():
+                            break
+                        data = bytes(buffer[start + fed :])
+                        fed += len(data)
+                        parts.append(decompressor.decompress(data))
+                    if decompressor.eof:
+                        # 1つの chunk に複数のメンバーの境界が含まれることがある
+                        fed -= len(decompressor.unused_data)
+                        record = json.loads(b"".join(parts))
+                        start += fed
+                        yield record
+                        continue
+                    corrupted = False
+                except (zlib.error, ValueError):
+                    corrupted = True
+
+                # 次の記録の先頭から読み直す
+                found = buffer.find(_GZIP_MAGIC, start + 1)
+                while found < 0 and fill():
+                    found = buffer.find(_GZIP_MAGIC, start + 1)
+                if found < 0 and not corrupted:
+                    # 書きかけで切れた最後の記録
+                    return
+                self.skipped += 1
+                logger.warning(
+                    "壊れた記録を読み飛ばしました: %s (%d バイト目から)",
+                    self.path,
+                    offset + start,
+                )
+                if found < 0:
+                    return
+                start = found
+
+
+def read_records(path: str | Path) -> Iterator[Dict[str, Any]]:
+    """
+    記録のファイルを1件ずつ読みます (RecordReader を参照)。
+    """
+    return iter(RecordReader(path))
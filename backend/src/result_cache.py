@@ -0,0 +1,141 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from .models import (
+    AnealingSettings,
+    ClusterState,
+    OptimizationResponse,
+)
+
+
+def digest_request(
+    state: ClusterState,
+    settings: AnealingSettings,
+    initial_placement: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    クラスタの状態と設定の正規化したハッシュを計算します。
+    nodes, pods, services の並び順には依存しません。
+    """
+
+    def canonical(items: list) -> list:
+        dumped = [item.model_dump(mode="json") for item in items]
+        return sorted(dumped, key=lambda d: (d["id"], json.dumps(d, sort_keys=True)))
+
+    payload = {
+        "nodes": canonical(state.nodes),
+        "pods": canonical(state.pods),
+        "services": canonical(state.services),
+        "settings": settings.model_dump(mode="json"),
+        "initial_placement": initial_placement,
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class _Entry:
+    def __init__(self, response: OptimizationResponse, expires_at: float) -> None:
+        self.response = response
+        self.size = len(response.model_dump_json())
+        self.expires_at = expires_at
+
+
+class ResultCache:
+    """
+    同一のクラスタ状態と設定に対する最適化結果をキャッシュします。
+    最後に使われてから古い順に、件数・合計バイト数 (JSON換算) の上限を超えた分を破棄し、
+    登録から ttl 秒経った結果は使いません。
+    同じキーの計算が実行中であれば、その完了を待って結果を共有します。
+    """
+
+    def __init__(
+        self, ttl: float = 30.0, max_bytes: int = 64 * 2**20, max_entries: int = 256
+    ) -> None:
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_solve(
+        self,
+        key: str,
+        solve: Callable[[], OptimizationResponse],
+        bypass: bool = False,
+    ) -> OptimizationResponse:
+        """
+        キャッシュされた結果を cached=True で返します。なければ solve() の結果を登録して返します。
+        bypass=True の場合は必ず solve() を実行し、その結果でキャッシュを更新します。
+        """
+        while not bypass:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    self._hits += 1
+                    return entry.response.model_copy(update={"cached": True})
+                waiting = self._inflight.get(key)
+                if waiting is None:
+                    self._misses += 1
+                    self._inflight[key] = threading.Event()
+                    break
+            # 同じ状態の計算が終わるのを待ってから、もう一度探す
+            waiting.wait()
+
+        try:
+            response = solve()
+            with self._lock:
+                self._store(key, response)
+        finally:
+            if not bypass:
+                with self._lock:
+                    self._inflight.pop(key).set()
+        return response
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+    def _lookup(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() > entry.expires_at:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, response: OptimizationResponse) -> None:
+        if key in self._entries:
+            self._remove(key)
+        # 呼び出し側が返したレスポンスを書き換えても影響しないよう、コピーを保持する
+        entry = _Entry(response.model_copy(), time.monotonic() + self.ttl)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        self._bytes -= self._entries.pop(key).size
@@ -1,109 +1,122 @@
-import math
-from typing import List
 import uuid
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+
 from .models import ClusterState, Pod
 
 
-def auto_scale_desired_exsistence(state: ClusterState) -> tuple[list[Pod], list[float]]:
+@dataclass
+class ScalingPlan:
     """
-    Generates a list of pods including existing ones and new candidates based on scaling needs.
-    Assigns 'desire' value to each pod.
+    オートスケーリングの結果。pods は既存のPodを元の順序で並べ、その後に新規の候補を加えたもの。
     """
-    # Calculate margins
-    total_cpu_capacity = sum(n.cpu_capacity for n in state.nodes)
-    total_mem_capacity = sum(n.mem_capacity for n in state.nodes)
-    current_cpu_usage = sum(p.cpu_usage for p in state.pods)
-    current_mem_usage = sum(p.mem_usage for p in state.pods)
 
-    cpu_margin = 1.0 - (current_cpu_usage / total_cpu_capacity)
-    mem_margin = 1.0 - (current_mem_usage / total_mem_capacity)
-    cluster_margin = (cpu_margin + mem_margin) / 2.0
-
-    # Group pods by service
-    pods_by_service = {}
-    for p in state.pods:
-        if p.service:
-            pods_by_service.setdefault(p.service, []).append(p)
+    pods: List[Pod]
+    desire: np.ndarray  # (P,) 配置したい度合い (-1 to 1)
+    optional: np.ndarray  # (P,) bool, 配置しなくてもよいPod
+    replicas: Dict[str, int]  # サービスごとの目標レプリカ数
 
-    pods: List[Pod] = []
-    desires: List[float] = []
-
-    for service in state.services:
-        current_pods: List[Pod] = pods_by_service.get(service.id, [])
-        current_count = len(current_pods)
-
-        cpu_usage_avg = (
-            sum(p.cpu_usage for p in current_pods) / current_count
-            if current_count > 0
-            else 0
-        )
-
-        mem_usage_avg = (
-            sum(p.mem_usage for p in current_pods) / current_count
-            if current_count > 0
-            else 0
-        )
 
-        # Calculate needed
-        needed = math.ceil(
-            service.current_request_rate / service.target_request_rate_per_pod
+def auto_scale_desired_exsistence(state: ClusterState) -> ScalingPlan:
+    """
+    auto_scaling_enabled のサービスについて、目標レプリカ数と各Podの desire を計算し、
+    不足分の新規Podを候補として加えます。
+    サービスをインデックスで表した配列で計算するため、サービス数・Pod数に対して線形です。
+    """
+    pods = state.pods
+    num_pods = len(pods)
+    services = [s for s in state.services if s.auto_scaling_enabled]
+    if not services:
+        return ScalingPlan(
+            pods=list(pods),
+            desire=np.zeros(num_pods),
+            optional=np.zeros(num_pods, dtype=bool),
+            replicas={},
         )
-        desired_count = max(needed, service.min_replicas)  # サービスごとの最小値保証
-        desired_count = max(desired_count, current_count - 2)  # 急激なスケールイン防止
-        desired_count = min(
-            desired_count, current_count + 2
-        )  # 急激なスケールアウト防止
-        if service.max_replicas is not None:
-            desired_count = min(
-                desired_count, service.max_replicas
-            )  # サービスごとの最大値保証
-
-        # Calculate urgency (0 to 1)
-        if current_count > 0:
-            urgency = min(1.0, max(0.0, (needed - current_count) / current_count))
-        else:
-            urgency = 1.0 if desired_count > 0 else 0.0
-
-        # Calculate desire for new pods
-        # High urgency -> close to 1. Low margin -> close to -1.
-        new_pod_desire = urgency - (1.0 - cluster_margin)
-        new_pod_desire = max(-1.0, min(1.0, new_pod_desire))
-
-        if desired_count > current_count:
-            # Scale out: Keep existing, add new
-            for p in current_pods:
-                pods.append(p)
-                desires.append(1.0)  # Strong desire to keep
 
-            num_to_add = desired_count - current_count
-
-            for i in range(num_to_add):
-                new_pod = Pod(
-                    id=f"{service.id}-{uuid.uuid4().hex[:6]}",
-                    cpu_usage=cpu_usage_avg,
-                    mem_usage=mem_usage_avg,
-                    service=service.id,
-                    priority=service.priority,
-                )
-                pods.append(new_pod)
-                desires.append(new_pod_desire)
+    # Calculate margins
+    def _margin(usage: float, capacity: float) -> float:
+        return 1.0 - usage / capacity if capacity > 0 else 0.0
 
-        elif desired_count < current_count:
-            # Scale in: Reduce desire for excess pods
-            for i, p in enumerate(current_pods):
-                if i < desired_count:
-                    pods.append(p)
-                    desires.append(1.0)  # Strong desire to keep
-                else:
-                    desires.append(-1.0)  # Strong desire to remove
-        else:
-            # Keep as is
-            for p in current_pods:
-                pods.append(p)
-                desires.append(1.0)  # Strong desire to keep
-    for p in state.pods:
-        if p not in pods:
-            pods.append(p)
-            desires.append(1.0)  # Strong desire to keep
+    pod_cpu = np.fromiter((p.cpu_usage for p in pods), float, num_pods)
+    pod_mem = np.fromiter((p.mem_usage for p in pods), float, num_pods)
+    cpu_margin = _margin(pod_cpu.sum(), sum(n.cpu_capacity for n in state.nodes))
+    mem_margin = _margin(pod_mem.sum(), sum(n.mem_capacity for n in state.nodes))
+    cluster_margin = (cpu_margin + mem_margin) / 2.0
 
-    return pods, desires
+    # Group pods by service
+    num_services = len(services)
+    service_index = {service.id: s for s, service in enumerate(services)}
+    pod_service = np.fromiter(
+        (service_index.get(p.service, -1) for p in pods), np.int64, num_pods
+    )
+    member = np.flatnonzero(pod_service >= 0)
+    count = np.bincount(pod_service[member], minlength=num_services)
+    cpu_usage_avg = np.divide(
+        np.bincount(pod_service[member], pod_cpu[member], minlength=num_services),
+        count,
+        out=np.zeros(num_services),
+        where=count > 0,
+    )
+    mem_usage_avg = np.divide(
+        np.bincount(pod_service[member], pod_mem[member], minlength=num_services),
+        count,
+        out=np.zeros(num_services),
+        where=count > 0,
+    )
+
+    # Calculate needed
+    rate = np.fromiter((s.current_request_rate for s in services), float)
+    target = np.fromiter((s.target_request_rate_per_pod for s in services), float)
+    min_replicas = np.fromiter((s.min_replicas for s in services), float)
+    max_replicas = np.fromiter(
+        (np.inf if s.max_replicas is None else s.max_replicas for s in services), float
+    )
+    needed = np.ceil(rate / target)
+    desired = np.maximum(needed, min_replicas)  # サービスごとの最小値保証
+    desired = np.maximum(desired, count - 2)  # 急激なスケールイン防止
+    desired = np.minimum(desired, count + 2)  # 急激なスケールアウト防止
+    desired = np.minimum(desired, max_replicas).astype(np.int64)  # 最大値保証
+
+    # Calculate urgency (0 to 1)
+    urgency = np.where(
+        count > 0,
+        np.clip((needed - count) / np.maximum(count, 1), 0.0, 1.0),
+        (desired > 0).astype(float),
+    )
+    # High urgency -> close to 1. Low margin -> close to -1.
+    new_pod_desire = np.clip(urgency - (1.0 - cluster_margin), -1.0, 1.0)
+
+    # 既存のPod: サービス内で先頭から目標数までは残し (1.0)、超えた分は削除したい (-1.0)
+    order = member[np.argsort(pod_service[member], kind="stable")]
+    starts = np.searchsorted(pod_service[order], np.arange(num_services))
+    rank = np.arange(len(order)) - starts[pod_service[order]]
+    desire = np.zeros(num_pods)
+    desire[order] = np.where(rank < desired[pod_service[order]], 1.0, -1.0)
+    # 配置しなくてもよいのは目標数を超えた分だけ (目標数までは必ずどこかに配置する)
+    optional = desire < 0
+
+    # Scale out: 不足分の新規Podを候補として加える
+    num_to_add = np.maximum(desired - count, 0)
+    new_service = np.repeat(np.arange(num_services), num_to_add)
+    new_pods = [
+        # 集計済みの値から組み立てるため、Pydanticの検証を省略する
+        Pod.model_construct(
+            id=f"{services[s].id}-{uuid.uuid4().hex[:6]}",
+            cpu_usage=float(cpu_usage_avg[s]),
+            mem_usage=float(mem_usage_avg[s]),
+            current_node=None,
+            service=services[s].id,
+            priority=services[s].priority,
+        )
+        for s in new_service.tolist()
+    ]
+
+    return ScalingPlan(
+        pods=list(pods) + new_pods,
+        desire=np.concatenate([desire, new_pod_desire[new_service]]),
+        optional=np.concatenate([optional, np.ones(len(new_pods), dtype=bool)]),
+        replicas={service.id: int(d) for service, d in zip(services, desired.tolist())},
+    )
@@ -0,0 +1,350 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+
+from .models import (
+    AddNode,
+    AddPod,
+    AnealingSettings,
+    ClusterState,
+    DrainNode,
+    MovePod,
+    OptimizationResponse,
+    RemovePod,
+    ResizePod,
+    SessionDelta,
+    SessionInfo,
+)
+from .solver import (
+    _base_move_cost,
+    _build_instance_data,
+    _current_rows,
+    _move_cost_rows,
+    _prepare_data,
+    _service_members,
+    solve_prepared,
+)
+
+# 変更されると係数行列を作り直す必要がある設定
+_COEFFICIENT_FIELDS = (
+    "cpu_digit_adjustment",
+    "mem_digit_adjustment",
+    "move_cost_resource_coeff",
+)
+
+
+class ClusterSession:
+    """
+    クラスタの状態と、ソルバーに渡す係数配列を保持します。
+    差分が届いたら、影響を受ける行・列だけを更新します。
+    """
+
+    def __init__(
+        self, session_id: str, state: ClusterState, settings: AnealingSettings
+    ) -> None:
+        self.id = session_id
+        self.settings = settings
+        self.state = state
+        self.lock = threading.Lock()
+        self._prepare()
+
+    def _prepare(self) -> None:
+        # オートスケーリングの計画から係数を作り直す (前回の計画で加えた候補は除く)
+        real = len(self.state.pods)
+        self.data, pods, self.arrays = _prepare_data(self.state, self.settings)
+        self.state.pods = pods
+        self._candidates = {pod.id for pod in pods[real:]}
+        self._reindex_pods()
+
+    def info(self) -> SessionInfo:
+        return SessionInfo(
+            id=self.id, num_pods=self.arrays.num_pods, num_nodes=self.arrays.num_nodes
+        )
+
+    def fork(self, session_id: str) -> "ClusterSession":
+        """
+        状態と係数配列をコピーしたセッションを作ります。解析と係数の計算はやり直しません。
+        """
+        session = ClusterSession.__new__(ClusterSession)
+        session.id = session_id
+        session.settings = self.settings
+        # Podは差分の適用時に置き換えるだけなので、リストのコピーで足りる
+        session.state = self.state.model_copy(
+            update={"nodes": list(self.state.nodes), "pods": list(self.state.pods)}
+        )
+        session.arrays = copy.deepcopy(self.arrays)
+        session.data = {
+            key: value.copy() if isinstance(value, np.ndarray) else value
+            for key, value in self.data.items()
+        }
+        session.lock = threading.Lock()
+        session._pod_index = dict(self._pod_index)
+        session._candidates = set(self._candidates)
+        return session
+
+    def apply(self, deltas: List[SessionDelta]) -> None:
+        """
+        差分を順に適用します。途中で失敗した場合、それまでの差分は適用されたままになります。
+        オートスケーリングの対象のサービスに影響する差分があれば、計画を作り直します。
+        """
+        rescale = False
+        try:
+            for i, delta in enumerate(deltas):
+                rescale = rescale or self._affects_scaling(delta)
+                try:
+                    self._apply(delta)
+                except HTTPException as e:
+                    raise HTTPException(
+                        status_code=e.status_code, detail=f"deltas[{i}]: {e.detail}"
+                    )
+        finally:
+            if rescale:
+                self.state.pods = [
+                    pod for pod in self.state.pods if pod.id not in self._candidates
+                ]
+                self._prepare()
+
+    def optimize(
+        self,
+        settings: Optional[AnealingSettings] = None,
+        initial_placement: Optional[Dict[str, str]] = None,
+        diff: bool = False,
+    ) -> OptimizationResponse:
+        """
+        settings を指定した場合はこの呼び出しだけに使い、セッションの設定は変えません。
+        """
+        if settings is None:
+            settings = self.settings
+        return solve_prepared(
+            self.state,
+            self.arrays,
+            self._instance_data(settings),
+            settings,
+            initial_placement,
+            diff=diff,
+        )
+
+    def _affects_scaling(self, delta: SessionDelta) -> bool:
+        scaled = {s.id for s in self.state.services if s.auto_scaling_enabled}
+        if not scaled:
+            return False
+        if isinstance(delta, (AddNode, DrainNode)):
+            # ノードの容量はクラスタの余裕 (新規Podの desire) に影響する
+            return True
+        if isinstance(delta, AddPod):
+            return delta.pod.service in scaled
+        if isinstance(delta, (RemovePod, ResizePod)):
+            i = self._pod_index.get(delta.pod_id)
+            return i is not None and self.state.pods[i].service in scaled
+        return False
+
+    def _apply(self, delta: SessionDelta) -> None:
+        if isinstance(delta, AddPod):
+            self._add_pod(delta)
+        elif isinstance(delta, RemovePod):
+            self._remove_pod(self._pod(delta.pod_id))
+        elif isinstance(delta, ResizePod):
+            i = self._pod(delta.pod_id)
+            update: Dict[str, Any] = {}
+            if delta.cpu_usage is not None:
+                update["cpu_usage"] = delta.cpu_usage
+            if delta.mem_usage is not None:
+                update["mem_usage"] = delta.mem_usage
+            self._update_pod(i, update)
+        elif isinstance(delta, MovePod):
+            self._update_pod(self._pod(delta.pod_id), {"current_node": delta.node_id})
+        elif isinstance(delta, AddNode):
+            self._add_node(delta)
+        elif isinstance(delta, DrainNode):
+            self._drain_node(delta)
+
+    def _pod(self, pod_id: str) -> int:
+        i = self._pod_index.get(pod_id)
+        if i is None:
+            raise HTTPException(
+                status_code=404, detail=f"Podが見つかりません: {pod_id}"
+            )
+        return i
+
+    def _reindex_pods(self) -> None:
+        self._pod_index = {pod_id: i for i, pod_id in enumerate(self.arrays.pod_ids)}
+
+    def _refresh_vectors(self) -> None:
+        # Pod数・Node数に比例する係数 (サービスの所属Podを含む) は作り直しても安い
+        cpu_scale = 10**self.settings.cpu_digit_adjustment
+        mem_scale = 10**self.settings.mem_digit_adjustment
+        self.data["cpuReq"] = self.arrays.pod_cpu * cpu_scale
+        self.data["memReq"] = self.arrays.pod_mem * mem_scale
+        self.data["cpuCap"] = self.arrays.node_cpu * cpu_scale
+        self.data["memCap"] = self.arrays.node_mem * mem_scale
+        self.data["serviceMembers"] = _service_members(self.arrays)
+
+    def _update_rows(self, rows: np.ndarray) -> None:
+        self.data["pods"][rows] = _current_rows(self.arrays, rows)
+        self.data["moveCost"][rows] = _move_cost_rows(self.arrays, self.settings, rows)
+
+    def _add_pod(self, delta: AddPod) -> None:
+        if delta.pod.id in self._pod_index:
+            raise HTTPException(
+                status_code=409, detail=f"Podが既に存在します: {delta.pod.id}"
+            )
+        self.state.pods.append(delta.pod)
+        self.arrays.append_pod(delta.pod)
+        i = self.arrays.num_pods - 1
+        self._pod_index[delta.pod.id] = i
+
+        row = np.array([i])
+        self.data["pods"] = np.vstack(
+            [self.data["pods"], _current_rows(self.arrays, row)]
+        )
+        self.data["moveCost"] = np.vstack(
+            [self.data["moveCost"], _move_cost_rows(self.arrays, self.settings, row)]
+        )
+        # 差分で追加したPodは必ず配置する
+        self.data["desire"] = np.append(self.data["desire"], 0.0)
+        self.data["optional"] = np.append(self.data["optional"], 0.0)
+        self._refresh_vectors()
+
+    def _remove_pod(self, i: int) -> None:
+        del self.state.pods[i]
+        self.arrays.delete_pod(i)
+        self.data["pods"] = np.delete(self.data["pods"], i, axis=0)
+        self.data["moveCost"] = np.delete(self.data["moveCost"], i, axis=0)
+        self.data["desire"] = np.delete(self.data["desire"], i)
+        self.data["optional"] = np.delete(self.data["optional"], i)
+        self._refresh_vectors()
+        self._reindex_pods()
+
+    def _update_pod(self, i: int, update: Dict[str, Any]) -> None:
+        pod = self.state.pods[i].model_copy(update=update)
+        self.state.pods[i] = pod
+        self.arrays.update_pod(i, pod)
+        self._update_rows(np.array([i]))
+        self._refresh_vectors()
+
+    def _add_node(self, delta: AddNode) -> None:
+        if delta.node.id in self.arrays.node_ids:
+            raise HTTPException(
+                status_code=409, detail=f"Nodeが既に存在します: {delta.node.id}"
+            )
+        self.state.nodes.append(delta.node)
+        self.arrays.append_node(delta.node)
+        j = self.arrays.num_nodes - 1
+
+        # 存在しないノードに配置されていたPodが、このノードに戻ってきた場合
+        orphans = np.flatnonzero(self.arrays.pod_placed & (self.arrays.pod_node < 0))
+        returned = np.array(
+            [i for i in orphans if self.state.pods[i].current_node == delta.node.id],
+            dtype=np.int64,
+        )
+        self.arrays.pod_node[returned] = j
+
+        all_pods = np.arange(self.arrays.num_pods)
+        cost = np.where(
+            self.arrays.pod_placed & (self.arrays.pod_node != j),
+            _base_move_cost(self.arrays, self.settings, all_pods),
+            0.0,
+        )
+        self.data["pods"] = np.hstack(
+            [self.data["pods"], np.zeros((len(all_pods), 1), dtype=np.int64)]
+        )
+        self.data["moveCost"] = np.hstack([self.data["moveCost"], cost[:, None]])
+        self._update_rows(returned)
+        self._refresh_vectors()
+
+    def _drain_node(self, delta: DrainNode) -> None:
+        if delta.node_id not in self.arrays.node_ids:
+            raise HTTPException(
+                status_code=404, detail=f"Nodeが見つかりません: {delta.node_id}"
+            )
+        j = self.arrays.node_ids.index(delta.node_id)
+        evicted = np.flatnonzero(self.arrays.pod_node == j)
+
+        del self.state.nodes[j]
+        self.arrays.delete_node(j)
+        self.data["pods"] = np.delete(self.data["pods"], j, axis=1)
+        self.data["moveCost"] = np.delete(self.data["moveCost"], j, axis=1)
+        # 退避対象のPodはどのノードに置いても移動コストがかかる
+        self._update_rows(evicted)
+        self._refresh_vectors()
+
+    def update_settings(self, settings: AnealingSettings) -> None:
+        self.data = self._instance_data(settings)
+        self.settings = settings
+
+    def _instance_data(self, settings: AnealingSettings) -> Dict[str, Any]:
+        """
+        settings で解くための係数を返します。保持している係数は書き換えません。
+        """
+        rebuild = any(
+            getattr(settings, f) != getattr(self.settings, f)
+            for f in _COEFFICIENT_FIELDS
+        )
+        if rebuild:
+            return _build_instance_data(
+                self.arrays,
+                settings,
+                desire=self.data["desire"],
+                optional=self.data["optional"],
+            )
+        return {
+            **self.data,
+            "loadBalanceWeight": settings.load_balance_weight,
+            "moveCostWeight": settings.move_cost_weight,
+            "antiAffinityWeight": settings.anti_affinity_weight,
+            "desireWeight": settings.desire_weight,
+        }
+
+
+class SessionStore:
+    """
+    セッションを保持します。最後に使われてから ttl 秒経つか、
+    max_sessions を超えた場合は古いものから破棄します。
+    """
+
+    def __init__(self, max_sessions: int = 64, ttl: float = 3600.0) -> None:
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, tuple[ClusterSession, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, state: ClusterState, settings: AnealingSettings) -> ClusterSession:
+        session = ClusterSession(uuid.uuid4().hex, state, settings)
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = (session, time.monotonic())
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> ClusterSession:
+        with self._lock:
+            self._expire()
+            if session_id not in self._sessions:
+                raise HTTPException(
+                    status_code=404, detail="セッションが見つかりません。"
+                )
+            session, _ = self._sessions.pop(session_id)
+            self._sessions[session_id] = (session, time.monotonic())
+            return session
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            if self._sessions.pop(session_id, None) is None:
+                raise HTTPException(
+                    status_code=404, detail="セッションが見つかりません。"
+                )
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            _, (_, touched) = next(iter(self._sessions.items()))
+            if now - touched <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
@@ -1,24 +1,86 @@
+import math
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextvars import ContextVar
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
 from fastapi import HTTPException
-import jijmodeling as jm
-from ommx.v1 import Instance
-from ommx_openjij_adapter import OMMXOpenJijSAAdapter
+import numpy as np
 
+from .arrays import ClusterArrays
+from .columnar import ColumnarResult
+from .engines import Engine, repair_capacity, solve_greedy, solve_local_search
+from .model_cache import ModelCache, digest_instance_data
+from . import metrics, parallel
+from .parallel import run_parallel, split_reads, worker_seeds
+from .pruning import select_candidates
+from .qubo import QuboModel, build_qubo, sample_qubo
 from .scaling import auto_scale_desired_exsistence
+from .waves import schedule_waves
 from .models import (
     Action,
     ActionType,
     AnealingSettings,
+    CapacityRepair,
     ClusterState,
+    Node,
     OptimizationResponse,
     Pod,
+    SamplingPoint,
+    SamplingStats,
+    ServiceProfile,
+    VariableStats,
+)
+from typing import TYPE_CHECKING, Callable, List, Dict, Any, Optional
+
+# jijmodeling / OMMX / openjij は読み込みに時間がかかるため、使うときに読み込む
+# (起動を速くし、ウォームアップで読み込んでおく)
+if TYPE_CHECKING:
+    import jijmodeling as jm
+    from ommx.v1 import Instance, Quadratic
+
+# /optimize呼び出し間で共有するモデルキャッシュ
+# (評価済みインスタンスは大きいと数百MBになるため、合計サイズで制限する)
+model_cache = ModelCache(
+    max_bytes=int(os.environ.get("KYTOS_MODEL_CACHE_BYTES", 512 * 2**20))
+)
+# 直前のSAの読み出しの記録 (エンジンの戻り値を変えずにレスポンスへ渡す)
+_sampling_stats: ContextVar[Optional[SamplingStats]] = ContextVar(
+    "kytos_sampling_stats", default=None
 )
-from typing import List, Dict, Any
+# 途中経過の通知先 (x[p, n] の辞書, 目的関数値, それまでの読み出し数)
+# 設定されている場合、SAは読み出しをバッチに分けて、バッチごとに最良の実行可能解を渡す
+progress_callback: ContextVar[
+    Optional[Callable[[dict[tuple[int, ...], float], float, Optional[int]], None]]
+] = ContextVar("kytos_progress_callback", default=None)
+# 中断の指示 (is_set() を持つ threading.Event や multiprocessing の Event)
+# 設定されている場合、SAは読み出しをバッチに分け、バッチや段階の間で中断を確認する
+cancel_event: ContextVar[Optional[Any]] = ContextVar("kytos_cancel_event", default=None)
 
 
-def _define_problem() -> jm.Problem:
+class SolveCancelled(Exception):
+    """
+    cancel_event が設定されたため、最適化を打ち切りました。
+    """
+
+
+def check_cancelled() -> None:
+    """
+    cancel_event が設定されていれば SolveCancelled を送出します。
+    """
+    event = cancel_event.get()
+    if event is not None and event.is_set():
+        raise SolveCancelled()
+
+
+def _define_problem() -> "jm.Problem":
     """
     数理最適化モデルを定義します。
     """
+    import jijmodeling as jm
+
     problem = jm.Problem("Kytos Orchestration")
 
     # 重み
@@ -31,7 +93,7 @@ def _define_problem() -> jm.Problem:
     anti_affinity_weight = jm.Placeholder(
         "antiAffinityWeight", description="アンチアフィニティの重み"
     )
-    # desire_weight = jm.Placeholder("desire_weight", description="配置意欲の重み")
+    desire_weight = jm.Placeholder("desireWeight", description="配置意欲の重み")
 
     # 現在の配置
     pods = jm.Placeholder("pods", ndim=2, description="ポッドの現在の配置")
@@ -57,18 +119,30 @@ def _define_problem() -> jm.Problem:
         "moveCost", shape=(num_pods, num_nodes), description="Podの移動コスト"
     )
 
-    anti_affinity = jm.Placeholder(
-        "antiAffinity",
-        shape=(num_pods, num_pods),
+    # サービスごとの所属Podのインデックス (ジャグ配列)
+    # P×Pの行列ではなく所属Podだけを持つため、メモリはサービスの規模に比例する
+    service_members = jm.Placeholder(
+        "serviceMembers",
+        ndim=2,
+        dtype=jm.DataType.INTEGER,
+        jagged=True,
         description="同じサービスのPodを分散配置する",
     )
 
-    # desire = jm.Placeholder(
-    #     "desire", shape=(num_pods,), description="Podの作成,削除提案"
-    # )
+    desire = jm.Placeholder(
+        "desire", shape=(num_pods,), description="Podの作成,削除提案"
+    )
+    optional = jm.Placeholder(
+        "optional", shape=(num_pods,), description="配置しなくてもよいPod (1)"
+    )
+    # 候補外の割り当ての変数は作らない (和を候補の組だけでとる)
+    candidates = jm.Placeholder(
+        "candidates", shape=(num_pods, num_nodes), description="候補ノード (1)"
+    )
 
     # 変数定義
     x = jm.BinaryVar("x", shape=(num_pods, num_nodes), description="PodのNode割り当て")
+    u = jm.BinaryVar("u", shape=(num_pods,), description="Podを配置しない (スラック)")
     p = jm.Element("p", (0, num_pods), description="Podのインデックス")
     n = jm.Element("n", (0, num_nodes), description="Nodeのインデックス")
     n2 = jm.Element("n2", (0, num_nodes), description="Nodeのインデックス2")
@@ -76,8 +150,13 @@ def _define_problem() -> jm.Problem:
     # 制約条件
     # 各Podは最大1つのNodeに割り当てる (Relaxed One-hot制約)
     # desireの値に応じて配置するかどうかを決定するため、必ずしも1つに割り当てる必要はない
-    ## 勝手に削除されないように、一旦強制的に1つに割り当てる
-    problem += jm.Constraint("one_hot_relaxed", jm.sum(n, x[p, n]) == 1, forall=[p])
+    # optionalでないPodは勝手に削除されないように、必ず1つに割り当てる
+    # (SAのペナルティは (左辺 - 右辺)^2 になるため、<= ではなくスラック u で表す)
+    problem += jm.Constraint(
+        "one_hot_relaxed",
+        jm.sum([(n, candidates[p, n] > 0)], x[p, n]) + optional[p] * u[p] == 1,
+        forall=[p],
+    )
 
     # リソース容量制約 (CPU, Memory)
     # problem += jm.Constraint(
@@ -89,8 +168,8 @@ def _define_problem() -> jm.Problem:
 
     # 目的関数
     # 負荷分散 (使用率の二乗和の最小化)
-    cpu_load = jm.sum(p, x[p, n] * cpu_req[p])
-    mem_load = jm.sum(p, x[p, n] * mem_req[p])
+    cpu_load = jm.sum([(p, candidates[p, n] > 0)], x[p, n] * cpu_req[p])
+    mem_load = jm.sum([(p, candidates[p, n] > 0)], x[p, n] * mem_req[p])
     ideal_cpu_load = jm.sum(p, cpu_req[p]) / jm.sum(n2, cpu_cap[n2]) * cpu_cap[n]
     ideal_mem_load = jm.sum(p, mem_req[p]) / jm.sum(n2, mem_cap[n2]) * mem_cap[n]
 
@@ -103,21 +182,35 @@ def _define_problem() -> jm.Problem:
     )
 
     # 移動コスト
-    problem += jm.sum([p, n], x[p, n] * move_cost[p, n]) * move_cost_weight
+    problem += (
+        jm.sum([p, (n, candidates[p, n] > 0)], x[p, n] * move_cost[p, n])
+        * move_cost_weight
+    )
 
     # アンチアフィニティ (同じサービスの分散配置)
-    # i と p が同じサービスなら anti_affinity[i, p] > 0
-    # 同じノード j に配置されると x[i,j]*x[p,j] = 1
-    p2 = jm.Element("p", (0, num_pods))
+    # 同じサービスのPodの組 (a, b) が同じノード n に配置されると x[a,n]*x[b,n] = 1
+    # (順序付きの組で数えていた以前の定式化と同じ値になるよう2倍する)
+    s = jm.Element("s", (0, service_members.len_at(0)), description="サービス")
+    a = jm.Element("a", (0, service_members[s].len_at(0)), description="所属Pod")
+    b = jm.Element("b", (0, a), description="所属Pod2")
+    both = (candidates[service_members[s, a], n] > 0) & (
+        candidates[service_members[s, b], n] > 0
+    )
     problem += (
-        jm.sum([n, p, p2], anti_affinity[p, p2] * x[p, n] * x[p2, n])
+        jm.sum(
+            [n, s, a, (b, both)],
+            2 * x[service_members[s, a], n] * x[service_members[s, b], n],
+        )
         * anti_affinity_weight
     )
 
     # Desire (配置意欲)
     # desireが高い(1.0)場合は配置することでエネルギーを下げる (-1 * 1.0 * 1 = -1)
     # desireが低い(-1.0)場合は配置するとエネルギーが上がる (-1 * -1.0 * 1 = +1) -> 配置しない(0)方が良い
-    # problem += jm.sum(p, -1.0 * desire[p] * jm.sum(n, x[p, n])) * desire_weight
+    problem += (
+        jm.sum(p, -1.0 * desire[p] * jm.sum([(n, candidates[p, n] > 0)], x[p, n]))
+        * desire_weight
+    )
 
     # print(problem._repr_latex_())
 
@@ -126,173 +219,367 @@ def _define_problem() -> jm.Problem:
 
 def _prepare_data(
     state: ClusterState, settings: AnealingSettings
-) -> tuple[Dict[str, Any], List[Pod]]:
+) -> tuple[Dict[str, Any], List[Pod], ClusterArrays]:
     """
     ソルバーに渡すデータを準備します。
     """
-    # pods, desires = auto_scale_desired_exsistence(state)
-    pods = state.pods
+    plan = auto_scale_desired_exsistence(state)
+    pods = plan.pods
 
-    # 移動コストの計算
-    m_costs = []
-    for pod in pods:
-        row = []
-        for node in state.nodes:
-            if pod.current_node is None:
-                row.append(0.0)
-                continue
+    arrays = ClusterArrays.from_state(state.model_copy(update={"pods": pods}))
+    instance_data = _build_instance_data(
+        arrays, settings, desire=plan.desire, optional=plan.optional
+    )
+    return instance_data, pods, arrays
 
-            if pod.current_node != node.id:
-                row.append(
-                    1.0
-                    + 0.3 * pod.priority
-                    + pod.mem_usage
-                    * (10**settings.mem_digit_adjustment)
-                    * settings.move_cost_resource_coeff
-                    + pod.cpu_usage
-                    * (10**settings.cpu_digit_adjustment)
-                    * settings.move_cost_resource_coeff
-                )  # 基本移動コスト
-                continue
 
-            row.append(0.0)
-        m_costs.append(row)
-
-    # アンチアフィニティ行列の作成
-    # 同じ service_name を持つPodペアに対してペナルティを設定
-    num_pods = len(pods)
-    affinity_matrix = [[0.0] * num_pods for _ in range(num_pods)]
-    for i in range(num_pods):
-        for k in range(
-            i + 1, num_pods
-        ):  # 上三角だけで十分だが、式は全和なので両方埋めるか、i<kで制限するか。
-            # jm.sum([j, i, p]) は全組み合わせ走るので、重複カウントされる。
-            # x[i]*x[p] と x[p]*x[i] は同じ。
-            # 対称行列にしておけば係数が2倍になるだけなのでOK。
-            if (
-                pods[i].service
-                and pods[k].service
-                and pods[i].service == pods[k].service
-            ):
-                affinity_matrix[i][k] = 1.0
-                affinity_matrix[k][i] = 1.0
+def _build_instance_data(
+    arrays: ClusterArrays,
+    settings: AnealingSettings,
+    desire: Optional[np.ndarray] = None,
+    optional: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """
+    配置済みの配列から、ソルバーに渡す係数をNumPyの配列演算で計算します。
+    desire と optional を省略した場合は、全Podを必ず配置します。
+    """
+    cpu_scale = 10**settings.cpu_digit_adjustment
+    mem_scale = 10**settings.mem_digit_adjustment
+    all_pods = np.arange(arrays.num_pods)
 
     return {
         "loadBalanceWeight": settings.load_balance_weight,
         "moveCostWeight": settings.move_cost_weight,
         "antiAffinityWeight": settings.anti_affinity_weight,
         "desireWeight": settings.desire_weight,
-        "pods": [
-            [1 if pod.current_node == node.id else 0 for node in state.nodes]
-            for pod in pods
-        ],
-        "cpuReq": [p.cpu_usage * (10**settings.cpu_digit_adjustment) for p in pods],
-        "memReq": [p.mem_usage * (10**settings.mem_digit_adjustment) for p in pods],
-        "cpuCap": [
-            n.cpu_capacity * (10**settings.cpu_digit_adjustment) for n in state.nodes
-        ],
-        "memCap": [
-            n.mem_capacity * (10**settings.mem_digit_adjustment) for n in state.nodes
-        ],
-        "moveCost": m_costs,
-        "antiAffinity": affinity_matrix,
-        # "desire": desires,
-    }, pods
+        "pods": _current_rows(arrays, all_pods),
+        "cpuReq": arrays.pod_cpu * cpu_scale,
+        "memReq": arrays.pod_mem * mem_scale,
+        "cpuCap": arrays.node_cpu * cpu_scale,
+        "memCap": arrays.node_mem * mem_scale,
+        "moveCost": _move_cost_rows(arrays, settings, all_pods),
+        "serviceMembers": _service_members(arrays),
+        "desire": np.zeros(arrays.num_pods) if desire is None else desire,
+        "optional": (
+            np.zeros(arrays.num_pods)
+            if optional is None
+            else np.asarray(optional, dtype=float)
+        ),
+    }
+
+
+def _current_rows(arrays: ClusterArrays, rows: np.ndarray) -> np.ndarray:
+    """
+    指定したPodの現在の配置 (one-hot) を返します。
+    """
+    return (
+        arrays.pod_node[rows, None] == np.arange(arrays.num_nodes)[None, :]
+    ).astype(np.int64)
+
+
+def _move_cost_rows(
+    arrays: ClusterArrays, settings: AnealingSettings, rows: np.ndarray
+) -> np.ndarray:
+    """
+    指定したPodの移動コスト行を計算します。
+    current_nodeが未設定のPodはどこに置いてもコスト0、それ以外は現在のノード以外に基本移動コスト
+    """
+    is_current = _current_rows(arrays, rows).astype(bool)
+    return np.where(
+        arrays.pod_placed[rows, None] & ~is_current,
+        _base_move_cost(arrays, settings, rows)[:, None],
+        0.0,
+    )
+
+
+def _base_move_cost(
+    arrays: ClusterArrays, settings: AnealingSettings, rows: np.ndarray
+) -> np.ndarray:
+    """
+    指定したPodを現在のノードから動かすときの基本移動コストを計算します。
+    """
+    return (
+        1.0
+        + 0.3 * arrays.pod_priority[rows]
+        + arrays.pod_mem[rows]
+        * (10**settings.mem_digit_adjustment)
+        * settings.move_cost_resource_coeff
+        + arrays.pod_cpu[rows]
+        * (10**settings.cpu_digit_adjustment)
+        * settings.move_cost_resource_coeff
+    )
+
+
+def _service_members(arrays: ClusterArrays) -> List[List[int]]:
+    """
+    サービスごとに、所属するPodのインデックスを返します。
+    jijmodelingは空の2次元配列を受け付けないため、サービスがなければ [[]] を返します。
+    """
+    num_services = len(arrays.service_ids)
+    order = np.argsort(arrays.pod_service, kind="stable")
+    bounds = np.searchsorted(arrays.pod_service[order], np.arange(num_services + 1))
+    members = [order[bounds[s] : bounds[s + 1]].tolist() for s in range(num_services)]
+    return members or [[]]
+
+
+def _assignment_pairs(
+    response: dict[tuple[int, ...], float] | np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    ソルバーの結果 (x[p, n] の辞書、または (P, N) の割り当て配列) から、
+    値が1の (Pod, Node) の組を返します。
+    """
+    if isinstance(response, np.ndarray):
+        pods, nodes = np.nonzero(response == 1)
+        return pods, nodes
+    keys = [key for key, value in response.items() if value == 1]
+    if not keys:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pairs = np.asarray(keys, dtype=np.int64)
+    return pairs[:, 0], pairs[:, 1]
 
 
 def _decode_result(
-    response: dict[tuple[int, ...], float],
+    response: dict[tuple[int, ...], float] | np.ndarray,
     state: ClusterState,
 ) -> tuple[List[Pod], List[Action]]:
     """
     ソルバーの結果をデコードしてレスポンス形式に変換します。
     """
     num_pods = len(state.pods)
-    num_nodes = len(state.nodes)
+    target = _assignment_targets(response, num_pods, len(state.nodes))
 
+    # 現在のノード (未配置は -1、存在しないノードは -2)
+    node_index = {node.id: n for n, node in enumerate(state.nodes)}
+    current = np.fromiter(
+        (
+            -1 if pod.current_node is None else node_index.get(pod.current_node, -2)
+            for pod in state.pods
+        ),
+        np.int64,
+        num_pods,
+    )
+    action_types = _action_codes(target, current)
+
+    # 検証済みの値から組み立てるため、Pydanticの検証を省略する
+    node_ids = [node.id for node in state.nodes]
     actions: List[Action] = []
     new_pods_list: List[Pod] = []
-
-    for p in range(num_pods):
-        pod = state.pods[p]
-        fond_node = False
-
-        for n in range(num_nodes):
-            if response.get((p, n), 0) == 1:
-                target_node = state.nodes[n]
-                if pod.id in [p.id for p in new_pods_list]:
-                    print("Warning: Pod assigned to multiple nodes!")
-                    break
-
-                new_pods_list.append(
-                    Pod(
-                        id=pod.id,
-                        cpu_usage=pod.cpu_usage,
-                        mem_usage=pod.mem_usage,
-                        current_node=target_node.id,
-                        service=pod.service,
-                        priority=pod.priority,
-                    )
-                )
-                fond_node = True
-
-                if pod.current_node is None:
-                    actions.append(
-                        Action(
-                            pod_id=pod.id,
-                            target_node_id=target_node.id,
-                            action=ActionType.CREATE,
-                        )
-                    )
-
-                elif pod.current_node != target_node.id:
-                    actions.append(
-                        Action(
-                            pod_id=pod.id,
-                            target_node_id=target_node.id,
-                            action=ActionType.MOVE,
-                        )
-                    )
-
-                else:
-                    actions.append(
-                        Action(
-                            pod_id=pod.id,
-                            target_node_id=target_node.id,
-                            action=ActionType.KEEP,
-                        )
-                    )
-
-        if not fond_node:
+    for pod, n, code in zip(state.pods, target.tolist(), action_types.tolist()):
+        action = _ACTION_TYPES[code]
+        if action == ActionType.REMOVE:
             # 配置されなかったPodは削除扱い
-            actions.append(
-                Action(
-                    pod_id=pod.id,
-                    action=ActionType.REMOVE,
-                )
+            actions.append(Action.model_construct(pod_id=pod.id, action=action))
+            continue
+        new_pods_list.append(
+            Pod.model_construct(
+                id=pod.id,
+                cpu_usage=pod.cpu_usage,
+                mem_usage=pod.mem_usage,
+                current_node=node_ids[n],
+                service=pod.service,
+                priority=pod.priority,
             )
+        )
+        actions.append(
+            Action.model_construct(
+                pod_id=pod.id, target_node_id=node_ids[n], action=action
+            )
+        )
 
     return new_pods_list, actions
 
 
-def solve_placement(
+def _decode_placement(
+    best_sample: dict[tuple[int, ...], float] | np.ndarray,
     state: ClusterState,
-    settings: AnealingSettings = AnealingSettings(),
-) -> OptimizationResponse:
-    if not state.nodes or not state.pods:
-        raise HTTPException(
-            status_code=400, detail="ノードまたはポッドの情報が不足しています。"
-        )
+    arrays: ClusterArrays,
+    instance_data: Dict[str, Any],
+    diff: bool = False,
+) -> tuple[List[Pod], List[Action], Dict[str, int]]:
+    """
+    最良解をレスポンスの pods, placements と、アクションごとのPod数に変換します。
+    配置されなかった新規の候補 (optional) は、作成しないだけで削除ではないため含めません。
+    diff が True なら、Podのモデルを作らずに、変更のあるPodのアクションだけを返します。
+    """
+    target = _assignment_targets(best_sample, arrays.num_pods, arrays.num_nodes)
+    codes = _action_codes(target, _current_nodes(arrays))
+    optional = np.asarray(instance_data["optional"]) > 0
+    listed = ~(optional & ~arrays.pod_placed & (target < 0))
+    counts = np.bincount(codes[listed], minlength=len(_ACTION_TYPES))
+    summary = {
+        action.value: count for action, count in zip(_ACTION_TYPES, counts.tolist())
+    }
 
-    # 問題定義
-    problem = _define_problem()
+    if diff:
+        changed = listed & (codes != _ACTION_CODES[ActionType.KEEP])
+        actions = [
+            Action.model_construct(
+                pod_id=arrays.pod_ids[p],
+                target_node_id=arrays.node_ids[target[p]] if target[p] >= 0 else None,
+                action=_ACTION_TYPES[codes[p]],
+            )
+            for p in np.flatnonzero(changed).tolist()
+        ]
+        return [], actions, summary
+
+    new_pods, actions = _decode_result(best_sample, state)
+    if not listed.all():
+        actions = [action for action, keep in zip(actions, listed.tolist()) if keep]
+    return new_pods, actions, summary
+
+
+def _current_nodes(arrays: ClusterArrays) -> np.ndarray:
+    """
+    Podごとの現在のノード (未配置は -1、存在しないノードは -2) を返します。
+    """
+    return np.where(arrays.pod_placed & (arrays.pod_node < 0), -2, arrays.pod_node)
+
+
+def _assignment_targets(
+    response: dict[tuple[int, ...], float] | np.ndarray,
+    num_pods: int,
+    num_nodes: int,
+) -> np.ndarray:
+    """
+    Podごとの割り当て先 (P,) を返します。
+    複数ある場合は最も小さいノード番号、なければ -1 です。
+    """
+    pods, nodes = _assignment_pairs(response)
+    valid = (pods < num_pods) & (nodes < num_nodes)
+    pods, nodes = pods[valid], nodes[valid]
+    target = np.full(num_pods, num_nodes, dtype=np.int64)
+    np.minimum.at(target, pods, nodes)
+    target[target == num_nodes] = -1
+
+    num_multiple = int((np.bincount(pods, minlength=num_pods) > 1).sum())
+    if num_multiple:
+        print(f"Warning: {num_multiple} pods assigned to multiple nodes!")
+    return target
+
+
+def _action_codes(target: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """
+    割り当て先と現在のノード (未配置は -1、存在しないノードは -2) から、
+    Podごとのアクション (_ACTION_TYPES のインデックス) を返します。
+    """
+    return np.select(
+        [target < 0, current == -1, current == target],
+        [
+            np.int64(_ACTION_CODES[ActionType.REMOVE]),
+            np.int64(_ACTION_CODES[ActionType.CREATE]),
+            np.int64(_ACTION_CODES[ActionType.KEEP]),
+        ],
+        np.int64(_ACTION_CODES[ActionType.MOVE]),
+    )
+
+
+_ACTION_TYPES = list(ActionType)
+_ACTION_CODES = {action: code for code, action in enumerate(_ACTION_TYPES)}
+
+
+def _penalty_weights(
+    instance: "Instance", multipliers: Dict[str, float]
+) -> dict[int, float]:
+    """
+    制約名ごとの重みを、インスタンスの制約IDごとの重みに変換します。
+    """
+    penalty_weights: dict[int, float] = {}
+    for constraint in instance.constraints:
+        if constraint.name in multipliers:
+            penalty_weights[constraint.id] = multipliers[constraint.name]
+    return penalty_weights
+
+
+def _instance_bytes(instance: "Instance") -> int:
+    # シリアライズしたサイズで見積もる (評価にかかる時間の数%程度)
+    return len(instance.to_bytes())
+
+
+def _evaluate_structure(
+    problem: "jm.Problem", instance_data: Dict[str, Any], candidates: np.ndarray
+) -> tuple["Instance", np.ndarray]:
+    """
+    インスタンスを評価し、目的関数を取り除いた構造 (変数と制約) と、
+    x[p, n] の変数IDの (P, N) 配列 (候補外は -1) を返します。
+    """
+    import jijmodeling as jm
+
+    instance = jm.Interpreter(
+        {**instance_data, "candidates": candidates.astype(np.int64)}
+    ).eval_problem(problem)
+    instance.objective = 0
+    var_ids = np.full(candidates.shape, -1, dtype=np.int64)
+    for v in instance.used_decision_variables:
+        if v.name == "x":
+            var_ids[tuple(v.subscripts)] = v.id
+    return instance, var_ids
 
-    # データ準備
-    instance_data, pods = _prepare_data(state, settings)
+
+def _objective(model: QuboModel, var_ids: np.ndarray) -> "Quadratic":
+    """
+    QUBOの目的関数 (ペナルティ項を除く) を、インスタンスの変数IDで表します。
+    """
+    from ommx.v1 import Linear, Quadratic
+
+    ids = var_ids[model.var_pod, model.var_node]
+    return Quadratic(
+        rows=ids[model.rows].tolist(),
+        columns=ids[model.cols].tolist(),
+        values=model.values.tolist(),
+        linear=Linear(
+            terms=dict(zip(ids.tolist(), model.linear.tolist())),
+            constant=model.constant,
+        ),
+    )
+
+
+def _solve_jijmodeling(
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    settings: AnealingSettings,
+    initial: Optional[np.ndarray] = None,
+) -> tuple[dict[tuple[int, ...], float], float]:
+    """
+    jijmodelingでインスタンスを評価し、OMMX経由でSAを実行します。
+    """
+    from ommx.v1 import Instance
+
+    shape = candidates.shape
+
+    # 問題定義 (記号的なモデルは形状に依存しないので、1つを使い回す)
+    problem: "jm.Problem" = model_cache.get_or_build(
+        "problem", "placement", _define_problem
+    )
 
     # QUBO変換と解決
-    interpreter = jm.Interpreter(instance_data)
-    instance: Instance = interpreter.eval_problem(problem)
+    # 候補外の割り当ては変数にせず、候補の組の変数だけでインスタンスを評価する
+    # 変数と制約は候補と optional だけで決まるため、構造が同じインスタンスを負荷や重みに
+    # よらず再利用し、目的関数だけを係数から直接展開して差し替える
+    with metrics.stage("interpret"):
+        optional = np.asarray(instance_data["optional"]) > 0
+        structure_key = (
+            shape,
+            digest_instance_data({"candidates": candidates, "optional": optional}),
+        )
+        structure, var_ids = model_cache.get_or_build(
+            "instance",
+            structure_key,
+            lambda: _evaluate_structure(problem, instance_data, candidates),
+            lambda built: _instance_bytes(built[0]) + built[1].nbytes,
+        )
+        model = build_qubo(
+            instance_data, settings.one_hot_relaxed_weight, candidates=candidates
+        )
+        # キャッシュしたインスタンスは他のリクエストと共有するため、複製して差し替える
+        instance = Instance.from_bytes(structure.to_bytes())
+        instance.objective = _objective(model, var_ids)
+
+    # 変数と二次項の数 (メトリクス用)
+    size = (
+        model.num_variables + int(optional.sum()),
+        len(model.rows) + _one_hot_interactions(candidates),
+    )
 
     multipliers = {
         "cpu_limit": settings.cpu_limit_weight,  # Weak constraint (penalty ~ 1.0 * excess^2)
@@ -300,25 +587,652 @@ def solve_placement(
         "one_hot_relaxed": settings.one_hot_relaxed_weight,  # Stronger than desire (10.0) to prevent double assignment
     }
 
-    penalty_weights: dict[int, float] = {}
-    for constraint in instance.constraints:
-        if constraint.name in multipliers:
-            penalty_weights[constraint.id] = multipliers[constraint.name]
+    # 制約IDの割り当ては形状のみで決まる
+    penalty_weights: dict[int, float] = model_cache.get_or_build(
+        "penalty_weights",
+        (shape, tuple(sorted(multipliers.items()))),
+        lambda: _penalty_weights(instance, multipliers),
+    )
 
-    result = OMMXOpenJijSAAdapter.sample(
-        instance, num_reads=settings.num_reads, penalty_weights=penalty_weights
+    initial_state = None
+    if initial is not None:
+        # 割り当てのないPodはスラック u を1にする
+        unplaced = initial.sum(axis=1) == 0
+        initial_state = {
+            v.id: (
+                int(initial[tuple(v.subscripts)])
+                if v.name == "x"
+                else int(unplaced[v.subscripts[0]])
+            )
+            for v in instance.used_decision_variables
+            if v.name in ("x", "u")
+        }
+
+    # ペナルティ法によるQUBOへの変換はリクエストごとに1度だけ行い、
+    # 変換したQUBOとインスタンスを全てのワーカーとバッチで使い回す
+    # (複数ワーカーで読み出しを分割する場合は、インスタンスをバイト列で共有する)
+    with metrics.stage("interpret"):
+        converted, qubo = _to_qubo(instance, penalty_weights)
+    sample_chunk = partial(
+        _sample_jijmodeling_chunk,
+        converted if settings.num_workers == 1 else converted.to_bytes(),
+        qubo,
+        initial_state,
+        _schedule(settings, warm=initial is not None),
+    )
+    with metrics.stage("sample"):
+        best, num_reads, num_feasible = _run_sampling(sample_chunk, settings)
+    metrics.observe_problem(
+        "jijmodeling", *size, num_reads=num_reads, num_feasible=num_feasible
     )
+
+    if best is None:
+        raise HTTPException(
+            status_code=500,
+            detail="有効な解が見つかりませんでした。制約条件が厳しすぎるか、試行回数が不足している可能性があります。",
+        )
+    return best
+
+
+def _to_qubo(
+    instance: "Instance", penalty_weights: dict[int, float]
+) -> tuple["Instance", dict[tuple[int, ...], float]]:
+    """
+    制約をペナルティ項にしたQUBOと、サンプルの評価に使う変換後のインスタンスを返します。
+    """
+    from ommx_openjij_adapter import OMMXOpenJijSAAdapter
+
+    adapter = OMMXOpenJijSAAdapter(instance, penalty_weights=penalty_weights)
+    qubo = adapter.sampler_input
+    return adapter.ommx_instance, qubo
+
+
+def _sample_jijmodeling_chunk(
+    converted: "Instance | bytes",
+    qubo: dict[tuple[int, ...], float],
+    initial_state: Optional[dict[int, int]],
+    schedule: Dict[str, Any],
+    num_reads: int,
+    seed: Optional[int],
+) -> tuple[Optional[tuple[dict[tuple[int, ...], float], float]], int]:
+    """
+    _to_qubo で変換したQUBOをopenjijのSAで読み出し、変換後のインスタンスで評価して、
+    最良の実行可能解 (x, 目的関数値) と実行可能解の数を返します。
+    実行可能解がなければ最良解は None です。
+    """
+    import openjij as oj
+    from ommx.v1 import Instance
+    from ommx_openjij_adapter import decode_to_samples
+
+    if isinstance(converted, bytes):
+        converted = Instance.from_bytes(converted)
+    response = oj.SASampler().sample_qubo(
+        qubo,
+        num_reads=num_reads,
+        seed=seed,
+        initial_state=initial_state,
+        **schedule,
+    )
+    result = converted.evaluate_samples(decode_to_samples(response))
+    num_feasible = sum(result.feasible_unrelaxed.values())
     try:
-        best_sample = result.best_feasible_unrelaxed.extract_decision_variables("x")
-        energy = result.best_feasible_unrelaxed.objective
+        best = result.best_feasible_unrelaxed
     except RuntimeError:
+        return None, num_feasible
+    return (best.extract_decision_variables("x"), best.objective), num_feasible
+
+
+def _one_hot_interactions(candidates: np.ndarray) -> int:
+    """
+    one-hot制約のペナルティ項が加える二次項の数を返します。
+    """
+    k = candidates.sum(axis=1)
+    return int((k * (k - 1) // 2).sum())
+
+
+def _run_sampling(
+    sample_chunk: Callable[
+        [int, Optional[int]],
+        tuple[Optional[tuple[dict[tuple[int, ...], float], float]], int],
+    ],
+    settings: AnealingSettings,
+) -> tuple[Optional[tuple[dict[tuple[int, ...], float], float]], int, int]:
+    """
+    sample_chunk(num_reads, seed) -> (最良の実行可能解, 実行可能解の数) を、
+    読み出しをワーカーに分割して settings.sampling に従って実行します。
+    (最良の実行可能解, 読み出し数, 実行可能解の数) を返し、読み出しの記録を
+    _sampling_stats に設定します。
+    progress_callback が設定されていれば、fixed でもバッチに分けて (打ち切らずに) 読み出し、
+    バッチごとの最良の実行可能解を渡します。cancel_event が設定されている場合も
+    バッチに分け、各バッチの前で中断を確認します。
+    """
+    best: Optional[tuple[dict[tuple[int, ...], float], float]] = None
+    num_reads = num_feasible = 0
+    curve: List[SamplingPoint] = []
+
+    def run(reads: int, seed: Optional[int]) -> bool:
+        # 1バッチを読み出し、最良の実行可能解が改善したかを返す
+        nonlocal best, num_reads, num_feasible
+        check_cancelled()
+        split = split_reads(reads, settings.num_workers)
+        chunks = run_parallel(
+            sample_chunk, list(zip(split, worker_seeds(seed, len(split))))
+        )
+        previous = best
+        for chunk_best, chunk_feasible in chunks:
+            num_feasible += chunk_feasible
+            if chunk_best is not None and (best is None or chunk_best[1] < best[1]):
+                best = chunk_best
+        num_reads += reads
+        curve.append(
+            SamplingPoint(
+                reads=num_reads, best_energy=None if best is None else best[1]
+            )
+        )
+        if best is not None and progress is not None:
+            progress(*best, num_reads)
+        if best is None or previous is None:
+            return best is not None
+        return best[1] < previous[1] - settings.sampling_tolerance * max(
+            1.0, abs(previous[1])
+        )
+
+    progress = progress_callback.get()
+    stopped = "num_reads"
+    if settings.sampling == "fixed" and progress is None and cancel_event.get() is None:
+        run(settings.num_reads, settings.seed)
+    else:
+        deadline = None
+        if settings.sampling_budget_ms is not None:
+            deadline = time.monotonic() + settings.sampling_budget_ms / 1000
+        batch = max(1, settings.sampling_batch_reads)
+        num_batches = math.ceil(settings.num_reads / batch)
+        stale = 0
+        for seed in worker_seeds(settings.seed, num_batches):
+            improved = run(min(batch, settings.num_reads - num_reads), seed)
+            # 実行可能解が見つかるまでは、改善が止まったとはみなさない
+            stale = 0 if improved or best is None else stale + 1
+            if num_reads >= settings.num_reads:
+                break
+            if settings.sampling == "fixed":
+                continue
+            if stale >= settings.sampling_patience:
+                stopped = "patience"
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                stopped = "budget"
+                break
+
+    _sampling_stats.set(
+        SamplingStats(
+            num_reads=num_reads,
+            num_feasible=num_feasible,
+            stopped=stopped,
+            curve=curve,
+        )
+    )
+    return best, num_reads, num_feasible
+
+
+def _schedule(settings: AnealingSettings, warm: bool) -> Dict[str, Any]:
+    """
+    ウォームスタート時の短い低温スケジュールを返します。
+    one-hot制約を1つ破る遷移が warm_start_acceptance の確率で受理される温度から開始します。
+    """
+    if not warm:
+        return {}
+    return {
+        "num_sweeps": settings.warm_start_num_sweeps,
+        "beta_min": -math.log(settings.warm_start_acceptance)
+        / settings.one_hot_relaxed_weight,
+    }
+
+
+def _initial_assignment(
+    arrays: ClusterArrays,
+    candidates: np.ndarray,
+    initial_placement: Optional[Dict[str, str]] = None,
+) -> np.ndarray:
+    """
+    ウォームスタートの初期状態 (P, N) を作ります。
+    initial_placement (Pod ID -> Node ID) があればそれを、なければ現在の配置を使います。
+    配置先のないPodは未割り当てから始めます。
+    """
+    pod_node = arrays.pod_node
+    if initial_placement is not None:
+        node_index = {node_id: i for i, node_id in enumerate(arrays.node_ids)}
+        pod_node = np.fromiter(
+            (
+                node_index.get(initial_placement.get(pod_id), -1)
+                for pod_id in arrays.pod_ids
+            ),
+            np.int64,
+            arrays.num_pods,
+        )
+
+    initial = np.zeros(candidates.shape, dtype=np.int8)
+    placed = np.flatnonzero(pod_node >= 0)
+    initial[placed, pod_node[placed]] = 1
+    return initial * candidates
+
+
+def _solve_qubo(
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    settings: AnealingSettings,
+    initial: Optional[np.ndarray] = None,
+) -> tuple[dict[tuple[int, ...], float], float]:
+    """
+    目的関数を直接QUBOに展開し、openjijのSAを実行します。
+    """
+    with metrics.stage("interpret"):
+        model = build_qubo(
+            instance_data, settings.one_hot_relaxed_weight, candidates=candidates
+        )
+    sample_chunk = partial(
+        _sample_qubo_chunk,
+        model,
+        initial[model.var_pod, model.var_node] if initial is not None else None,
+        _schedule(settings, warm=initial is not None),
+    )
+    with metrics.stage("sample"):
+        best, num_reads, num_feasible = _run_sampling(sample_chunk, settings)
+    metrics.observe_problem(
+        "qubo",
+        model.num_variables,
+        len(model.rows) + _one_hot_interactions(candidates),
+        num_reads=num_reads,
+        num_feasible=num_feasible,
+    )
+    if best is None:
         raise HTTPException(
             status_code=500,
             detail="有効な解が見つかりませんでした。制約条件が厳しすぎるか、試行回数が不足している可能性があります。",
         )
+    return best
+
+
+def _sample_qubo_chunk(
+    model: QuboModel,
+    initial_state: Optional[np.ndarray],
+    schedule: Dict[str, Any],
+    num_reads: int,
+    seed: Optional[int],
+) -> tuple[Optional[tuple[dict[tuple[int, ...], float], float]], int]:
+    """
+    QUBOをSAで解き、最良の実行可能解 (x, 目的関数値) と実行可能解の数を返します。
+    """
+    samples, energies = sample_qubo(
+        model, num_reads, seed, initial_state=initial_state, **schedule
+    )
+    # 各Podがちょうど1つ (optional のPodは1つ以下) のNodeに割り当てられたサンプルのみを有効とする
+    assignments = model.to_assignment(samples)
+    feasible = model.feasible(samples)
+    if not feasible.any():
+        return None, 0
+
+    best = np.flatnonzero(feasible)[np.argmin(energies[feasible])]
+    best_sample = {
+        (int(p), int(n)): 1.0 for p, n in zip(*np.nonzero(assignments[best]))
+    }
+    return (best_sample, float(energies[best])), int(feasible.sum())
+
+
+ENGINES: Dict[str, Engine] = {
+    "jijmodeling": _solve_jijmodeling,
+    "qubo": _solve_qubo,
+    "greedy": solve_greedy,
+    "local_search": solve_local_search,
+}
+
+
+def _solve_within_deadline(
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    settings: AnealingSettings,
+    initial: Optional[np.ndarray] = None,
+) -> tuple[dict[tuple[int, ...], float], float, str]:
+    """
+    貪欲法 -> 局所探索 -> 指定したエンジンの順に、deadline_ms の残り時間で実行し、
+    見つかった中で目的関数値が最小の解とそのエンジン名を返します。
+    貪欲法の解は必ず返すため、SAが時間内に実行可能解を見つけられなくても失敗しません。
+    """
+    deadline = time.monotonic() + settings.deadline_ms / 1000
+
+    progress = progress_callback.get()
+    best_sample, energy = solve_greedy(instance_data, candidates, settings, initial)
+    best = (best_sample, energy, "greedy")
+    if settings.engine == "greedy":
+        return best
+    if progress is not None:
+        progress(best_sample, energy, None)
+    check_cancelled()
+
+    sample, energy = solve_local_search(
+        instance_data, candidates, settings, initial, deadline=deadline
+    )
+    if energy < best[1]:
+        best = (sample, energy, "local_search")
+    if settings.engine == "local_search":
+        return best
+    if progress is not None:
+        progress(*best[:2], None)
+    check_cancelled()
+
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return best
+
+    # SAは期限 (プロセス間で比較できるよう time.time() の時刻) を過ぎたら、
+    # 次のバッチの前で打ち切る
+    args = (
+        settings.engine,
+        instance_data,
+        candidates,
+        settings.model_copy(update={"num_workers": 1}),
+        initial,
+        time.time() + remaining,
+    )
+    result = None
+    if not parallel.is_warm() or cancel_event.get() is not None:
+        # プロセスを起動するより速いため、プールがなければ現在のプロセスで実行する
+        # 中断の指示 (ストリームの切断など) がある場合も、バッチの間で確認でき、
+        # 途中経過も送れるよう現在のプロセスで実行する
+        result = _run_engine(*args)
+    else:
+        try:
+            # インスタンスの評価中はGILを手放さないため、起動済みのプールで実行して
+            # 期限までだけ待つ
+            result = parallel.submit(_run_engine, *args).result(timeout=remaining)
+        except FutureTimeoutError:
+            # 期限を過ぎたSAは、ワーカーが次のバッチの前で打ち切る
+            pass
+        except BrokenProcessPool:
+            # 壊れたプールは作り直させ、それまでの最良解を返す
+            parallel.shutdown()
+        except OSError:
+            # プロセスを作れない環境 (AWS Lambda など)
+            result = _run_engine(*args)
+    check_cancelled()
+    if result is not None and result[1] < best[1]:
+        best = (*result, settings.engine)
+    return best
+
+
+class _Deadline:
+    """
+    期限 (time.time() の時刻) を過ぎるか、元の中断の指示が設定されると is_set() が真になります。
+    """
+
+    def __init__(self, deadline: float, parent: Optional[Any] = None) -> None:
+        self.deadline = deadline
+        self.parent = parent
+
+    def is_set(self) -> bool:
+        if self.parent is not None and self.parent.is_set():
+            return True
+        return time.time() >= self.deadline
+
+
+def _run_engine(
+    engine: str,
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    settings: AnealingSettings,
+    initial: Optional[np.ndarray] = None,
+    deadline: Optional[float] = None,
+) -> Optional[tuple[dict[tuple[int, ...], float], float]]:
+    """
+    エンジンを実行します (ワーカープロセスからも呼ばれます)。
+    実行可能解がないか、期限 (time.time() の時刻) までに終わらなければ None を返します。
+    """
+    token = None
+    if deadline is not None:
+        token = cancel_event.set(_Deadline(deadline, cancel_event.get()))
+    try:
+        return ENGINES[engine](instance_data, candidates, settings, initial)
+    except (HTTPException, SolveCancelled):
+        # HTTPExceptionはプロセス間で復元できない
+        # 元の中断の指示による打ち切りは、呼び出し側で check_cancelled() が送出する
+        return None
+    finally:
+        if token is not None:
+            # ワーカーのプロセスは使い回されるため、元に戻す
+            cancel_event.reset(token)
+
+
+def solve_placement(
+    state: ClusterState,
+    settings: AnealingSettings = AnealingSettings(),
+    initial_placement: Optional[Dict[str, str]] = None,
+    diff: bool = False,
+) -> OptimizationResponse:
+    if not state.nodes or not state.pods:
+        raise HTTPException(
+            status_code=400, detail="ノードまたはポッドの情報が不足しています。"
+        )
 
-    # 結果のデコード
+    # データ準備
+    with metrics.stage("prepare"):
+        instance_data, pods, arrays = _prepare_data(state, settings)
     state.pods = pods  # 更新されたPodリストをstateにセット
-    new_pods, actions = _decode_result(best_sample, state)
 
-    return OptimizationResponse(pods=new_pods, placements=actions, energy=energy)
+    return solve_prepared(
+        state, arrays, instance_data, settings, initial_placement, diff=diff
+    )
+
+
+def solve_prepared(
+    state: ClusterState,
+    arrays: ClusterArrays,
+    instance_data: Dict[str, Any],
+    settings: AnealingSettings,
+    initial_placement: Optional[Dict[str, str]] = None,
+    diff: bool = False,
+) -> OptimizationResponse:
+    """
+    準備済みの配列と係数から最適化を実行します。
+    state.pods と arrays のPodの並びは一致している必要があります。
+    diff が True なら、変更のあるPodのアクションだけを返し、pods は空にします。
+    """
+    if not state.nodes or not state.pods:
+        raise HTTPException(
+            status_code=400, detail="ノードまたはポッドの情報が不足しています。"
+        )
+
+    with metrics.observe_solve(settings.engine):
+        best_sample, energy, engine, variables, repair, sampling = _solve_arrays(
+            arrays, instance_data, settings, initial_placement
+        )
+
+        # 結果のデコード
+        with metrics.stage("decode"):
+            new_pods, actions, summary = _decode_placement(
+                best_sample, state, arrays, instance_data, diff
+            )
+        migration = None
+        if settings.migration_waves:
+            with metrics.stage("schedule"):
+                migration = schedule_waves(arrays, actions)
+
+    return OptimizationResponse(
+        pods=new_pods,
+        placements=actions,
+        summary=summary,
+        migration=migration,
+        energy=energy,
+        variables=variables,
+        engine=engine,
+        repair=repair,
+        sampling=sampling,
+    )
+
+
+def solve_columnar(
+    arrays: ClusterArrays,
+    settings: AnealingSettings,
+    initial_placement: Optional[Dict[str, str]] = None,
+    services: Optional[List[ServiceProfile]] = None,
+) -> ColumnarResult:
+    """
+    Podのモデルを作らずに、配列形式のクラスタから最適化します。
+    services にオートスケールするサービスがあれば、JSONの場合と同じ計画を適用します。
+    """
+    if not arrays.num_nodes or not arrays.num_pods:
+        raise HTTPException(
+            status_code=400, detail="ノードまたはポッドの情報が不足しています。"
+        )
+
+    with metrics.observe_solve(settings.engine):
+        with metrics.stage("prepare"):
+            desire, optional = _scale_arrays(arrays, services or [])
+            instance_data = _build_instance_data(
+                arrays, settings, desire=desire, optional=optional
+            )
+        best_sample, energy, engine, variables, repair, sampling = _solve_arrays(
+            arrays, instance_data, settings, initial_placement
+        )
+
+        with metrics.stage("decode"):
+            target = _assignment_targets(
+                best_sample, arrays.num_pods, arrays.num_nodes
+            )
+            actions = np.asarray(
+                [action.value for action in _ACTION_TYPES]
+            )[_action_codes(target, _current_nodes(arrays))]
+
+    return ColumnarResult(
+        pod_ids=arrays.pod_ids,
+        node_ids=arrays.node_ids,
+        target=target,
+        actions=actions,
+        energy=energy,
+        engine=engine,
+    )
+
+
+def _scale_arrays(
+    arrays: ClusterArrays, services: List[ServiceProfile]
+) -> tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    オートスケールの計画を配列形式のクラスタに適用し、(desire, optional) を返します。
+    計画が加えた新規Podは arrays に追加します。オートスケールするサービスがなければ何もしません。
+    """
+    if not any(service.auto_scaling_enabled for service in services):
+        return None, None
+
+    # 計画はPodの使用量とサービス、ノードの容量だけを使うため、検証を省略して組み立てる
+    state = ClusterState.model_construct(
+        nodes=[
+            Node.model_construct(id=node_id, cpu_capacity=cpu, mem_capacity=mem)
+            for node_id, cpu, mem in zip(
+                arrays.node_ids, arrays.node_cpu.tolist(), arrays.node_mem.tolist()
+            )
+        ],
+        pods=[
+            Pod.model_construct(
+                id=pod_id,
+                cpu_usage=cpu,
+                mem_usage=mem,
+                service=arrays.service_ids[s] if s >= 0 else None,
+            )
+            for pod_id, cpu, mem, s in zip(
+                arrays.pod_ids,
+                arrays.pod_cpu.tolist(),
+                arrays.pod_mem.tolist(),
+                arrays.pod_service.tolist(),
+            )
+        ],
+        services=services,
+    )
+    plan = auto_scale_desired_exsistence(state)
+    for pod in plan.pods[arrays.num_pods :]:
+        arrays.append_pod(pod)
+    return plan.desire, plan.optional
+
+
+def _solve_arrays(
+    arrays: ClusterArrays,
+    instance_data: Dict[str, Any],
+    settings: AnealingSettings,
+    initial_placement: Optional[Dict[str, str]] = None,
+) -> tuple[
+    dict[tuple[int, ...], float],
+    float,
+    str,
+    VariableStats,
+    Optional[CapacityRepair],
+    Optional[SamplingStats],
+]:
+    """
+    枝刈りとウォームスタートの準備をして、エンジンを実行します。
+    (x[p, n] の辞書, 目的関数値, 結果を出したエンジン, 変数の削減量, 容量超過の修復,
+    SAの読み出しの記録) を返します。
+    """
+    # 候補ノードの枝刈り
+    with metrics.stage("prune"):
+        candidates = select_candidates(arrays, settings.max_candidates)
+    variables = VariableStats(
+        total=candidates.size,
+        used=int(candidates.sum()),
+        reduction=1.0 - candidates.sum() / candidates.size,
+    )
+
+    # ウォームスタート (現在の配置、または前回の結果から開始)
+    initial = None
+    if settings.warm_start:
+        initial = _initial_assignment(arrays, candidates, initial_placement)
+
+    # 別プロセスで実行されたSAの記録は得られない
+    _sampling_stats.set(None)
+    check_cancelled()
+    if settings.deadline_ms is None:
+        engine = settings.engine
+        best_sample, energy = ENGINES[engine](
+            instance_data, candidates, settings, initial
+        )
+    else:
+        best_sample, energy, engine = _solve_within_deadline(
+            instance_data, candidates, settings, initial
+        )
+
+    # 容量制約は目的関数に含めていないため、解の容量超過をここで修復する
+    check_cancelled()
+    repair = None
+    if settings.repair_capacity:
+        with metrics.stage("repair"):
+            best_sample, energy, repair = _repair_capacity(
+                arrays, instance_data, candidates, best_sample, energy
+            )
+    return best_sample, energy, engine, variables, repair, _sampling_stats.get()
+
+
+def _repair_capacity(
+    arrays: ClusterArrays,
+    instance_data: Dict[str, Any],
+    candidates: np.ndarray,
+    best_sample: dict[tuple[int, ...], float],
+    energy: float,
+) -> tuple[dict[tuple[int, ...], float], float, Optional[CapacityRepair]]:
+    """
+    容量を超えたノードからPodを移し、(x[p, n] の辞書, 目的関数値, 修復の内容) を返します。
+    容量超過がなければ、解をそのまま返します。
+    """
+    target = _assignment_targets(best_sample, arrays.num_pods, arrays.num_nodes)
+    target, moved, energy_delta, overcommitted, unresolved = repair_capacity(
+        instance_data, candidates, target
+    )
+    if not len(overcommitted):
+        return best_sample, energy, None
+
+    repaired = {(p, n): 1.0 for p, n in enumerate(target.tolist()) if n >= 0}
+    return (
+        repaired,
+        energy + energy_delta,
+        CapacityRepair(
+            overcommitted_nodes=[arrays.node_ids[n] for n in overcommitted],
+            moved_pods=[arrays.pod_ids[p] for p in moved],
+            energy_delta=energy_delta,
+            unresolved_nodes=[arrays.node_ids[n] for n in unresolved],
+        ),
+    )
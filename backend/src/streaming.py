@@ -0,0 +1,173 @@
+import asyncio
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from .arrays import ClusterArrays
+from .models import (
+    Action,
+    ActionType,
+    AnealingSettings,
+    ClusterState,
+    OptimizationResponse,
+    PlacementUpdate,
+)
+from .solver import (
+    _ACTION_CODES,
+    _ACTION_TYPES,
+    SolveCancelled,
+    _action_codes,
+    _assignment_targets,
+    _current_nodes,
+    _prepare_data,
+    cancel_event,
+    progress_callback,
+    solve_prepared,
+)
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+class _PlacementDiff:
+    """
+    直前に送った各Podの割り当て先とアクションを保持し、変わったPodのアクションだけを返します。
+    """
+
+    def __init__(self, arrays: ClusterArrays, instance_data: Dict[str, Any]) -> None:
+        self.pod_ids = arrays.pod_ids
+        self.node_ids = arrays.node_ids
+        self.current = _current_nodes(arrays)
+        # まだ送っていないPodは -3
+        self.target = np.full(arrays.num_pods, -3, dtype=np.int64)
+        self.codes = np.full(arrays.num_pods, -1, dtype=np.int64)
+        # 作成しない候補 (optional の新規Pod) は、作成すると送った後にだけ remove を送る
+        not_created = (np.asarray(instance_data["optional"]) > 0) & ~arrays.pod_placed
+        self.target[not_created] = -1
+        self.codes[not_created] = _ACTION_CODES[ActionType.REMOVE]
+
+    def update(self, target: np.ndarray) -> List[Action]:
+        codes = _action_codes(target, self.current)
+        changed = np.flatnonzero((target != self.target) | (codes != self.codes))
+        self.target, self.codes = target, codes
+        return [
+            Action.model_construct(
+                pod_id=self.pod_ids[p],
+                target_node_id=self.node_ids[target[p]] if target[p] >= 0 else None,
+                action=_ACTION_TYPES[codes[p]],
+            )
+            for p in changed.tolist()
+        ]
+
+    def from_sample(self, sample: dict[tuple[int, ...], float]) -> List[Action]:
+        return self.update(
+            _assignment_targets(sample, len(self.pod_ids), len(self.node_ids))
+        )
+
+    def from_response(self, response: OptimizationResponse) -> List[Action]:
+        pod_index = {pod_id: p for p, pod_id in enumerate(self.pod_ids)}
+        node_index = {node_id: n for n, node_id in enumerate(self.node_ids)}
+        # レスポンスに含まれない (作成しない) 候補は未配置
+        target = np.full(len(self.pod_ids), -1, dtype=np.int64)
+        for action in response.placements:
+            if action.target_node_id is not None:
+                target[pod_index[action.pod_id]] = node_index[action.target_node_id]
+        return self.update(target)
+
+
+def _event(name: str, data: BaseModel | Dict[str, Any]) -> str:
+    payload = (
+        data.model_dump_json() if isinstance(data, BaseModel) else json.dumps(data)
+    )
+    return f"event: {name}\ndata: {payload}\n\n"
+
+
+def stream_placement(
+    state: ClusterState,
+    settings: AnealingSettings,
+    initial_placement: Optional[Dict[str, str]] = None,
+) -> AsyncIterator[str]:
+    """
+    最適化を別スレッドで実行し、途中経過を Server-Sent Events で返すイテレータを作ります。
+    データの準備はここで行うため、不正な入力はストリームの開始前に HTTPException になります。
+
+    - progress: SAのバッチごと (deadline_ms 指定時は貪欲法・局所探索の後も) の最良の実行可能解
+    - result: 容量超過の修復後の最終結果 (final=true)
+    - error: 最適化の失敗 (status_code, detail)
+
+    どの更新も、前回の更新から変わったPodのアクションだけを含みます。
+    クライアントが切断した場合は、次のバッチまたは段階の前で最適化を打ち切ります。
+    """
+    if not state.nodes or not state.pods:
+        raise HTTPException(
+            status_code=400, detail="ノードまたはポッドの情報が不足しています。"
+        )
+    instance_data, pods, arrays = _prepare_data(state, settings)
+    state.pods = pods
+    diff = _PlacementDiff(arrays, instance_data)
+    cancelled = threading.Event()
+
+    def solve(loop: asyncio.AbstractEventLoop, events: asyncio.Queue) -> None:
+        def send(item: Optional[str]) -> None:
+            # 切断された後は、イベントループが閉じていることがある
+            if not cancelled.is_set():
+                loop.call_soon_threadsafe(events.put_nowait, item)
+
+        def on_progress(
+            sample: dict[tuple[int, ...], float],
+            energy: float,
+            num_reads: Optional[int],
+        ) -> None:
+            if cancelled.is_set():
+                raise SolveCancelled()
+            update = PlacementUpdate(
+                energy=energy, num_reads=num_reads, placements=diff.from_sample(sample)
+            )
+            send(_event("progress", update))
+
+        progress_callback.set(on_progress)
+        # 切断されたら、SAのバッチや段階 (貪欲法、局所探索、修復) の間で打ち切る
+        cancel_event.set(cancelled)
+        try:
+            response = solve_prepared(
+                state, arrays, instance_data, settings, initial_placement
+            )
+            update = PlacementUpdate(
+                energy=response.energy,
+                num_reads=response.sampling.num_reads if response.sampling else None,
+                placements=diff.from_response(response),
+                final=True,
+                engine=response.engine,
+                variables=response.variables,
+                repair=response.repair,
+                sampling=response.sampling,
+            )
+            send(_event("result", update))
+        except SolveCancelled:
+            pass
+        except HTTPException as e:
+            send(_event("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            send(_event("error", {"status_code": 500, "detail": str(e)}))
+        finally:
+            send(None)
+
+    async def generate() -> AsyncIterator[str]:
+        events: asyncio.Queue = asyncio.Queue()
+        thread = threading.Thread(
+            target=solve,
+            args=(asyncio.get_running_loop(), events),
+            name="kytos-stream",
+            daemon=True,
+        )
+        thread.start()
+        try:
+            while (item := await events.get()) is not None:
+                yield item
+        finally:
+            cancelled.set()
+
+    return generate()
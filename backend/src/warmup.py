@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Optional
+
+from fastapi import HTTPException
+
+from . import metrics
+from .models import AnealingSettings, ClusterState, Node, Pod, ReadinessInfo
+
+# ウォームアップで実行するエンジン
+# (jijmodeling / OMMX / openjij の読み込み、問題の定義、初回のインスタンス評価)
+WARMUP_ENGINES = ("jijmodeling", "qubo")
+
+
+def _synthetic_state() -> ClusterState:
+    nodes = [
+        Node(id=f"warmup-node{i}", cpu_capacity=4000, mem_capacity=8000)
+        for i in range(3)
+    ]
+    pods = [
+        Pod(
+            id=f"warmup-pod{i}",
+            cpu_usage=500,
+            mem_usage=1000,
+            current_node=f"warmup-node{i % 2}",
+            service=f"warmup-svc{i % 2}",
+        )
+        for i in range(6)
+    ]
+    return ClusterState(nodes=nodes, pods=pods, services=[])
+
+
+def warm_up() -> None:
+    """
+    小さな合成インスタンスを各エンジンで解き、最初のリクエストで発生する読み込みと
+    初期化を済ませます。求解はメトリクスに記録しません。
+    """
+    from .solver import solve_placement
+
+    for engine in WARMUP_ENGINES:
+        settings = AnealingSettings(
+            engine=engine, num_reads=2, seed=0, repair_capacity=False
+        )
+        try:
+            with metrics.disabled():
+                solve_placement(_synthetic_state(), settings)
+        except HTTPException:
+            # 実行可能解が見つからなくても、読み込みと初期化は済んでいる
+            pass
+
+
+class Readiness:
+    """
+    バックグラウンドのウォームアップが終わったかを保持します。
+    enabled が False なら、最初から準備完了です。
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._seconds: Optional[float] = None
+        self._error: Optional[str] = None
+        if not enabled:
+            self._done.set()
+
+    def start(self) -> None:
+        """
+        ウォームアップを別スレッドで開始します。
+        """
+        if self._done.is_set() or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self.run, name="kytos-warmup", daemon=True
+        )
+        self._thread.start()
+
+    def run(self) -> None:
+        """
+        ウォームアップを現在のスレッドで実行します。
+        """
+        start = time.perf_counter()
+        try:
+            warm_up()
+        except Exception as e:
+            self._error = f"{type(e).__name__}: {e}"
+        finally:
+            self._seconds = time.perf_counter() - start
+            self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def info(self) -> ReadinessInfo:
+        if not self._done.is_set():
+            return ReadinessInfo(status="starting")
+        return ReadinessInfo(
+            status="failed" if self._error else "ready",
+            warmup_seconds=self._seconds,
+            error=self._error,
+        )
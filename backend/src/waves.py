@@ -0,0 +1,225 @@
+from typing import List, Optional
+
+import numpy as np
+
+from .arrays import ClusterArrays
+from .models import Action, ActionType, MigrationPlan
+
+# 容量の判定の許容誤差 (相対値)
+_TOLERANCE = 1e-9
+
+
+class _Cluster:
+    """
+    ウェーブを実行するごとの各Podのノードと、ノードの使用量、サービスの稼働中のレプリカ数を保持します。
+    """
+
+    def __init__(self, arrays: ClusterArrays, target: np.ndarray) -> None:
+        self.cpu = arrays.pod_cpu
+        self.mem = arrays.pod_mem
+        self.service = arrays.pod_service
+        # 存在しないノード上のPodは稼働していない
+        self.node = arrays.pod_node.copy()
+        self.cpu_load, self.mem_load = self.loads(self.node, arrays.num_nodes)
+        # 実行前または実行後の配置で容量を超えているノードは、その使用量までは許す
+        final_cpu, final_mem = self.loads(target, arrays.num_nodes)
+        self.cpu_cap = np.maximum.reduce([arrays.node_cpu, self.cpu_load, final_cpu])
+        self.mem_cap = np.maximum.reduce([arrays.node_mem, self.mem_load, final_mem])
+        self.overcommitted = (self.cpu_cap > arrays.node_cpu * (1 + _TOLERANCE)) | (
+            self.mem_cap > arrays.node_mem * (1 + _TOLERANCE)
+        )
+        self.cpu_cap *= 1 + _TOLERANCE
+        self.mem_cap *= 1 + _TOLERANCE
+        running = self.node >= 0
+        grouped = running & (self.service >= 0)
+        self.replicas = np.bincount(
+            self.service[grouped], minlength=len(arrays.service_ids)
+        )
+
+    def loads(self, node: np.ndarray, num_nodes: int) -> tuple[np.ndarray, np.ndarray]:
+        placed = node >= 0
+        return (
+            np.bincount(node[placed], weights=self.cpu[placed], minlength=num_nodes),
+            np.bincount(node[placed], weights=self.mem[placed], minlength=num_nodes),
+        )
+
+    def move(self, p: int, n: int) -> None:
+        """
+        Pod p をノード n に移します。n が -1 なら削除します。
+        """
+        old = self.node[p]
+        if old >= 0:
+            self.cpu_load[old] -= self.cpu[p]
+            self.mem_load[old] -= self.mem[p]
+        if n >= 0:
+            self.cpu_load[n] += self.cpu[p]
+            self.mem_load[n] += self.mem[p]
+        if self.service[p] >= 0:
+            self.replicas[self.service[p]] += int(n >= 0) - int(old >= 0)
+        self.node[p] = n
+
+
+class _Wave:
+    """
+    実行中のウェーブに加えたアクションによる、ノードへの流入量とサービスごとの停止数を保持します。
+    ウェーブの実行中は、移動元のPodもまだ容量を使っているものとします。
+    """
+
+    def __init__(self, cluster: _Cluster, limit: np.ndarray) -> None:
+        self.cluster = cluster
+        self.limit = limit
+        self.cpu_in = np.zeros(len(cluster.cpu_cap))
+        self.mem_in = np.zeros(len(cluster.mem_cap))
+        self.stopped = np.zeros(len(limit), dtype=np.int64)
+        self.moves: List[tuple[int, int]] = []
+
+    def fits(self, p: int, n: int) -> bool:
+        c = self.cluster
+        return n < 0 or bool(
+            c.cpu_load[n] + self.cpu_in[n] + c.cpu[p] <= c.cpu_cap[n]
+            and c.mem_load[n] + self.mem_in[n] + c.mem[p] <= c.mem_cap[n]
+        )
+
+    def available(self, p: int) -> bool:
+        # 稼働中のPodを動かす・削除すると、そのサービスのレプリカが1つ停止する
+        s = self.cluster.service[p]
+        return s < 0 or self.cluster.node[p] < 0 or self.stopped[s] < self.limit[s]
+
+    def add(self, p: int, n: int) -> None:
+        c = self.cluster
+        if n >= 0:
+            self.cpu_in[n] += c.cpu[p]
+            self.mem_in[n] += c.mem[p]
+        if c.service[p] >= 0 and c.node[p] >= 0:
+            self.stopped[c.service[p]] += 1
+        self.moves.append((p, n))
+
+
+def schedule_waves(arrays: ClusterArrays, actions: List[Action]) -> MigrationPlan:
+    """
+    アクション (keep 以外) を、順に実行するウェーブに分けます。
+    同じウェーブのアクションは並列に実行でき、次のウェーブはその完了後に始めます。
+
+    - 容量: ウェーブの実行中は移動元のPodもまだ容量を使い (完了後に解放)、移動先には
+      移動してくるPodの分が加わるものとして、どのノードも容量を超えないようにする
+    - 可用性: 動かす・削除する稼働中のPodは実行中に停止するものとして、サービス (Podの service)
+      ごとに稼働中のレプリカを少なくとも1つ残す
+
+    ウェーブ数を少なくするため、空きを作る削除を先に、大きいPodから順に詰めます。
+    どのアクションも実行できない場合は、空きのあるノードへPodを一時的に移します (staged_pods)。
+    それもできない場合は、容量の超過を避けられないアクションを1つだけ実行します。
+    稼働中のレプリカが1つで、これから作成するPodもないサービスは、停止を避けられません
+    (unavailable_services)。実行前または実行後の配置で容量を超えているノードは、
+    その使用量までを上限とします (overcommitted_nodes)。
+    """
+    pod_index = {pod_id: p for p, pod_id in enumerate(arrays.pod_ids)}
+    node_index = {node_id: n for n, node_id in enumerate(arrays.node_ids)}
+    pending = [
+        (
+            pod_index[action.pod_id],
+            -1 if action.target_node_id is None else node_index[action.target_node_id],
+            action,
+        )
+        for action in actions
+        if action.action != ActionType.KEEP
+    ]
+    target = arrays.pod_node.copy()
+    for p, n, _ in pending:
+        target[p] = n
+    cluster = _Cluster(arrays, target)
+    size = cluster.cpu / max(arrays.node_cpu.sum(), 1e-9) + cluster.mem / max(
+        arrays.node_mem.sum(), 1e-9
+    )
+    pending.sort(key=lambda item: (item[1] >= 0, -size[item[0]]))
+
+    waves: List[List[Action]] = []
+    staged: List[str] = []
+    overcommitted = [arrays.node_ids[n] for n in np.flatnonzero(cluster.overcommitted)]
+    unavailable: List[str] = []
+    while pending:
+        # 稼働中のレプリカが1つで、これから作成するPodもないサービスは、1つずつなら停止を許す
+        created = np.zeros(len(arrays.service_ids), dtype=bool)
+        for p, n, _ in pending:
+            if n >= 0 and cluster.node[p] < 0 and cluster.service[p] >= 0:
+                created[cluster.service[p]] = True
+        limit = np.where((cluster.replicas <= 1) & ~created, 1, cluster.replicas - 1)
+        wave = _Wave(cluster, limit)
+        actions_in_wave: List[Action] = []
+        rest = []
+        for p, n, action in pending:
+            if wave.available(p) and wave.fits(p, n):
+                wave.add(p, n)
+                actions_in_wave.append(action)
+            else:
+                rest.append((p, n, action))
+
+        if not actions_in_wave:
+            staging = _staging_move(wave, rest, staged, arrays)
+            if staging is not None:
+                p, t = staging
+                wave.add(p, t)
+                actions_in_wave.append(
+                    Action.model_construct(
+                        pod_id=arrays.pod_ids[p],
+                        target_node_id=arrays.node_ids[t],
+                        action=ActionType.MOVE,
+                    )
+                )
+                staged.append(arrays.pod_ids[p])
+            else:
+                # 容量を超えても、停止を増やさないアクションを1つ実行する
+                i = next(
+                    (i for i, (p, _, _) in enumerate(rest) if wave.available(p)), 0
+                )
+                p, n, action = rest.pop(i)
+                if n >= 0 and arrays.node_ids[n] not in overcommitted:
+                    overcommitted.append(arrays.node_ids[n])
+                wave.add(p, n)
+                actions_in_wave.append(action)
+
+        stopped_all = (wave.stopped > 0) & (wave.stopped >= cluster.replicas)
+        for s in np.flatnonzero(stopped_all).tolist():
+            if arrays.service_ids[s] not in unavailable:
+                unavailable.append(arrays.service_ids[s])
+        for p, n in wave.moves:
+            cluster.move(p, n)
+        waves.append(actions_in_wave)
+        pending = rest
+
+    return MigrationPlan(
+        waves=waves,
+        staged_pods=staged,
+        overcommitted_nodes=overcommitted,
+        unavailable_services=unavailable,
+    )
+
+
+def _staging_move(
+    wave: _Wave,
+    pending: List[tuple[int, int, Action]],
+    staged: List[str],
+    arrays: ClusterArrays,
+) -> Optional[tuple[int, int]]:
+    """
+    移動先の空きを待っている稼働中のPodを、空きのある別のノードへ一時的に移す (Pod, ノード) を返します。
+    空きの割合が最も大きいノードを選びます。同じPodは2度移しません。
+    """
+    cluster = wave.cluster
+    free = np.minimum(
+        1 - cluster.cpu_load / np.maximum(arrays.node_cpu, 1e-9),
+        1 - cluster.mem_load / np.maximum(arrays.node_mem, 1e-9),
+    )
+    for p, n, _ in pending:
+        current = cluster.node[p]
+        if n < 0 or current < 0 or arrays.pod_ids[p] in staged:
+            continue
+        if not wave.available(p):
+            continue
+        candidates = [
+            t
+            for t in np.argsort(-free, kind="stable").tolist()
+            if t != current and t != n and wave.fits(p, t)
+        ]
+        if candidates:
+            return p, candidates[0]
+    return None
@@ -1,6 +1,52 @@
+import asyncio
+import io
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import jijmodeling as jm
+import numpy as np
 from fastapi.testclient import TestClient
-from main import app
-from src.models import ClusterState, Node, Pod
+from prometheus_client import REGISTRY
+from main import app, job_manager, readiness, recorder, result_cache, session_store
+from benchmarks.autoscaling import check_plan, make_autoscaling_cluster
+from benchmarks.decode import decode_result_loop
+from benchmarks.replay import _replay_one, load_records, summarize
+from benchmarks.waves import check_waves, make_rebalance_cluster
+from src import parallel
+from src.arrays import ClusterArrays
+from src.engines import repair_capacity
+from src.jobs import JobManager
+from src.model_cache import ModelCache
+from src.models import (
+    Action,
+    ActionType,
+    AnealingSettings,
+    ClusterState,
+    JobRequest,
+    Node,
+    OptimizationResponse,
+    Pod,
+    ServiceProfile,
+)
+from src.pruning import select_candidates
+from src.recorder import RecordReader, Recorder, log_files, read_records
+from src.qubo import build_qubo
+from src.result_cache import ResultCache
+from src.solver import (
+    _decode_result,
+    _define_problem,
+    _prepare_data,
+    model_cache,
+    solve_placement,
+)
+from src.streaming import stream_placement
+from src.warmup import WARMUP_ENGINES, Readiness
+from src.waves import schedule_waves
 
 client = TestClient(app)
 
@@ -70,7 +116,1436 @@ def test_recovery():
     print("Recovery Result:", data)
 
 
+def test_model_cache():
+    nodes = [
+        Node(id="node1", cpu_capacity=4000, mem_capacity=16000),
+        Node(id="node2", cpu_capacity=4000, mem_capacity=16000),
+    ]
+    pods = [
+        Pod(id="pod1", cpu_usage=500, mem_usage=1024, current_node="node1"),
+        Pod(id="pod2", cpu_usage=500, mem_usage=1024, current_node="node1"),
+    ]
+    state = ClusterState(nodes=nodes, pods=pods, services=[])
+
+    before = client.get("/cache/model").json()
+    # 負荷と重みが違っても、候補と optional が同じならインスタンスを再利用する
+    for cpu_usage, weight in ((500, 5.0), (900, 8.0)):
+        for pod in state.pods:
+            pod.cpu_usage = cpu_usage
+        response = client.post(
+            "/optimize",
+            json={
+                "state": state.model_dump(),
+                "settings": {"num_reads": 5, "load_balance_weight": weight},
+                "bypass_cache": True,  # 結果キャッシュを通さずにモデルキャッシュを使う
+            },
+        )
+        assert response.status_code == 200
+
+    after = client.get("/cache/model").json()
+    hits = after["instance"]["hits"] - before.get("instance", {}).get("hits", 0)
+    assert hits >= 1
+    assert after["problem"]["hits"] >= 1
+
+    # 合計サイズの上限を超えたら古いものから破棄し、上限より大きい値は保持しない
+    cache = ModelCache(max_bytes=100)
+    cache.get_or_build("instance", "a", lambda: "a", lambda _: 60)
+    cache.get_or_build("instance", "b", lambda: "b", lambda _: 60)
+    cache.get_or_build("instance", "c", lambda: "c", lambda _: 200)
+    cache.get_or_build("instance", "b", lambda: "b", lambda _: 60)
+    cache.get_or_build("instance", "a", lambda: "a", lambda _: 60)
+    assert cache.stats()["instance"]["hits"] == 1
+    assert cache.stats()["instance"]["misses"] == 4
+
+
+def _prepare_data_loop(state: ClusterState, settings: AnealingSettings) -> dict:
+    # ベクトル化前のループ実装 (等価性テストの基準)
+    pods = state.pods
+    m_costs = []
+    for pod in pods:
+        row = []
+        for node in state.nodes:
+            if pod.current_node is None or pod.current_node == node.id:
+                row.append(0.0)
+                continue
+            row.append(
+                1.0
+                + 0.3 * pod.priority
+                + pod.mem_usage
+                * (10**settings.mem_digit_adjustment)
+                * settings.move_cost_resource_coeff
+                + pod.cpu_usage
+                * (10**settings.cpu_digit_adjustment)
+                * settings.move_cost_resource_coeff
+            )
+        m_costs.append(row)
+
+    service_members: dict = {}
+    for i, pod in enumerate(pods):
+        if pod.service:
+            service_members.setdefault(pod.service, []).append(i)
+
+    return {
+        "pods": [
+            [1 if pod.current_node == node.id else 0 for node in state.nodes]
+            for pod in pods
+        ],
+        "cpuReq": [p.cpu_usage * (10**settings.cpu_digit_adjustment) for p in pods],
+        "memReq": [p.mem_usage * (10**settings.mem_digit_adjustment) for p in pods],
+        "cpuCap": [
+            n.cpu_capacity * (10**settings.cpu_digit_adjustment) for n in state.nodes
+        ],
+        "memCap": [
+            n.mem_capacity * (10**settings.mem_digit_adjustment) for n in state.nodes
+        ],
+        "moveCost": m_costs,
+        "serviceMembers": list(service_members.values()) or [[]],
+    }
+
+
+def _mixed_state() -> ClusterState:
+    # 新規Pod、障害ノード上のPod、サービス所属Podを含むテスト用クラスタ
+    # (負荷分散項が大きいため、解くときは one_hot_relaxed_weight を上げる)
+    nodes = [
+        Node(id=f"node{i}", cpu_capacity=4000 + 500 * i, mem_capacity=16000)
+        for i in range(4)
+    ]
+    pods = [
+        Pod(
+            id=f"pod{i}",
+            cpu_usage=100 + 37 * i,
+            mem_usage=256 + 91 * i,
+            current_node=[None, "node0", "node2", "node9"][i % 4],  # node9 は障害ノード
+            service=[None, "api", "db"][i % 3],
+            priority=1 + i % 2,
+        )
+        for i in range(11)
+    ]
+    return ClusterState(nodes=nodes, pods=pods, services=[])
+
+
+def test_prepare_data_matches_loop():
+    state = _mixed_state()
+    settings = AnealingSettings()
+
+    data, _, _ = _prepare_data(state, settings)
+    expected = _prepare_data_loop(state, settings)
+    for key, value in expected.items():
+        if key == "serviceMembers":
+            assert data[key] == value
+            continue
+        assert np.array_equal(data[key], np.array(value)), key
+
+
+def test_qubo_energy_matches_jijmodeling():
+    state = _mixed_state()
+    settings = AnealingSettings()
+    data, _, arrays = _prepare_data(state, settings)
+
+    rng = np.random.default_rng(0)
+    # 候補を絞った場合は、候補の組だけが変数になる
+    for candidates in (
+        np.ones((len(state.pods), len(state.nodes)), dtype=np.int64),
+        select_candidates(arrays, 2).astype(np.int64),
+    ):
+        instance = jm.Interpreter({**data, "candidates": candidates}).eval_problem(
+            _define_problem()
+        )
+        var_ids = {
+            tuple(v.subscripts): v.id
+            for v in instance.used_decision_variables
+            if v.name == "x"
+        }
+        assert len(var_ids) == candidates.sum()
+        model = build_qubo(data, settings.one_hot_relaxed_weight, candidates > 0)
+
+        for _ in range(5):
+            x = rng.integers(0, 2, size=candidates.shape) * candidates
+            expected = instance.evaluate(
+                {
+                    v.id: int(x[tuple(v.subscripts)]) if v.name == "x" else 0
+                    for v in instance.decision_variables
+                }
+            ).objective
+            energy = model.objective(x[model.var_pod, model.var_node])[0]
+            assert np.isclose(energy, expected)
+
+
+def test_optimize_qubo_engine():
+    state = _mixed_state()
+    response = client.post(
+        "/optimize",
+        json={
+            "state": state.model_dump(),
+            "settings": {"engine": "qubo", "one_hot_relaxed_weight": 2000.0},
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["placements"]) == len(state.pods)
+    assert all(a["action"] != "remove" for a in data["placements"])
+
+
+def test_candidate_pruning():
+    state = _mixed_state()
+    _, _, arrays = _prepare_data(state, AnealingSettings())
+    candidates = select_candidates(arrays, 2)
+
+    assert (candidates.sum(axis=1) <= 2).all()
+    placed = arrays.pod_node >= 0
+    assert candidates[placed, arrays.pod_node[placed]].all()
+
+    for engine in ("jijmodeling", "qubo"):
+        response = client.post(
+            "/optimize",
+            json={
+                "state": state.model_dump(),
+                "settings": {
+                    "engine": engine,
+                    "max_candidates": 2,
+                    "one_hot_relaxed_weight": 2000.0,
+                },
+            },
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["variables"]["used"] < data["variables"]["total"]
+        for p, action in enumerate(data["placements"]):
+            assert candidates[p, arrays.node_ids.index(action["target_node_id"])]
+
+    # 候補ノード数が0の設定は拒否する
+    response = client.post(
+        "/optimize",
+        json={"state": state.model_dump(), "settings": {"max_candidates": 0}},
+    )
+    assert response.status_code == 422
+
+
+def test_warm_start():
+    state = _mixed_state()
+    # 前回の結果として、全Podを node1 に置いた配置から開始する
+    initial_placement = {pod.id: "node1" for pod in state.pods}
+
+    for engine in ("jijmodeling", "qubo"):
+        response = client.post(
+            "/optimize",
+            json={
+                "state": state.model_dump(),
+                "settings": {
+                    "engine": engine,
+                    "warm_start": True,
+                    "warm_start_num_sweeps": 20,
+                    "num_reads": 5,
+                    "one_hot_relaxed_weight": 2000.0,
+                },
+                "initial_placement": initial_placement,
+            },
+        )
+        assert response.status_code == 200
+        assert len(response.json()["placements"]) == len(state.pods)
+
+    # 開始温度を決められない設定は拒否する
+    for invalid in ({"warm_start_acceptance": 1.0}, {"warm_start_num_sweeps": 0}):
+        response = client.post(
+            "/optimize",
+            json={
+                "state": state.model_dump(),
+                "settings": {"warm_start": True, **invalid},
+            },
+        )
+        assert response.status_code == 422
+
+
+def test_jobs():
+    state = _mixed_state()
+    payload = {
+        "state": state.model_dump(),
+        "settings": {"engine": "qubo", "one_hot_relaxed_weight": 2000.0},
+    }
+
+    response = client.post("/jobs", json=payload)
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    for _ in range(600):
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.1)
+    assert job["status"] == "succeeded"
+    assert len(job["result"]["placements"]) == len(state.pods)
+
+    # 期限切れとキャンセル
+    expired = client.post("/jobs", json={**payload, "deadline_ms": 0}).json()
+    time.sleep(0.01)
+    assert client.get(f"/jobs/{expired['id']}").json()["status"] == "expired"
+
+    queued = client.post("/jobs", json=payload).json()
+    assert client.delete(f"/jobs/{queued['id']}").json()["status"] == "cancelled"
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_jobs_backpressure():
+    original = job_manager.max_pending
+    job_manager.max_pending = 0
+    try:
+        response = client.post("/jobs", json={"state": _mixed_state().model_dump()})
+        assert response.status_code == 429
+    finally:
+        job_manager.max_pending = original
+
+
+def test_jobs_broken_pool():
+    # ワーカーが異常終了しても、次のジョブは新しいプールで実行する
+    manager = JobManager(max_workers=1)
+    request = JobRequest(
+        state=_mixed_state(), settings=AnealingSettings(engine="greedy")
+    )
+
+    def wait(job_id):
+        for _ in range(600):
+            job = manager.get(job_id)
+            if job.status.value not in ("queued", "running"):
+                return job
+            time.sleep(0.1)
+        return job
+
+    try:
+        broken = manager.submit(request)
+        for process in list(manager._executor._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+        assert wait(broken.id).status.value == "failed"
+
+        job = wait(manager.submit(request).id)
+        assert job.status.value == "succeeded"
+        assert len(job.result.placements) == len(request.state.pods)
+    finally:
+        manager.shutdown()
+
+
+def test_jobs_cancel_running():
+    # 実行中のジョブをキャンセルすると、ワーカーと受付枠がすぐに空く
+    manager = JobManager(max_workers=1, max_pending=1)
+    slow = JobRequest(
+        state=_mixed_state(),
+        settings=AnealingSettings(
+            engine="qubo",
+            one_hot_relaxed_weight=2000.0,
+            num_reads=1_000_000,
+            sampling_batch_reads=100,
+        ),
+    )
+    fast = JobRequest(state=_mixed_state(), settings=AnealingSettings(engine="greedy"))
+
+    def wait(job_id, statuses):
+        for _ in range(600):
+            job = manager.get(job_id)
+            if job.status.value not in statuses:
+                return job
+            time.sleep(0.1)
+        return job
+
+    try:
+        running = manager.submit(slow)
+        assert wait(running.id, ("queued",)).status.value == "running"
+        time.sleep(1.0)
+        assert manager.cancel(running.id).status.value == "cancelled"
+
+        start = time.monotonic()
+        job = wait(manager.submit(fast).id, ("queued", "running"))
+        assert job.status.value == "succeeded"
+        assert time.monotonic() - start < 30
+        assert manager.get(running.id).status.value == "cancelled"
+    finally:
+        manager.shutdown()
+
+
+def test_parallel_sampling():
+    state = _mixed_state()
+    for engine in ("jijmodeling", "qubo"):
+        settings = AnealingSettings(
+            engine=engine,
+            num_reads=6,
+            num_workers=2,
+            seed=42,
+            one_hot_relaxed_weight=2000.0,
+        )
+        first = solve_placement(state.model_copy(deep=True), settings)
+        second = solve_placement(state.model_copy(deep=True), settings)
+        assert first.energy == second.energy
+        assert first.placements == second.placements
+
+    # プロセス数が0の設定は拒否する
+    response = client.post(
+        "/optimize",
+        json={"state": state.model_dump(), "settings": {"num_workers": 0}},
+    )
+    assert response.status_code == 422
+
+
+def test_sessions():
+    state = _mixed_state()
+    settings = AnealingSettings(one_hot_relaxed_weight=2000.0)
+    response = client.post(
+        "/sessions",
+        json={"state": state.model_dump(), "settings": settings.model_dump()},
+    )
+    assert response.status_code == 201
+    session_id = response.json()["id"]
+
+    new_pod = Pod(id="pod99", cpu_usage=300, mem_usage=512, service="api")
+    deltas = [
+        {"op": "add_pod", "pod": new_pod.model_dump()},
+        {"op": "remove_pod", "pod_id": "pod4"},
+        {"op": "resize_pod", "pod_id": "pod2", "cpu_usage": 900},
+        {"op": "move_pod", "pod_id": "pod1", "node_id": "node3"},
+        {"op": "drain_node", "node_id": "node2"},
+        {
+            "op": "add_node",
+            "node": {"id": "node9", "cpu_capacity": 6000, "mem_capacity": 16000},
+        },
+    ]
+    response = client.patch(f"/sessions/{session_id}", json={"deltas": deltas})
+    assert response.status_code == 200
+    assert response.json()["num_pods"] == 11
+    assert response.json()["num_nodes"] == 4
+
+    # 同じ変更を加えた状態から作り直した係数と一致すること
+    expected_state = _mixed_state()
+    pods = [pod for pod in expected_state.pods if pod.id != "pod4"] + [new_pod]
+    pods[2].cpu_usage = 900
+    pods[1].current_node = "node3"
+    nodes = [node for node in expected_state.nodes if node.id != "node2"]
+    nodes.append(Node(id="node9", cpu_capacity=6000, mem_capacity=16000))
+    expected, _, _ = _prepare_data(
+        ClusterState(nodes=nodes, pods=pods, services=[]), settings
+    )
+    data = session_store.get(session_id).data
+    for key, value in expected.items():
+        if key == "serviceMembers":
+            assert data[key] == value
+            continue
+        assert np.array_equal(data[key], value), key
+
+    response = client.post(f"/sessions/{session_id}/optimize", json={})
+    assert response.status_code == 200
+    assert len(response.json()["placements"]) == 11
+
+    # 最適化に渡した設定はその呼び出しだけに使う
+    override = {**settings.model_dump(), "engine": "greedy", "move_cost_weight": 9.0}
+    response = client.post(
+        f"/sessions/{session_id}/optimize", json={"settings": override}
+    )
+    assert response.json()["engine"] == "greedy"
+    session = session_store.get(session_id)
+    assert session.settings == settings
+    assert session.data["moveCostWeight"] == settings.move_cost_weight
+
+    response = client.patch(
+        f"/sessions/{session_id}",
+        json={"deltas": [{"op": "remove_pod", "pod_id": "nope"}]},
+    )
+    assert response.status_code == 404
+    assert client.delete(f"/sessions/{session_id}").status_code == 204
+    assert client.post(f"/sessions/{session_id}/optimize", json={}).status_code == 404
+
+    # オートスケーリングの対象のサービスのPodを削除すると、計画を作り直す
+    scaled = _mixed_state()
+    scaled.services = [
+        ServiceProfile(
+            id="api",
+            load_balancer_pod="pod1",
+            auto_scaling_enabled=True,
+            current_request_rate=500,
+        )
+    ]
+    response = client.post(
+        "/sessions",
+        json={"state": scaled.model_dump(), "settings": settings.model_dump()},
+    )
+    session_id = response.json()["id"]
+    response = client.patch(
+        f"/sessions/{session_id}",
+        json={"deltas": [{"op": "remove_pod", "pod_id": "pod4"}]},
+    )
+    # 残る3つに対して目標は5なので、候補が2つになる
+    assert response.json()["num_pods"] == 12
+    scaled.pods = [pod for pod in scaled.pods if pod.id != "pod4"]
+    expected, _, _ = _prepare_data(scaled, settings)
+    data = session_store.get(session_id).data
+    for key, value in expected.items():
+        if key == "serviceMembers":
+            assert data[key] == value
+            continue
+        assert np.array_equal(data[key], value), key
+    client.delete(f"/sessions/{session_id}")
+
+
+def test_engines():
+    state = _mixed_state()
+    settings = AnealingSettings(one_hot_relaxed_weight=2000.0)
+    data, _, _ = _prepare_data(state.model_copy(deep=True), settings)
+    model = build_qubo(data, settings.one_hot_relaxed_weight)
+
+    energies = {}
+    for engine in ("greedy", "local_search"):
+        response = client.post(
+            "/optimize",
+            json={
+                "state": state.model_dump(),
+                "settings": {**settings.model_dump(), "engine": engine},
+            },
+        )
+        assert response.status_code == 200
+        result = response.json()
+        assert result["engine"] == engine
+        assert all(a["action"] != "remove" for a in result["placements"])
+
+        # 報告されたエネルギーは、配置に対する目的関数値と一致すること
+        node_index = {node.id: n for n, node in enumerate(state.nodes)}
+        sample = np.zeros(model.num_variables)
+        for p, pod in enumerate(result["pods"]):
+            sample[
+                (model.var_pod == p)
+                & (model.var_node == node_index[pod["current_node"]])
+            ] = 1
+        assert np.isclose(model.objective(sample)[0], result["energy"])
+        energies[engine] = result["energy"]
+    assert energies["local_search"] <= energies["greedy"] + 1e-9
+
+    # 期限内にSAを実行できなくても、貪欲法の解を返す
+    response = client.post(
+        "/optimize",
+        json={
+            "state": state.model_dump(),
+            "settings": {**settings.model_dump(), "deadline_ms": 1},
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["engine"] in ("greedy", "local_search")
+
+    # 読み出し数が0、期限が0以下の設定は拒否する
+    for invalid in ({"num_reads": 0}, {"deadline_ms": 0}):
+        response = client.post(
+            "/optimize",
+            json={"state": state.model_dump(), "settings": invalid},
+        )
+        assert response.status_code == 422
+
+
+def test_deadline_stops_sampling():
+    # 期限を過ぎたSAは打ち切られ、プールがなければ現在のプロセスで実行する
+    state = _mixed_state()
+    settings = {
+        "engine": "qubo",
+        "num_reads": 1_000_000,
+        "deadline_ms": 2000,
+        "one_hot_relaxed_weight": 2000.0,
+    }
+    parallel.shutdown(wait=True)
+    start = time.monotonic()
+    response = client.post(
+        "/optimize", json={"state": state.model_dump(), "settings": settings}
+    )
+    assert response.status_code == 200
+    assert time.monotonic() - start < 20
+    assert not parallel.is_warm()
+
+    # 起動済みのプールで実行した場合も、期限を過ぎたワーカーは読み出しをやめる
+    parallel.run_parallel(abs, [(1,), (2,)])
+    assert parallel.is_warm()
+    response = client.post(
+        "/optimize",
+        json={"state": state.model_dump(), "settings": settings, "bypass_cache": True},
+    )
+    assert response.status_code == 200
+    closing = threading.Thread(target=parallel.shutdown, kwargs={"wait": True})
+    closing.start()
+    closing.join(timeout=60)
+    assert not closing.is_alive()
+
+
+def test_decode_result_matches_loop():
+    state = _mixed_state()
+    num_pods, num_nodes = len(state.pods), len(state.nodes)
+    rng = np.random.default_rng(0)
+    assignment = np.zeros((num_pods, num_nodes), dtype=np.int8)
+    assignment[np.arange(num_pods), rng.integers(num_nodes, size=num_pods)] = 1
+    assignment[0] = 0  # 未割り当て
+    assignment[1, :2] = 1  # 複数のノードに割り当て
+    response = {(int(p), int(n)): 1.0 for p, n in zip(*np.nonzero(assignment))}
+
+    expected = decode_result_loop(response, state)
+    assert _decode_result(response, state) == expected
+    assert _decode_result(assignment, state) == expected
+
+
+def test_metrics():
+    state = _mixed_state()
+    response = client.post(
+        "/optimize?timings=true",
+        json={"state": state.model_dump(), "settings": {"engine": "greedy"}},
+    )
+    assert response.status_code == 200
+    timings = response.json()["timings"]
+    for stage in ("validate", "prepare", "prune", "search", "decode"):
+        assert timings[stage] >= 0
+
+    response = client.post(
+        "/optimize",
+        json={"state": state.model_dump(), "settings": {"engine": "greedy"}},
+    )
+    assert response.json()["timings"] is None
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'kytos_solver_stage_seconds_count{stage="decode"}' in response.text
+    assert 'kytos_optimize_total{engine="greedy",status="ok"}' in response.text
+    assert 'kytos_solver_variables_sum{engine="greedy"} ' in response.text
+
+
+def test_result_cache():
+    result_cache.clear()
+    state = _mixed_state()
+    body = {"state": state.model_dump(), "settings": {"engine": "greedy"}}
+    first = client.post("/optimize", json=body).json()
+    assert first["cached"] is False
+
+    # nodes と pods の順序が違っても同じ状態として扱う
+    shuffled = state.model_copy(deep=True)
+    shuffled.nodes.reverse()
+    shuffled.pods.reverse()
+    second = client.post(
+        "/optimize", json={**body, "state": shuffled.model_dump()}
+    ).json()
+    assert second["cached"] is True
+    assert second["placements"] == first["placements"]
+
+    third = client.post("/optimize", json={**body, "bypass_cache": True}).json()
+    assert third["cached"] is False
+    assert client.get("/cache/result").json()["hits"] == 1
+
+    # 合計バイト数の上限を超えたら古い結果から破棄する
+    cache = ResultCache(max_bytes=len(json.dumps(first)) * 3 // 2)
+    response = OptimizationResponse.model_validate(first)
+    cache.get_or_solve("a", lambda: response)
+    cache.get_or_solve("b", lambda: response)
+    assert cache.stats()["entries"] == 1
+    assert cache.get_or_solve("b", lambda: response).cached is True
+    assert cache.get_or_solve("a", lambda: response).cached is False
+
+
+def test_columnar():
+    result_cache.clear()
+    state = _mixed_state()
+    settings = {"engine": "greedy"}
+    expected = client.post(
+        "/optimize", json={"state": state.model_dump(), "settings": settings}
+    ).json()
+
+    arrays = ClusterArrays.from_state(state)
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        node_ids=arrays.node_ids,
+        node_cpu=arrays.node_cpu,
+        node_mem=arrays.node_mem,
+        pod_ids=arrays.pod_ids,
+        pod_cpu=arrays.pod_cpu,
+        pod_mem=arrays.pod_mem,
+        pod_priority=arrays.pod_priority,
+        pod_node=arrays.pod_node,
+        pod_placed=arrays.pod_placed,
+        service_ids=arrays.service_ids,
+        pod_service=arrays.pod_service,
+        settings=json.dumps(settings),
+    )
+    response = client.post(
+        "/optimize",
+        content=buffer.getvalue(),
+        headers={"Content-Type": "application/x-npz"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-npz"
+    result = np.load(io.BytesIO(response.content))
+    assert float(result["energy"]) == expected["energy"]
+    node_ids = list(result["node_ids"])
+    placements = [
+        {
+            "pod_id": pod_id,
+            "target_node_id": node_ids[n] if n >= 0 else None,
+            "action": action,
+        }
+        for pod_id, n, action in zip(
+            result["pod_ids"], result["target"], result["actions"]
+        )
+    ]
+    assert placements == expected["placements"]
+
+    # JSONのリクエストでも列形式で受け取れる
+    response = client.post(
+        "/optimize",
+        json={"state": state.model_dump(), "settings": settings},
+        headers={"Accept": "application/x-npz"},
+    )
+    assert np.array_equal(
+        np.load(io.BytesIO(response.content))["target"], result["target"]
+    )
+
+    response = client.post(
+        "/optimize",
+        content=b"not npz",
+        headers={"Content-Type": "application/x-npz"},
+    )
+    assert response.status_code == 422
+
+
+def test_columnar_autoscaling():
+    # 列形式でも services のオートスケール計画を適用し、JSONと同じ結果になる
+    result_cache.clear()
+    nodes = [Node(id=f"node{i}", cpu_capacity=4, mem_capacity=8) for i in range(3)]
+    pods = [
+        Pod(
+            id=f"web{i}",
+            cpu_usage=0.5,
+            mem_usage=1,
+            current_node="node0",
+            service="web",
+        )
+        for i in range(2)
+    ]
+    services = [
+        ServiceProfile(
+            id="web",
+            load_balancer_pod="web0",
+            auto_scaling_enabled=True,
+            current_request_rate=400,
+        )
+    ]
+    state = ClusterState(nodes=nodes, pods=pods, services=services)
+    settings = {"engine": "greedy", "desire_weight": 50.0}
+    expected = client.post(
+        "/optimize", json={"state": state.model_dump(), "settings": settings}
+    ).json()
+
+    arrays = ClusterArrays.from_state(state)
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        node_ids=arrays.node_ids,
+        node_cpu=arrays.node_cpu,
+        node_mem=arrays.node_mem,
+        pod_ids=arrays.pod_ids,
+        pod_cpu=arrays.pod_cpu,
+        pod_mem=arrays.pod_mem,
+        pod_node=arrays.pod_node,
+        service_ids=arrays.service_ids,
+        pod_service=arrays.pod_service,
+        settings=json.dumps(settings),
+        services=json.dumps([service.model_dump() for service in services]),
+    )
+    response = client.post(
+        "/optimize",
+        content=buffer.getvalue(),
+        headers={"Content-Type": "application/x-npz", "Accept": "application/json"},
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["energy"] == expected["energy"]
+    # 追加した2つの新規Podも結果に含まれる
+    assert len(result["pod_ids"]) == len(pods) + 2
+    assert sorted(result["actions"]) == sorted(
+        action["action"] for action in expected["placements"]
+    )
+
+    columns = dict(np.load(io.BytesIO(buffer.getvalue())))
+    invalid = io.BytesIO()
+    np.savez(invalid, **{**columns, "services": "not json"})
+    response = client.post(
+        "/optimize",
+        content=invalid.getvalue(),
+        headers={"Content-Type": "application/x-npz"},
+    )
+    assert response.status_code == 422
+
+
+def test_batch():
+    state = _mixed_state()
+    settings = {"engine": "greedy"}
+    body = {
+        "state": state.model_dump(),
+        "settings": settings,
+        "scenarios": [
+            {"name": "baseline"},
+            {
+                "name": "node0 down",
+                "deltas": [{"op": "drain_node", "node_id": "node0"}],
+            },
+            {
+                "name": "new pod",
+                "deltas": [
+                    {
+                        "op": "add_pod",
+                        "pod": {"id": "new", "cpu_usage": 300, "mem_usage": 512},
+                    }
+                ],
+                "settings": {"engine": "local_search", "move_cost_weight": 0.1},
+            },
+        ],
+    }
+    response = client.post("/optimize/batch", json=body)
+    assert response.status_code == 200
+    baseline, drained, added = response.json()["results"]
+
+    # 個別に /optimize した結果と一致する
+    expected = solve_placement(_mixed_state(), AnealingSettings(**settings))
+    assert baseline["energy"] == expected.energy
+    assert baseline["placements"] == [
+        a.model_dump(mode="json") for a in expected.placements
+    ]
+
+    down = _mixed_state()
+    down.nodes = [node for node in down.nodes if node.id != "node0"]
+    expected = solve_placement(down, AnealingSettings(**settings))
+    assert drained["energy"] == expected.energy
+    assert drained["moves"] == sum(
+        a.action.value == "move" for a in expected.placements
+    )
+    assert all(a["target_node_id"] != "node0" for a in drained["placements"])
+
+    assert added["engine"] == "local_search"
+    assert added["placements"][-1]["pod_id"] == "new"
+
+    # 差分が不正なシナリオはどのシナリオも解かずに失敗する
+    body["scenarios"].append({"deltas": [{"op": "drain_node", "node_id": "missing"}]})
+    response = client.post("/optimize/batch", json=body)
+    assert response.status_code == 404
+    assert response.json()["detail"].startswith("scenarios[3].deltas[0]:")
+
+    # 不明な設定の上書きは、シナリオの番号とともに拒否する
+    body["scenarios"][3] = {"settings": {"num_read": 5}}
+    response = client.post("/optimize/batch", json=body)
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith("scenarios[3].settings:")
+    assert "num_read" in response.json()["detail"]
+
+
+def test_batch_shared_instance():
+    # 重みだけが違うシナリオは、同じプロセスで評価済みのインスタンスを共有する
+    body = {
+        "state": _mixed_state().model_dump(),
+        "settings": {"num_reads": 10, "one_hot_relaxed_weight": 2000.0},
+        "scenarios": [
+            {"settings": {"load_balance_weight": weight}} for weight in (1.0, 5.0, 9.0)
+        ],
+    }
+    before = model_cache.stats().get("instance", {}).get("hits", 0)
+    response = client.post("/optimize/batch", json=body)
+    assert response.status_code == 200
+    assert all(r["error"] is None for r in response.json()["results"])
+    assert model_cache.stats()["instance"]["hits"] - before >= 2
+
+
+def test_batch_deadline_shutdown():
+    # deadline_ms のシナリオをワーカーで解いても、プールを閉じられる
+    settings = {
+        "engine": "qubo",
+        "num_reads": 10,
+        "deadline_ms": 3000,
+        "one_hot_relaxed_weight": 2000.0,
+    }
+    body = {
+        "state": _mixed_state().model_dump(),
+        "settings": settings,
+        "scenarios": [
+            {"name": "baseline"},
+            {"deltas": [{"op": "drain_node", "node_id": "node0"}]},
+        ],
+    }
+    response = client.post("/optimize/batch", json=body)
+    assert response.status_code == 200
+    assert all(r["error"] is None for r in response.json()["results"])
+
+    closing = threading.Thread(target=parallel.shutdown, kwargs={"wait": True})
+    closing.start()
+    closing.join(timeout=60)
+    assert not closing.is_alive()
+
+
+def test_capacity_repair():
+    # 移動コストだけを最小化すると、容量を超えたnode0に全Podが残る
+    nodes = [
+        Node(id=f"node{i}", cpu_capacity=1000, mem_capacity=4000) for i in range(3)
+    ]
+    pods = [
+        Pod(id=f"pod{i}", cpu_usage=100 + 50 * i, mem_usage=512, current_node="node0")
+        for i in range(8)
+    ]
+    state = ClusterState(nodes=nodes, pods=pods, services=[])
+    settings = {
+        "engine": "qubo",
+        "load_balance_weight": 0.0,
+        "move_cost_weight": 100.0,
+        "num_reads": 5,
+        "seed": 0,
+        "one_hot_relaxed_weight": 2000.0,
+    }
+    body = {"state": state.model_dump(), "settings": settings, "bypass_cache": True}
+    response = client.post("/optimize", json=body).json()
+
+    repair = response["repair"]
+    assert repair["overcommitted_nodes"] == ["node0"]
+    assert repair["unresolved_nodes"] == []
+    assert len(repair["moved_pods"]) > 0
+    load = {node.id: 0.0 for node in nodes}
+    for pod in response["pods"]:
+        load[pod["current_node"]] += pod["cpu_usage"]
+    assert all(load[node.id] <= node.cpu_capacity for node in nodes)
+
+    # 修復後のエネルギーは、修復後の配置に対する目的関数値と一致する
+    data, _, _ = _prepare_data(state, AnealingSettings(**settings))
+    model = build_qubo(data, 2000.0)
+    node_index = {node.id: n for n, node in enumerate(nodes)}
+    x = np.zeros((len(pods), len(nodes)), dtype=np.int8)
+    for p, pod in enumerate(response["pods"]):
+        x[p, node_index[pod["current_node"]]] = 1
+    energy = model.objective(x[model.var_pod, model.var_node])[0]
+    assert np.isclose(response["energy"], energy)
+
+    off = client.post(
+        "/optimize",
+        json={**body, "settings": {**settings, "repair_capacity": False}},
+    ).json()
+    assert off["repair"] is None
+
+
+def test_capacity_repair_rechecks_stuck_nodes():
+    # 先に移せなかったnode0のPodも、node1からPodを移して空いた後に移す
+    nodes = [
+        Node(id=f"node{i}", cpu_capacity=1000, mem_capacity=100000) for i in range(3)
+    ]
+    pods = [
+        Pod(id="a1", cpu_usage=600, mem_usage=100, current_node="node0"),
+        Pod(id="a2", cpu_usage=550, mem_usage=100, current_node="node0"),
+        Pod(id="b1", cpu_usage=700, mem_usage=100, current_node="node1"),
+        Pod(id="b2", cpu_usage=400, mem_usage=100, current_node="node1"),
+    ]
+    state = ClusterState(nodes=nodes, pods=pods, services=[])
+    data, _, _ = _prepare_data(state, AnealingSettings())
+    candidates = np.array([[1, 1, 0], [1, 1, 0], [0, 1, 1], [0, 1, 0]], dtype=bool)
+    target, moved, _, overcommitted, unresolved = repair_capacity(
+        data, candidates, np.array([0, 0, 1, 1])
+    )
+    assert overcommitted.tolist() == [0, 1]
+    assert unresolved.tolist() == []
+    assert target[2] == 2 and target[3] == 1
+    assert sorted(moved)[-1] == 2 and len(moved) == 2
+
+
+def test_adaptive_sampling():
+    state = _mixed_state()
+    settings = {
+        "engine": "qubo",
+        "num_reads": 200,
+        "seed": 0,
+        "one_hot_relaxed_weight": 2000.0,
+        "sampling": "adaptive",
+        "sampling_batch_reads": 5,
+        "sampling_patience": 2,
+    }
+    body = {"state": state.model_dump(), "settings": settings, "bypass_cache": True}
+    response = client.post("/optimize", json=body).json()
+    sampling = response["sampling"]
+    assert sampling["stopped"] == "patience"
+    assert sampling["num_reads"] < 200
+    curve = sampling["curve"]
+    assert [point["reads"] for point in curve] == list(
+        range(5, sampling["num_reads"] + 1, 5)
+    )
+    energies = [p["best_energy"] for p in curve if p["best_energy"] is not None]
+    assert energies == sorted(energies, reverse=True)
+    assert np.isclose(response["energy"], energies[-1])
+
+    # 時間の上限を過ぎたら、最初のバッチで打ち切る
+    budget = {**settings, "sampling_patience": 100, "sampling_budget_ms": 1}
+    response = client.post("/optimize", json={**body, "settings": budget}).json()
+    assert response["sampling"]["stopped"] == "budget"
+    assert response["sampling"]["num_reads"] == 5
+
+    fixed = {**settings, "sampling": "fixed", "num_reads": 20}
+    response = client.post("/optimize", json={**body, "settings": fixed}).json()
+    assert response["sampling"]["num_reads"] == 20
+    assert response["sampling"]["stopped"] == "num_reads"
+
+    # 打ち切りの判定ができない設定は拒否する
+    for invalid in (
+        {"sampling_batch_reads": 0},
+        {"sampling_patience": 0},
+        {"sampling_tolerance": -1.0},
+        {"sampling_budget_ms": 0},
+    ):
+        response = client.post(
+            "/optimize", json={**body, "settings": {**settings, **invalid}}
+        )
+        assert response.status_code == 422
+
+
+def test_autoscaling():
+    # 以前の実装と同じ目標レプリカ数と desire になる
+    state = make_autoscaling_cluster(30, 120, 5)
+    state.services[0].auto_scaling_enabled = False
+    check_plan(state)
+
+    nodes = [Node(id=f"node{i}", cpu_capacity=4, mem_capacity=8) for i in range(3)]
+    pods = [
+        Pod(id=f"{service}{i}", cpu_usage=0.5, mem_usage=1, service=service)
+        for service, count in (("web", 2), ("api", 5))
+        for i in range(count)
+    ]
+    for pod in pods:
+        pod.current_node = "node0" if pod.service == "web" else "node1"
+    pods.append(Pod(id="db", cpu_usage=1, mem_usage=2, current_node="node2"))
+    services = [
+        # 4レプリカ必要 -> 2つ追加
+        ServiceProfile(
+            id="web",
+            load_balancer_pod="web0",
+            auto_scaling_enabled=True,
+            current_request_rate=400,
+        ),
+        # 2レプリカで足りる -> 急激なスケールインを防ぐため、3つまで減らす
+        ServiceProfile(
+            id="api",
+            load_balancer_pod="api0",
+            auto_scaling_enabled=True,
+            current_request_rate=150,
+        ),
+    ]
+    state = ClusterState(nodes=nodes, pods=pods, services=services)
+    settings = AnealingSettings(desire_weight=50.0, one_hot_relaxed_weight=2000.0)
+
+    # 候補のPodを含めて、QUBOとjijmodelingのエネルギーが一致する
+    data, all_pods, _ = _prepare_data(state, settings)
+    assert len(all_pods) == len(pods) + 2
+    candidates = np.ones((len(all_pods), len(nodes)), dtype=np.int64)
+    instance = jm.Interpreter({**data, "candidates": candidates}).eval_problem(
+        _define_problem()
+    )
+    model = build_qubo(data, settings.one_hot_relaxed_weight)
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        x = np.zeros((len(all_pods), len(nodes)), dtype=np.int8)
+        for p, n in enumerate(rng.integers(-1, len(nodes), size=len(all_pods))):
+            if n >= 0:
+                x[p, n] = 1
+        values = {
+            v.id: int(x[tuple(v.subscripts)])
+            if v.name == "x"
+            else int(x[v.subscripts[0]].sum() == 0)
+            for v in instance.decision_variables
+        }
+        expected = instance.evaluate(values).objective
+        energy = model.objective(x[model.var_pod, model.var_node])[0]
+        assert np.isclose(energy, expected)
+
+    body = {
+        "state": state.model_dump(),
+        "settings": {**settings.model_dump(), "engine": "local_search"},
+        "bypass_cache": True,
+    }
+    response = client.post("/optimize", json=body).json()
+    actions = {a["pod_id"]: a["action"] for a in response["placements"]}
+    created = [pod_id for pod_id in actions if pod_id.startswith("web-")]
+    assert len(created) == 2
+    assert all(actions[pod_id] == "create" for pod_id in created)
+    assert actions["api3"] == actions["api4"] == "remove"
+    assert actions["db"] == "keep"
+
+    # 目標数と同じだけ稼働していれば、どのエンジンでもPodを削除しない
+    steady = ClusterState(
+        nodes=[
+            Node(id=f"node{i}", cpu_capacity=4000, mem_capacity=8000) for i in range(3)
+        ],
+        pods=[
+            Pod(
+                id=f"web{i}",
+                cpu_usage=500,
+                mem_usage=1000,
+                service="web",
+                current_node=f"node{i % 3}",
+            )
+            for i in range(4)
+        ],
+        services=services[:1],
+    )
+    for engine in ("jijmodeling", "qubo", "greedy", "local_search"):
+        response = client.post(
+            "/optimize",
+            json={
+                "state": steady.model_dump(),
+                "settings": {"engine": engine, "one_hot_relaxed_weight": 2000.0},
+                "bypass_cache": True,
+            },
+        ).json()
+        assert len(response["placements"]) == 4
+        assert all(a["action"] != "remove" for a in response["placements"]), engine
+
+    # auto_scaling_enabled でなければ、Podを追加も削除もしない
+    for service in body["state"]["services"]:
+        service["auto_scaling_enabled"] = False
+    response = client.post("/optimize", json=body).json()
+    assert len(response["placements"]) == len(pods)
+    assert all(a["action"] != "remove" for a in response["placements"])
+
+
+def test_ready():
+    assert client.get("/health").status_code == 200
+
+    # ライフスパンを実行しないTestClientでは、ウォームアップが始まっていない
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "starting"
+
+    # ウォームアップの求解はメトリクスに記録しない
+    samples = [
+        ("kytos_optimize_total", {"engine": engine, "status": "ok"})
+        for engine in WARMUP_ENGINES
+    ] + [("kytos_solver_stage_seconds_count", {"stage": "interpret"})]
+    before = [REGISTRY.get_sample_value(*sample) for sample in samples]
+    readiness.run()
+    assert [REGISTRY.get_sample_value(*sample) for sample in samples] == before
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.json()["warmup_seconds"] > 0
+
+    background = Readiness()
+    background.start()
+    assert background.wait(timeout=300)
+    assert background.info().status == "ready"
+    assert Readiness(enabled=False).info().status == "ready"
+
+
+def _read_events(text: str) -> list:
+    events = []
+    for block in text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        data = json.loads(data.removeprefix("data: "))
+        events.append((event.removeprefix("event: "), data))
+    return events
+
+
+def test_stream():
+    state = _mixed_state()
+    settings = {
+        "engine": "qubo",
+        "num_reads": 30,
+        "sampling_batch_reads": 5,
+        "seed": 0,
+        "one_hot_relaxed_weight": 2000.0,
+    }
+    body = {"state": state.model_dump(), "settings": settings}
+    response = client.post("/optimize/stream", json=body)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _read_events(response.text)
+
+    names = [event for event, _ in events]
+    assert names[-1] == "result" and set(names[:-1]) == {"progress"}
+    reads = [data["num_reads"] for _, data in events]
+    assert reads == sorted(reads) and reads[-1] == 30
+    energies = [data["energy"] for event, data in events if event == "progress"]
+    assert energies == sorted(energies, reverse=True)
+
+    # 最初の更新は全Pod、以降は変わったPodだけ。差分を順に適用すると最終的な配置になる
+    assert len(events[0][1]["placements"]) == len(state.pods)
+    plan = {}
+    for _, data in events:
+        for action in data["placements"]:
+            assert plan.get(action["pod_id"]) != action
+            plan[action["pod_id"]] = action
+    final = events[-1][1]
+    assert final["final"] and final["engine"] == "qubo"
+    assert final["sampling"]["num_reads"] == 30
+    assert set(plan) == {pod.id for pod in state.pods}
+    assert all(action["target_node_id"] for action in plan.values())
+
+    # deadline_ms を指定すると、貪欲法と局所探索の解も途中経過として送る
+    deadline = {**settings, "deadline_ms": 60000}
+    response = client.post("/optimize/stream", json={**body, "settings": deadline})
+    events = _read_events(response.text)
+    assert events[0][0] == "progress" and events[0][1]["num_reads"] is None
+
+    empty = {"state": {"nodes": [], "pods": [], "services": []}}
+    assert client.post("/optimize/stream", json=empty).status_code == 400
+
+
+def test_stream_disconnect():
+    # 切断すると、期限付きのSAの開始前やバッチの間で最適化を打ち切る
+    state = _mixed_state()
+    settings = AnealingSettings(
+        engine="qubo",
+        num_reads=1_000_000,
+        sampling_batch_reads=100,
+        deadline_ms=30000,
+        one_hot_relaxed_weight=2000.0,
+    )
+    # 起動済みのプールがあっても、ストリームのSAは現在のプロセスで途中経過を送る
+    parallel.run_parallel(abs, [(1,), (2,)])
+
+    async def consume() -> list:
+        stream = stream_placement(state.model_copy(deep=True), settings)
+        events = [await anext(stream) for _ in range(3)]
+        await stream.aclose()
+        return events
+
+    # 貪欲法、局所探索、SAの最初のバッチの途中経過
+    events = _read_events("".join(asyncio.run(consume())))
+    assert [data["num_reads"] for _, data in events] == [None, None, 100]
+
+    start = time.monotonic()
+    for thread in threading.enumerate():
+        if thread.name == "kytos-stream":
+            thread.join(timeout=20)
+            assert not thread.is_alive()
+    assert time.monotonic() - start < 20
+    parallel.shutdown(wait=True)
+
+
+def test_diff_view():
+    result_cache.clear()
+    state = _mixed_state()
+    # 移動コストを上げて、移動しないPodを残す
+    settings = AnealingSettings(engine="greedy", move_cost_weight=50.0)
+    body = {"state": state.model_dump(), "settings": settings.model_dump()}
+    full = client.post("/optimize", json=body).json()
+    assert full["summary"] == {"move": 4, "keep": 4, "create": 3, "remove": 0}
+
+    # 変更のあるPodのアクションだけを返し、full とはキャッシュを分ける
+    diff = client.post("/optimize?view=diff", json=body).json()
+    assert diff["cached"] is False
+    assert diff["pods"] == []
+    assert diff["placements"] == [
+        action for action in full["placements"] if action["action"] != "keep"
+    ]
+    assert diff["summary"] == full["summary"]
+    assert diff["energy"] == full["energy"]
+    assert client.post("/optimize?view=diff", json=body).json()["cached"] is True
+    assert client.post("/optimize?view=patch", json=body).status_code == 422
+
+    session_id = client.post(
+        "/sessions",
+        json={"state": state.model_dump(), "settings": settings.model_dump()},
+    ).json()["id"]
+    response = client.post(f"/sessions/{session_id}/optimize?view=diff", json={}).json()
+    assert response["placements"] == diff["placements"]
+    client.delete(f"/sessions/{session_id}")
+
+
+def test_evaluate():
+    state = _mixed_state()
+    settings = AnealingSettings(engine="local_search", one_hot_relaxed_weight=2000.0)
+    solved = solve_placement(state.model_copy(deep=True), settings)
+    assignment = {action.pod_id: action.target_node_id for action in solved.placements}
+    body = {
+        "state": state.model_dump(),
+        "settings": settings.model_dump(),
+        "assignment": assignment,
+    }
+
+    # ソルバーの結果を評価すると、同じエネルギーになる
+    response = client.post("/evaluate", json=body)
+    assert response.status_code == 200
+    result = response.json()
+    assert abs(result["energy"] - solved.energy) < 1e-6 * abs(solved.energy)
+    assert abs(sum(result["terms"].values()) - result["energy"]) < 1e-6
+    moves = [a for a in solved.placements if a.action == ActionType.MOVE]
+    assert result["moves"] == len(moves)
+    assert result["unplaced_pods"] == []
+    loads = {node["node_id"]: node["cpu_load"] for node in result["nodes"]}
+    for node in state.nodes:
+        expected = sum(
+            pod.cpu_usage for pod in state.pods if assignment[pod.id] == node.id
+        )
+        assert abs(loads[node.id] - expected) < 1e-6
+
+    # 含まれないPodは現在のまま (存在しないノード上のPodと新規Podは未配置)
+    current = client.post(
+        "/evaluate", json={**body, "assignment": {"pod0": "node1"}}
+    ).json()
+    assert current["unplaced_pods"] == [
+        pod.id
+        for pod in state.pods
+        if pod.id != "pod0" and pod.current_node in (None, "node9")
+    ]
+    assert current["moves"] == 0
+
+    # 容量を超えたノードと超過量
+    small = state.model_copy(deep=True)
+    small.nodes[0].cpu_capacity = 100
+    crowded = client.post(
+        "/evaluate",
+        json={**body, "state": small.model_dump(), "assignment": {"pod1": "node0"}},
+    ).json()
+    assert crowded["overcommitted_nodes"] == ["node0"]
+    node0 = crowded["nodes"][0]
+    assert abs(node0["cpu_overcommit"] - (node0["cpu_load"] - 100)) < 1e-6
+
+    unknown = {**body, "assignment": {"pod0": "node42"}}
+    assert client.post("/evaluate", json=unknown).status_code == 422
+    unknown = {**body, "assignment": {"pod42": "node0"}}
+    assert client.post("/evaluate", json=unknown).status_code == 422
+
+
+def test_migration_waves():
+    # 満杯のノード同士の入れ替えは、空きのあるノードを経由する
+    nodes = [
+        Node(id=f"node{i}", cpu_capacity=1000, mem_capacity=1000) for i in range(3)
+    ]
+    pods = [
+        Pod(id="a", cpu_usage=800, mem_usage=100, current_node="node0", service="x"),
+        Pod(id="b", cpu_usage=800, mem_usage=100, current_node="node1", service="y"),
+        Pod(id="x2", cpu_usage=100, mem_usage=100, current_node="node2", service="x"),
+        Pod(id="y2", cpu_usage=100, mem_usage=100, current_node="node2", service="y"),
+    ]
+    arrays = ClusterArrays.from_state(ClusterState(nodes=nodes, pods=pods, services=[]))
+    actions = [
+        Action(pod_id="a", target_node_id="node1", action=ActionType.MOVE),
+        Action(pod_id="b", target_node_id="node0", action=ActionType.MOVE),
+    ]
+    plan = schedule_waves(arrays, actions)
+    check_waves(arrays, actions, plan)
+    assert len(plan.waves) == 3 and len(plan.staged_pods) == 1
+    assert plan.overcommitted_nodes == [] and plan.unavailable_services == []
+
+    # 同じサービスのPodは、稼働中のレプリカを1つ残すように分ける
+    actions = [
+        Action(pod_id="x2", target_node_id="node1", action=ActionType.MOVE),
+        Action(pod_id="a", target_node_id="node2", action=ActionType.MOVE),
+    ]
+    plan = schedule_waves(arrays, actions)
+    check_waves(arrays, actions, plan)
+    assert [len(wave) for wave in plan.waves] == [1, 1]
+
+    # レプリカが1つのサービスは停止を避けられない
+    pods[2].service = "z"
+    arrays = ClusterArrays.from_state(ClusterState(nodes=nodes, pods=pods, services=[]))
+    actions = [Action(pod_id="x2", target_node_id="node1", action=ActionType.MOVE)]
+    plan = schedule_waves(arrays, actions)
+    assert plan.unavailable_services == ["z"]
+
+    # /optimize の結果を、1つずつより少ないウェーブで実行できる
+    state = make_rebalance_cluster(300, 12, 30)
+    settings = AnealingSettings(
+        engine="greedy", one_hot_relaxed_weight=2000.0, migration_waves=True
+    )
+    result = client.post(
+        "/optimize",
+        json={"state": state.model_dump(), "settings": settings.model_dump()},
+    ).json()
+    response = OptimizationResponse.model_validate(result)
+    check_waves(
+        ClusterArrays.from_state(state), response.placements, response.migration
+    )
+    assert sum(len(wave) for wave in response.migration.waves) == (
+        len(state.pods) - response.summary["keep"]
+    )
+    assert len(response.migration.waves) < len(state.pods) // 10
+
+
+def test_recorder():
+    result_cache.clear()
+    state = _mixed_state()
+    settings = AnealingSettings(engine="greedy")
+    body = {"state": state.model_dump(), "settings": settings.model_dump()}
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "optimize.jsonl.gz")
+        recorder.path = Path(path)
+        try:
+            first = client.post("/optimize", json=body).json()
+            client.post("/optimize", json=body)  # キャッシュから返す
+            recorder.flush()
+        finally:
+            recorder.path = None
+
+        records = list(read_records(path))
+        assert [r["response"]["cached"] for r in records] == [False, True]
+        # 最適化で書き換えられる前のリクエストを記録する
+        assert records[0]["request"]["state"] == state.model_dump()
+        assert records[0]["response"]["placements"] == first["placements"]
+        assert "pods" not in records[0]["response"]
+        assert "decode" in records[0]["timings"] and records[0]["seconds"] > 0
+
+        # キャッシュから返した記録は再実行しない
+        loaded = load_records(path)
+        assert len(loaded) == 1
+        summary = summarize(loaded, [_replay_one(r["request"]) for r in loaded])
+        assert summary["errors"] == 0 and summary["energy"]["same"] == 1
+
+        # 上限を超えたら古いファイルに移し、keep 個より古いものは削除する
+        rotating = Recorder(path, max_bytes=1, keep=2)
+        response = OptimizationResponse.model_validate(first)
+        for _ in range(3):
+            rotating.record(json.dumps(body), response, 0.1)
+        rotating.flush()
+        files = log_files(path)
+        assert [f.name for f in files] == [
+            "optimize.jsonl.gz.2",
+            "optimize.jsonl.gz.1",
+            "optimize.jsonl.gz",
+        ]
+        assert [len(list(read_records(f))) for f in files] == [1, 1, 1]
+
+        # 書きかけで切れた最後の記録は読み飛ばす
+        data = Path(path).read_bytes()
+        Path(path).write_bytes(data + data[: len(data) // 2])
+        assert len(list(read_records(path))) == 1
+
+        # 途中の壊れた・切れた記録は読み飛ばし、次の記録から読み続ける
+        half = len(data) // 2
+        corrupted = data[:half] + bytes(b ^ 0xFF for b in data[half : half + 8])
+        for middle in (corrupted + data[half + 8 :], data[:half]):
+            Path(path).write_bytes(data + middle + data)
+            for chunk_size in (2**16, 7):
+                reader = RecordReader(path, chunk_size=chunk_size)
+                assert len(list(reader)) == 2
+                assert reader.skipped == 1
+
+
 if __name__ == "__main__":
     test_health()
     test_rebalance()
     test_recovery()
+    test_model_cache()
+    test_prepare_data_matches_loop()
+    test_qubo_energy_matches_jijmodeling()
+    test_optimize_qubo_engine()
+    test_candidate_pruning()
+    test_warm_start()
+    test_jobs()
+    test_jobs_backpressure()
+    test_jobs_broken_pool()
+    test_jobs_cancel_running()
+    test_parallel_sampling()
+    test_sessions()
+    test_engines()
+    test_deadline_stops_sampling()
+    test_decode_result_matches_loop()
+    test_metrics()
+    test_result_cache()
+    test_columnar()
+    test_columnar_autoscaling()
+    test_batch()
+    test_batch_shared_instance()
+    test_batch_deadline_shutdown()
+    test_capacity_repair()
+    test_capacity_repair_rechecks_stuck_nodes()
+    test_adaptive_sampling()
+    test_autoscaling()
+    test_ready()
+    test_stream()
+    test_stream_disconnect()
+    test_diff_view()
+    test_evaluate()
+    test_migration_waves()
+    test_recorder()